@@ -0,0 +1,304 @@
+"""
+Нагрузочный тест бота без Telegram: синтетические Update подаются прямо
+в Dispatcher, LLM и отправка сообщений заменены заглушками с задержками.
+
+    python -m bench.load_test --stages 1,2,4,8,16,32,64 --stage-seconds 10 --llm-capacity 16
+
+Каждая ступень держит заданное число одновременных пользователей
+(пользователь ждет ответ, делает паузу и задает следующий вопрос).
+Задержка в очереди: queue_delay — от поступления апдейта до middleware,
+llm_queue_delay — ожидание свободного слота upstream LLM.
+Точка насыщения — первая ступень, где пропускная способность почти не растет
+или p95 задержки выходит за SLO.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage, TelegramMethod
+
+import config
+from bench.rag_bench import BENCH_DIR, QUESTIONS_PATH, load_questions, percentiles
+from src import bot as bot_module
+
+
+logger = config.logging.getLogger(__name__)
+
+
+class Latency:
+    """
+    Логнормальная задержка: median — медиана, сек, sigma — разброс (0 — константа)
+    """
+
+    def __init__(self, median: float, sigma: float = 0.0, seed: int | None = None):
+        self.median = median
+        self.sigma = sigma
+        self.random = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median
+        return self.random.lognormvariate(0.0, self.sigma) * self.median
+
+
+class StubLLMClient:
+    """
+    Заглушка LLMClient.
+    capacity: сколько запросов upstream обрабатывает одновременно, остальные ждут
+    """
+
+    def __init__(self, latency: Latency, capacity: int = 0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.semaphore = asyncio.Semaphore(capacity) if capacity > 0 else None
+        self.random = random.Random(0)
+        self.wait_times: list[float] = []
+
+    async def _answer(self, user_question: str) -> str:
+        await asyncio.sleep(self.latency.sample())
+        if self.random.random() < self.error_rate:
+            raise RuntimeError("stub LLM failure")
+        return f"Ответ на вопрос: {user_question}"
+
+    async def generate_answer(self, user_question: str, **kwargs: Any) -> str:
+        if self.semaphore is None:
+            return await self._answer(user_question)
+        start = time.perf_counter()
+        async with self.semaphore:
+            self.wait_times.append(time.perf_counter() - start)
+            return await self._answer(user_question)
+
+
+class StubSession(BaseSession):
+    """
+    Сессия Bot API без сети.
+    flood_rate: доля запросов, на которые отвечаем 429 (TelegramRetryAfter)
+    error_rate: доля сетевых ошибок
+    """
+
+    def __init__(
+        self,
+        latency: Latency,
+        error_rate: float = 0.0,
+        flood_rate: float = 0.0,
+        retry_after: int = 1
+    ):
+        super().__init__()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(1)
+        self.message_ids = itertools.count(1)
+        self.sent: list[TelegramMethod[Any]] = []
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[Any],
+        timeout: int | None = None
+    ) -> Any:
+        await asyncio.sleep(self.latency.sample())
+        roll = self.random.random()
+        if roll < self.flood_rate:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_after)
+        if roll < self.flood_rate + self.error_rate:
+            raise TelegramNetworkError(method=method, message="stub network error")
+
+        self.sent.append(method)
+        if isinstance(method, SendMessage):
+            return types.Message(
+                message_id=next(self.message_ids),
+                date=datetime.now(),
+                chat=types.Chat(id=method.chat_id, type="private"),
+                text=method.text
+            )
+        return True
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, *args: Any, **kwargs: Any) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+
+class LoadTest:
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        llm_client: StubLLMClient,
+        questions: list[str],
+        think_time: Latency
+    ):
+        self.dp = dp
+        self.llm_client = llm_client
+        self.bot = bot
+        self.questions = questions
+        self.think_time = think_time
+        self.update_ids = itertools.count(1)
+        self.arrivals: dict[int, float] = {}
+        self.queue_delays: list[float] = []
+        self.dp.update.outer_middleware(self.queue_delay_middleware)
+
+    async def queue_delay_middleware(self, handler, event: types.Update, data: dict[str, Any]) -> Any:
+        arrival = self.arrivals.pop(event.update_id, None)
+        if arrival is not None:
+            self.queue_delays.append(time.perf_counter() - arrival)
+        return await handler(event, data)
+
+    def make_update(self, user_id: int, text: str) -> types.Update:
+        update_id = next(self.update_ids)
+        raw = {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": text,
+            },
+        }
+        # Как при polling: апдейт сразу привязан к боту, чтобы работали message.answer
+        return types.Update.model_validate(raw, context={"bot": self.bot})
+
+    async def run_stage(self, users: int, seconds: float) -> dict[str, Any]:
+        self.queue_delays = []
+        self.llm_client.wait_times = []
+        latencies: list[float] = []
+        errors = 0
+        deadline = time.perf_counter() + seconds
+
+        async def user_loop(user_id: int) -> None:
+            nonlocal errors
+            rnd = random.Random(user_id)
+            while time.perf_counter() < deadline:
+                update = self.make_update(user_id, rnd.choice(self.questions))
+                start = self.arrivals[update.update_id] = time.perf_counter()
+                # Как при polling: каждый апдейт обрабатывается своей задачей
+                task = asyncio.create_task(self.dp.feed_update(self.bot, update))
+                try:
+                    await task
+                    latencies.append(time.perf_counter() - start)
+                except Exception:
+                    errors += 1
+                await asyncio.sleep(self.think_time.sample())
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user_loop(user_id) for user_id in range(1, users + 1)))
+        elapsed = time.perf_counter() - start
+
+        total = len(latencies) + errors
+        return {
+            "users": users,
+            "requests": total,
+            "throughput": round(len(latencies) / elapsed, 2),
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "latency": percentiles(latencies),
+            "queue_delay": percentiles(self.queue_delays),
+            "llm_queue_delay": percentiles(self.llm_client.wait_times),
+        }
+
+
+def find_saturation(stages: list[dict[str, Any]], slo_p95: float, min_gain: float = 0.1) -> int | None:
+    """
+    Возвращает число пользователей на ступени насыщения: пропускная способность
+    выросла меньше чем на min_gain относительно прошлой ступени или p95 > slo_p95
+    """
+    for prev, stage in zip([None] + stages[:-1], stages):
+        p95 = stage["latency"].get("p95", 0.0)
+        if p95 > slo_p95:
+            return stage["users"]
+        if prev is not None and stage["throughput"] < prev["throughput"] * (1 + min_gain):
+            return stage["users"]
+    return None
+
+
+async def run(
+    stages: list[int],
+    stage_seconds: float = 10.0,
+    llm_latency: Latency | None = None,
+    llm_capacity: int = 0,
+    llm_error_rate: float = 0.0,
+    send_latency: Latency | None = None,
+    send_error_rate: float = 0.0,
+    flood_rate: float = 0.0,
+    think_time: Latency | None = None,
+    slo_p95: float = 5.0,
+    questions_path: Path = QUESTIONS_PATH,
+    out_path: Path | None = None
+) -> dict[str, Any]:
+    # aiogram пишет строку на каждый апдейт — под нагрузкой это шум
+    config.logging.getLogger("aiogram.event").setLevel(config.logging.WARNING)
+    questions = [item["question"] for item in load_questions(questions_path)]
+    llm_client = StubLLMClient(llm_latency or Latency(1.0, 0.5, seed=0), llm_capacity, llm_error_rate)
+    session = StubSession(send_latency or Latency(0.05, 0.3, seed=1), send_error_rate, flood_rate)
+    bot = Bot(token="42:LOADTEST", session=session)
+    dp = bot_module.create_dispatcher(llm_client)
+    load_test = LoadTest(dp, bot, llm_client, questions, think_time or Latency(0.5, 0.5, seed=2))
+
+    results = []
+    for users in stages:
+        stage = await load_test.run_stage(users, stage_seconds)
+        logger.info(f"load: {stage}")
+        results.append(stage)
+
+    report = {
+        "config": {
+            "stages": stages,
+            "stage_seconds": stage_seconds,
+            "llm_capacity": llm_capacity,
+            "slo_p95": slo_p95,
+        },
+        "stages": results,
+        "saturation_users": find_saturation(results, slo_p95),
+        "telegram_requests": len(session.sent),
+    }
+
+    out_path = out_path or BENCH_DIR / f"load_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, ensure_ascii=False, indent=4), encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Нагрузочный тест Telegram бота")
+    arg_parser.add_argument("--stages", default="1,2,4,8,16,32,64", help="пользователи на ступенях")
+    arg_parser.add_argument("--stage-seconds", type=float, default=10.0)
+    arg_parser.add_argument("--llm-median", type=float, default=1.0)
+    arg_parser.add_argument("--llm-sigma", type=float, default=0.5)
+    arg_parser.add_argument("--llm-capacity", type=int, default=16, help="0 — без ограничения")
+    arg_parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--send-median", type=float, default=0.05)
+    arg_parser.add_argument("--send-sigma", type=float, default=0.3)
+    arg_parser.add_argument("--send-error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--flood-rate", type=float, default=0.0)
+    arg_parser.add_argument("--think-median", type=float, default=0.5)
+    arg_parser.add_argument("--slo-p95", type=float, default=5.0)
+    arg_parser.add_argument("--out", type=Path, default=None)
+    args = arg_parser.parse_args()
+    report = asyncio.run(run(
+        [int(users) for users in args.stages.split(",")],
+        stage_seconds=args.stage_seconds,
+        llm_latency=Latency(args.llm_median, args.llm_sigma, seed=0),
+        llm_capacity=args.llm_capacity,
+        llm_error_rate=args.llm_error_rate,
+        send_latency=Latency(args.send_median, args.send_sigma, seed=1),
+        send_error_rate=args.send_error_rate,
+        flood_rate=args.flood_rate,
+        think_time=Latency(args.think_median, 0.5, seed=2),
+        slo_p95=args.slo_p95,
+        out_path=args.out
+    ))
+    print(json.dumps(report, ensure_ascii=False, indent=4))
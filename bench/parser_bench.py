@@ -0,0 +1,161 @@
+"""
+Бенчмарк извлечения текста со страниц Tilda: потоковый TildaExtractor
+против эталона на BeautifulSoup. Страницы генерируются по разметке Tilda
+(t-records, tn-elem, tn-atom, скрипты и стили внутри записей) или
+берутся из сохраненных HTML.
+
+    python -m bench.parser_bench --pages 20 --records 400
+    python -m bench.parser_bench --html-dir data/html
+
+Результаты обоих движков сверяются, расхождения попадают в отчет.
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import config
+from src import parser
+
+
+logger = config.logging.getLogger(__name__)
+
+
+BENCH_DIR = config.DATA_DIR / "bench"
+
+WORDS = (
+    "EORA", "бот", "нейросеть", "клиент", "проект", "данные", "модель", "розница",
+    "голосовой", "ассистент", "распознавание", "товаров", "Магнит", "X5", "Dodo",
+    "аналитика", "колл-центр", "интеграция", "&nbsp;", "&laquo;кейс&raquo;", "&mdash;",
+    "100&nbsp;000", "&amp;", "2024",
+)
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _text_elem(rng: random.Random, elem_id: int, text: str) -> str:
+    return (
+        f'<div class="t396__elem tn-elem tn-elem__{elem_id}" data-elem-id="{elem_id}" '
+        f'data-elem-type="text" data-field-top-value="{rng.randint(0, 900)}">'
+        f'<div class="tn-atom" field="tn_text_{elem_id}">{text}</div></div>'
+    )
+
+
+def _record(rng: random.Random, record_id: int) -> str:
+    elems = []
+    for i in range(rng.randint(2, 6)):
+        elem_id = record_id * 100 + i
+        kind = rng.random()
+        if kind < 0.55:
+            parts = [_sentence(rng, rng.randint(4, 25)) for _ in range(rng.randint(1, 4))]
+            if rng.random() < 0.3:
+                parts[0] = f"<strong>{parts[0]}</strong>"
+            text = "<br>".join(parts) if rng.random() < 0.5 else "<br /><br />".join(parts)
+            elems.append(_text_elem(rng, elem_id, text))
+        elif kind < 0.75:
+            elems.append(
+                f'<div class="t396__elem tn-elem" data-elem-id="{elem_id}" data-elem-type="image">'
+                f'<div class="tn-atom"><img class="tn-atom__img" src="https://static.tildacdn.com/{elem_id}.png" '
+                f'alt="{_sentence(rng, 3)}" imgfield="tn_img_{elem_id}"></div></div>'
+            )
+        elif kind < 0.9:
+            elems.append(
+                f'<div class="t396__elem tn-elem" data-elem-id="{elem_id}" data-elem-type="button">'
+                f'<a class="tn-atom" href="#popup:{elem_id}">{_sentence(rng, 2)}</a></div>'
+            )
+        else:
+            # Текстовый элемент без .tn-atom и с комментарием внутри
+            elems.append(
+                f'<div class="tn-elem" data-elem-type="text"><!-- {elem_id} -->'
+                f'<span>{_sentence(rng, 6)}</span> {_sentence(rng, 4)}</div>'
+            )
+    return (
+        f'<div id="rec{record_id}" class="r t-rec" data-record-type="396">'
+        f'<!-- T396 --><style>#rec{record_id} .t396__artboard {{height: {rng.randint(300, 900)}px;}}</style>'
+        f'<div class="t396"><div class="t396__artboard" data-artboard-recid="{record_id}">'
+        + "".join(elems) +
+        f'</div></div><script>t_onReady(function () {{ t396_init("{record_id}"); }});</script></div>'
+    )
+
+
+def make_tilda_page(records: int = 200, seed: int = 0) -> str:
+    """Синтетическая страница Tilda: шапка с h1, records записей T396 и подвал"""
+    rng = random.Random(seed)
+    body = [_record(rng, 1000 + i) for i in range(records)]
+    h1_at = min(2, records)
+    body.insert(h1_at, (
+        '<div id="rec999" class="r t-rec"><div class="t396"><div class="tn-elem" data-elem-type="text">'
+        f'<h1 class="tn-atom" field="tn_text_999">{_sentence(rng, 5)}</h1></div></div></div>'
+    ))
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8" />'
+        '<title>EORA</title><script src="https://static.tildacdn.com/js/tilda-scripts.min.js"></script>'
+        '<style>.t-rec{position:relative}</style></head><body class="t-body">'
+        '<div id="allrecords" class="t-records" data-tilda-project-id="1">'
+        '<header id="t-header" class="t-records"><div class="t228"><h1>EORA</h1>'
+        '<a href="/">Главная</a></div></header>'
+        + "".join(body) +
+        '<div class="tn-elem" data-elem-type="text"><div class="tn-atom">'
+        'Нажимая на кнопку, вы соглашаетесь с нашей Политикой конфиденциальности</div></div>'
+        '<div class="tn-elem" data-elem-type="text"><div class="tn-atom">Напишите нам</div></div>'
+        '<footer id="t-footer" class="t-records"><div class="tn-elem" data-elem-type="text">'
+        '<div class="tn-atom">© 2024 EORA</div></div></footer>'
+        '</div><script>t_onFuncLoad("t_records_init");</script></body></html>'
+    )
+
+
+def measure(extract: Callable[[str], list[str]], pages: list[str], repeat: int) -> dict[str, Any]:
+    total_bytes = sum(len(page.encode("utf-8")) for page in pages) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            extract(page)
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(pages) * repeat / elapsed, 2),
+        "mb_per_sec": round(total_bytes / elapsed / 2 ** 20, 2),
+    }
+
+
+def run(pages: list[str], repeat: int = 1) -> dict[str, Any]:
+    mismatches = [
+        i for i, page in enumerate(pages)
+        if parser.extract_tilda_blocks(page) != parser.extract_tilda_blocks_soup(page)
+    ]
+    fast = measure(parser.extract_tilda_blocks, pages, repeat)
+    soup = measure(parser.extract_tilda_blocks_soup, pages, repeat)
+    return {
+        "pages": len(pages),
+        "avg_page_kb": round(sum(len(page.encode("utf-8")) for page in pages) / len(pages) / 1024, 1),
+        "fast": fast,
+        "soup": soup,
+        "speedup": round(soup["seconds"] / fast["seconds"], 2) if fast["seconds"] else 0.0,
+        "mismatches": mismatches,
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк извлечения текста Tilda")
+    arg_parser.add_argument("--pages", type=int, default=20)
+    arg_parser.add_argument("--records", type=int, default=400, help="записей T396 на странице")
+    arg_parser.add_argument("--html-dir", type=Path, default=None, help="сохраненные страницы *.html")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--out", type=Path, default=None)
+    args = arg_parser.parse_args()
+
+    if args.html_dir is not None:
+        html_pages = [path.read_text(encoding="utf-8") for path in sorted(args.html_dir.glob("*.html"))]
+    else:
+        html_pages = [make_tilda_page(args.records, seed) for seed in range(args.pages)]
+    report = run(html_pages, args.repeat)
+
+    out_path = args.out or BENCH_DIR / f"parser_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, ensure_ascii=False, indent=4), encoding="utf-8")
+    logger.info(f"bench: результаты сохранены в {out_path}")
+    print(json.dumps(report, ensure_ascii=False, indent=4))
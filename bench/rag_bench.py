@@ -0,0 +1,231 @@
+"""
+Офлайн бенчмарк RAG: прогоняет размеченные вопросы через LLMClient.find_context
+(тот же поиск, что у бота: MMR_LAMBDA, PER_URL_CAP, порог) и
+LLMClient.generate_answer (LLM — локальная заглушка или LLM_URL).
+
+    python -m bench.rag_bench --questions bench/questions.jsonl --top-k 5 --concurrency 4
+    python -m bench.rag_bench --mmr-lambda 0.5 --per-url-cap 2
+    python -m bench.rag_bench --raw-retrieval   # индекс без MMR и порога, rag.retrieve_batch
+
+Формат вопросов (JSONL): {"question": "...", "urls": ["https://eora.ru/cases/..."]}
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from openai import OpenAI
+
+import config
+from bench.stub_llm import StubLLM
+from src import bundle, llm, metrics, rag
+
+
+logger = config.logging.getLogger(__name__)
+
+
+BENCH_DIR = config.DATA_DIR / "bench"
+QUESTIONS_PATH = Path(__file__).resolve().parent / "questions.jsonl"
+
+
+def load_questions(path: Path) -> list[dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+        "mean": round(float(np.mean(values)), 4),
+    }
+
+
+def recall_at_k(found: list[str], expected: list[str], k: int) -> float:
+    """Доля размеченных ссылок, попавших в первые k результатов"""
+    if not expected:
+        return 0.0
+    return len(set(found[:k]) & set(expected)) / len(set(expected))
+
+
+def reciprocal_rank(found: list[str], expected: list[str]) -> float:
+    for rank, url in enumerate(found, start=1):
+        if url in expected:
+            return 1.0 / rank
+    return 0.0
+
+
+def stage_report(timings: list[dict[str, float]]) -> dict[str, dict[str, float]]:
+    stages = sorted({stage for item in timings for stage in item})
+    return {
+        stage: percentiles([item[stage] for item in timings if stage in item])
+        for stage in stages
+    }
+
+
+async def evaluate_retrieval(
+    client: llm.LLMClient,
+    questions: list[dict[str, Any]],
+    top_k: int,
+    raw: bool = False
+) -> dict[str, float]:
+    """
+    По умолчанию поиск как у бота (find_context с настройками из config).
+    raw: только индекс — rag.retrieve_batch без MMR, PER_URL_CAP и порога
+    """
+    recalls, ranks = [], []
+    if raw:
+        batch_results = await rag.retrieve_batch(
+            client.index,
+            client.content,
+            [item["question"] for item in questions],
+            top_k=top_k,
+            min_score=None,
+            embeddings=client.embeddings
+        )
+    else:
+        batch_results = [await client.find_context(item["question"], top_k=top_k) for item in questions]
+    for item, results in zip(questions, batch_results):
+        found = [result["url"] for result in results]
+        recalls.append(recall_at_k(found, item["urls"], top_k))
+        ranks.append(reciprocal_rank(found, item["urls"]))
+    return {
+        f"recall@{top_k}": round(float(np.mean(recalls)), 4) if recalls else 0.0,
+        "mrr": round(float(np.mean(ranks)), 4) if ranks else 0.0,
+    }
+
+
+async def evaluate_answers(
+    client: llm.LLMClient,
+    questions: list[dict[str, Any]],
+    concurrency: int
+) -> dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    timings: list[dict[str, float]] = []
+    errors = 0
+
+    async def answer_one(question: str) -> None:
+        nonlocal errors
+        async with semaphore:
+            with metrics.request_timings() as request_timings, metrics.span("total"):
+                try:
+                    await client.generate_answer(question)
+                except Exception as e:
+                    errors += 1
+                    logger.info(f"bench error: {e!r}")
+            timings.append(request_timings)
+
+    tokens_before = metrics.LLM_TOKENS.get(kind="completion")
+    start = time.perf_counter()
+    await asyncio.gather(*(answer_one(item["question"]) for item in questions))
+    elapsed = time.perf_counter() - start
+    completion_tokens = metrics.LLM_TOKENS.get(kind="completion") - tokens_before
+
+    answered = len(questions) - errors
+    return {
+        "requests": len(questions),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "qps": round(len(questions) / elapsed, 2) if elapsed else 0.0,
+        "tokens_per_answer": round(completion_tokens / answered, 2) if answered else 0.0,
+        "stages": stage_report(timings),
+    }
+
+
+async def run(
+    questions_path: Path = QUESTIONS_PATH,
+    out_path: Path | None = None,
+    top_k: int = 5,
+    concurrency: int = 1,
+    repeat: int = 1,
+    index_type: str | None = None,
+    llm_url: str | None = None,
+    llm_latency: float = 0.3,
+    llm_jitter: float = 0.2,
+    raw_retrieval: bool = False
+) -> dict[str, Any]:
+    # Без метрик span-ы не замеряют стадии
+    config.metrics_enabled = True
+    questions = load_questions(questions_path)
+
+    stub = None
+    if llm_url is None:
+        stub = StubLLM(latency=llm_latency, jitter=llm_jitter, seed=0)
+        llm_url = stub.start_in_thread()
+
+    try:
+        client = llm.LLMClient(bundle.current())
+        client.client = OpenAI(api_key=config.llm_token or "bench", base_url=llm_url)
+        # С LLM_BACKENDS запросы иначе ушли бы в роутер мимо llm_url
+        client.router = None
+        await client.init()
+        if index_type is not None:
+            embs = await rag.to_embeddings([it["text"] for it in client.content])
+            client.index = rag.make_index(embs, index_type)
+            client.embeddings = None if index_type == "flat" else embs
+
+        result = {
+            "config": {
+                "questions": str(questions_path),
+                "top_k": top_k,
+                "concurrency": concurrency,
+                "repeat": repeat,
+                "index_type": index_type or config.index_type,
+                "retrieval": "raw" if raw_retrieval else "find_context",
+                "mmr_lambda": config.mmr_lambda,
+                "per_url_cap": config.per_url_cap,
+                "llm_url": llm_url if stub is None else "stub",
+            },
+            "retrieval": await evaluate_retrieval(client, questions, top_k, raw_retrieval),
+            "answers": await evaluate_answers(client, questions * repeat, concurrency),
+        }
+    finally:
+        if stub is not None:
+            stub.stop_thread()
+
+    out_path = out_path or BENCH_DIR / f"rag_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(result, ensure_ascii=False, indent=4), encoding="utf-8")
+    logger.info(f"bench: результаты сохранены в {out_path}")
+    return result
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк RAG пайплайна")
+    arg_parser.add_argument("--questions", type=Path, default=QUESTIONS_PATH)
+    arg_parser.add_argument("--out", type=Path, default=None)
+    arg_parser.add_argument("--top-k", type=int, default=5)
+    arg_parser.add_argument("--concurrency", type=int, default=1)
+    arg_parser.add_argument("--repeat", type=int, default=1)
+    arg_parser.add_argument("--index-type", choices=rag.INDEX_TYPES, default=None)
+    arg_parser.add_argument("--llm-url", default=None, help="по умолчанию — локальная заглушка")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.3)
+    arg_parser.add_argument("--llm-jitter", type=float, default=0.2)
+    arg_parser.add_argument("--mmr-lambda", type=float, default=None, help="вместо MMR_LAMBDA, 0 — без MMR")
+    arg_parser.add_argument("--per-url-cap", type=int, default=None, help="вместо PER_URL_CAP, 0 — без ограничения")
+    arg_parser.add_argument("--raw-retrieval", action="store_true", help="recall/MRR голого индекса без MMR и порога")
+    args = arg_parser.parse_args()
+    if args.mmr_lambda is not None:
+        config.mmr_lambda = args.mmr_lambda or None
+    if args.per_url_cap is not None:
+        config.per_url_cap = args.per_url_cap or None
+    report = asyncio.run(run(
+        args.questions,
+        args.out,
+        top_k=args.top_k,
+        concurrency=args.concurrency,
+        repeat=args.repeat,
+        index_type=args.index_type,
+        llm_url=args.llm_url,
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        raw_retrieval=args.raw_retrieval
+    ))
+    print(json.dumps(report, ensure_ascii=False, indent=4))
@@ -0,0 +1,155 @@
+"""
+Локальный OpenAI-совместимый сервер для бенчмарков, нагрузочных тестов и тестов.
+Отвечает JSON в формате base_prompt, ссылаясь на источники из сообщений.
+
+    python -m bench.stub_llm --port 8001 --latency 0.5 --jitter 0.3
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from typing import Any
+
+from aiohttp import web
+
+
+SOURCE_RE = re.compile(r"^Контент из источника (\S+):", re.M)
+
+
+class StubLLM:
+    """
+    latency: базовая задержка ответа, сек
+    jitter: случайная добавка к задержке, равномерно от 0 до jitter
+    error_rate: доля ответов с кодом 500
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int | None = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.runner: web.AppRunner | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def build_answer(self, messages: list[dict[str, str]]) -> str:
+        urls = []
+        for message in messages:
+            urls.extend(SOURCE_RE.findall(message.get("content", "")))
+        urls = list(dict.fromkeys(urls))
+        refs = " ".join(f"[{num}]" for num in range(1, len(urls) + 1))
+        return json.dumps({
+            "content": f"Ответ заглушки {refs}".strip(),
+            "urls": [{str(num): url} for num, url in enumerate(urls, start=1)]
+        }, ensure_ascii=False)
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        body: dict[str, Any] = await request.json()
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+        if self.random.random() < self.error_rate:
+            return web.json_response(
+                {"error": {"message": "stub failure", "type": "server_error"}},
+                status=500
+            )
+
+        content = self.build_answer(body.get("messages", []))
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+        completion_tokens = len(content.split())
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if body.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for piece in re.findall(r"\S+\s*", content):
+                chunk = {
+                    "id": f"stub-{self.requests}",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            return response
+
+        return web.json_response({
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер и возвращает base_url для OpenAI клиента"""
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        app.router.add_post("/chat/completions", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_host, bound_port = self.runner.addresses[0][:2]
+        return f"http://{bound_host}:{bound_port}/v1"
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Запускает сервер в отдельном потоке со своим event loop:
+        синхронный клиент, блокирующий event loop вызывающего, не мешает ответу
+        """
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(self.start(host, port), self.loop).result()
+
+    def stop_thread(self) -> None:
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop = None
+
+
+async def serve(args: argparse.Namespace) -> None:
+    stub = StubLLM(args.latency, args.jitter, args.error_rate)
+    base_url = await stub.start(args.host, args.port)
+    print(f"stub LLM: {base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Заглушка OpenAI-совместимого LLM")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8001)
+    arg_parser.add_argument("--latency", type=float, default=0.3)
+    arg_parser.add_argument("--jitter", type=float, default=0.2)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    asyncio.run(serve(arg_parser.parse_args()))
@@ -1,6 +1,13 @@
+import atexit
+import copy
+import json
 import os
 import logging
+import logging.handlers
+import queue
+import random
 import sys
+from contextvars import ContextVar
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -10,28 +17,148 @@ load_dotenv()
 tg_token = os.getenv('TG_TOKEN')
 llm_token = os.getenv('LLM_TOKEN')
 llm_url = os.getenv('LLM_URL')
+llm_model = os.getenv('LLM_MODEL', 'deepseek-chat')
+# Несколько OpenAI-совместимых backend-ов (JSON), hedged-запросы и circuit breaker
+llm_backends = os.getenv('LLM_BACKENDS')
+llm_hedge = os.getenv('LLM_HEDGE', '1') == '1'
+llm_hedge_delay = float(os.getenv('LLM_HEDGE_DELAY', '2.0'))
+llm_failure_threshold = int(os.getenv('LLM_FAILURE_THRESHOLD', '3'))
+llm_breaker_cooldown = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+llm_max_error_rate = float(os.getenv('LLM_MAX_ERROR_RATE', '0.5'))
+# Хранение векторов в FAISS: flat, fp16, sq8, pq
+index_type = os.getenv('INDEX_TYPE', 'flat')
+# Разнообразие контекста: вес релевантности в MMR и лимит документов с одного URL (0 — выключено)
+mmr_lambda = float(os.getenv('MMR_LAMBDA', '0.7')) or None
+per_url_cap = int(os.getenv('PER_URL_CAP', '1')) or None
+# Метрики Prometheus: 0 — полностью отключены (span-ы не замеряют время)
+metrics_enabled = os.getenv('METRICS_ENABLED', '1') == '1'
+metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+metrics_port = int(os.getenv('METRICS_PORT', '9100'))
+# Профилирование: доля сэмплируемых запросов (0 — выключено), интервал сэмплов, порог блокировки loop (0 — выключен)
+profile_rate = float(os.getenv('PROFILE_RATE', '0'))
+profile_interval = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+profile_dump_interval = float(os.getenv('PROFILE_DUMP_INTERVAL', '300'))
+profile_max_stacks = int(os.getenv('PROFILE_MAX_STACKS', '10000'))
+loop_lag_threshold = float(os.getenv('LOOP_LAG_THRESHOLD', '0'))
+# История диалогов: memory или sqlite (data/sessions.sqlite)
+session_backend = os.getenv('SESSION_BACKEND', 'memory')
+session_ttl = float(os.getenv('SESSION_TTL', '1800'))
+session_max_turns = int(os.getenv('SESSION_MAX_TURNS', '3'))
+session_max_chats = int(os.getenv('SESSION_MAX_CHATS', '50000'))
+history_token_budget = int(os.getenv('HISTORY_TOKEN_BUDGET', '400'))
+# Кэш эмбеддингов запросов: размер LRU (0 — отключен), memory или sqlite (общий для процессов)
+embed_cache_size = int(os.getenv('EMBED_CACHE_SIZE', '4096'))
+embed_cache_backend = os.getenv('EMBED_CACHE_BACKEND', 'memory')
+# Деградация под нагрузкой: лимит вопросов в обработке и бюджеты средней длительности стадий (с)
+degrade_enabled = os.getenv('DEGRADE_ENABLED', '1') == '1'
+degrade_max_in_flight = int(os.getenv('DEGRADE_MAX_IN_FLIGHT', '32'))
+degrade_embed_budget = float(os.getenv('DEGRADE_EMBED_BUDGET', '0.5'))
+degrade_llm_budget = float(os.getenv('DEGRADE_LLM_BUDGET', '8'))
+degrade_window = float(os.getenv('DEGRADE_WINDOW', '30'))
+degrade_cooldown = float(os.getenv('DEGRADE_COOLDOWN', '30'))
+answer_cache_size = int(os.getenv('ANSWER_CACHE_SIZE', '1024'))
+# Порог сходства вопроса с сохраненным в FAQ, выше — отвечаем готовым ответом
+faq_threshold = float(os.getenv('FAQ_THRESHOLD', '0.9'))
 
 
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 SRC_DIR = BASE_DIR / "src"
 LOGS_DIR = DATA_DIR / "logs"
+# LOG_FILE переносит лог из data/logs (тесты пишут во временный каталог)
+LOG_FILE = BASE_DIR / (os.getenv('LOG_FILE') or LOGS_DIR / "log.txt")
 
 # Создаем папки если их нет
 DATA_DIR.mkdir(exist_ok=True)
 LOGS_DIR.mkdir(exist_ok=True)
+LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(LOGS_DIR / "log.txt", encoding="utf-8")
-    ],
-    force=True
-)
+# Полные тексты (контекст, ответ LLM) логируются только для доли запросов
+log_payload_rate = float(os.getenv('LOG_PAYLOAD_RATE', '0.05'))
+log_json = os.getenv('LOG_JSON', '0') == '1'
+log_max_bytes = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+log_backup_count = int(os.getenv('LOG_BACKUP_COUNT', '5'))
 
 
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if exc:
+            data["exc"] = exc
+        return json.dumps(data, ensure_ascii=False)
 
 
+class ExcQueueHandler(logging.handlers.QueueHandler):
+    """
+    Штатный QueueHandler дописывает traceback в msg и обнуляет exc_info,
+    здесь traceback остается в exc_text: JSON-формат выносит его в поле exc,
+    а обычный Formatter сам допишет его после сообщения.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.exc_info = None
+        record.exc_text = None
+        record = super().prepare(record)
+        record.exc_text = exc_text
+        return record
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Event loop только кладет записи в очередь, форматирование и запись
+    в файл (с ротацией) выполняет фоновый поток QueueListener.
+    """
+    if log_json:
+        formatter = JsonFormatter(datefmt="%Y-%m-%d %H:%M:%S")
+    else:
+        formatter = logging.Formatter("%(asctime)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=log_max_bytes,
+        backupCount=log_backup_count,
+        encoding="utf-8"
+    )
+    for handler in (stream_handler, file_handler):
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, file_handler, respect_handler_level=True
+    )
+    # QueueHandler сам форматирует только сообщение, остальное делает listener
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(message)s",
+        handlers=[ExcQueueHandler(log_queue)],
+        force=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = setup_logging()
+
+_payload_sampled: ContextVar[bool] = ContextVar("payload_sampled", default=False)
+
+
+def sample_payload() -> bool:
+    """Решает для текущего запроса, логировать ли полные тексты"""
+    sampled = random.random() < log_payload_rate
+    _payload_sampled.set(sampled)
+    return sampled
+
+
+def payload_sampled() -> bool:
+    return _payload_sampled.get()
@@ -1,34 +1,78 @@
+import argparse
 import asyncio
 from pathlib import Path
 
 import config
-from src import bot, llm, parser, rag
+from src import batch, bot, bundle, degrade, faq, llm, memory, metrics, profiling, rag
 
 logger = config.logging.getLogger(__name__)
 
 
-async def main():
-    # 1. Создание content.json если его нет
-    content_path = Path("data/content.json")
-    if not content_path.exists():
-        logger.info("Создаем content.json...")
-        await parser.main()
-    
-    # 2. Создание RAG индекса если его нет
-    index_path = Path("data/index.faiss")
-    if not index_path.exists():
+async def main(args: argparse.Namespace):
+    # 1. Текущая версия индекса: проверяется manifest, без чтения индекса
+    bundle_dir = bundle.current()
+    if bundle_dir is None:
+        # Уже скачанный content.json не обходим заново, только считаем эмбеддинги
+        content_path = rag.CONTENT_PATH if rag.CONTENT_PATH.exists() else None
         logger.info("Создаем RAG индекс...")
-        await rag.build_index()
+        bundle_dir = await bundle.build(content_path=content_path)
     
-    # 3. Инициализация LLM клиента
-    llm_client = llm.LLMClient()
+    # 2. Инициализация LLM клиента
+    llm_client = llm.LLMClient(bundle_dir)
     await llm_client.init()
+
+    # 3. Профилирование (PROFILE_RATE, LOOP_LAG_THRESHOLD), по умолчанию выключено
+    profiling.profiler.start()
+    lag_monitor = profiling.LoopLagMonitor(config.loop_lag_threshold)
+    lag_monitor.start()
+    try:
+        await run_command(args, llm_client)
+    finally:
+        await lag_monitor.stop()
+        profiling.profiler.stop()
+
+
+async def run_command(args: argparse.Namespace, llm_client: llm.LLMClient):
+    if args.command == "batch":
+        await batch.run(
+            args.input,
+            args.output,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            top_k=args.top_k,
+            llm_client=llm_client
+        )
+        return
     
-    # 4. Запуск Telegram бота
+    # 4. Метрики Prometheus
+    if config.metrics_enabled:
+        await metrics.start_server()
+
+    # Деградация под нагрузкой нужна только боту: batch сам ограничивает параллельность
+    if config.degrade_enabled:
+        degrade.shedder.start()
+
+    # 5. Запуск Telegram бота
     logger.info("Запускаем Telegram бота...")
-    bot_instance, dp = await bot.create_bot(llm_client)
+    # Ответы, полученные по другой версии индекса, не отдаются
+    faq_table = await faq.FAQ.load(content_hash=faq.bundle_hash(llm_client.bundle_dir))
+    logger.info(f"FAQ: {len(faq_table)} готовых ответов")
+    bot_instance, dp = await bot.create_bot(llm_client, memory.create_session_store(), faq_table)
     await dp.start_polling(bot_instance)
 
 
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="EORA RAG бот")
+    commands = arg_parser.add_subparsers(dest="command")
+    commands.add_parser("bot", help="запуск Telegram бота (по умолчанию)")
+    batch_parser = commands.add_parser("batch", help="ответы на вопросы из JSONL")
+    batch_parser.add_argument("input", type=Path)
+    batch_parser.add_argument("-o", "--output", type=Path, default=config.DATA_DIR / "answers.jsonl")
+    batch_parser.add_argument("--concurrency", type=int, default=8)
+    batch_parser.add_argument("--batch-size", type=int, default=256)
+    batch_parser.add_argument("--top-k", type=int, default=2)
+    return arg_parser.parse_args()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Пакетная генерация ответов без Telegram.
+
+    python main.py batch questions.jsonl -o data/answers.jsonl --concurrency 8
+
+Вход — JSONL: {"question": ...} или формат requests.jsonl
+({"request_id", "title", "body"}). Вопросы читаются порциями по batch_size:
+эмбеддинги всей порции считаются одним вызовом, поиск по индексу — одним
+векторизованным search_batch, запросы к LLM идут параллельно с ограничением
+concurrency. Результаты пишутся построчно по мере готовности.
+"""
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Iterator, TextIO
+
+import config
+from src import bundle, llm, rag
+
+
+logger = config.logging.getLogger(__name__)
+
+
+def read_questions(path: Path) -> Iterator[dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            yield {
+                "id": item.get("id", item.get("request_id", line_no)),
+                "question": item.get("question") or item.get("body") or item.get("title") or "",
+            }
+
+
+def chunked(items: Iterator[dict[str, Any]], size: int) -> Iterator[list[dict[str, Any]]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def answer_chunk(
+    llm_client: llm.LLMClient,
+    chunk: list[dict[str, Any]],
+    out: TextIO,
+    semaphore: asyncio.Semaphore,
+    top_k: int = 2,
+    min_score: float | None = 0.3,
+    max_tokens: int = 300,
+    groups=None
+) -> int:
+    """Возвращает число ошибок в порции"""
+    try:
+        start = time.perf_counter()
+        # Мимо кэша запросов бота: пакет не должен вытеснять из него живые вопросы
+        query_embs = await rag.to_embeddings([item["question"] for item in chunk])
+        embed_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = await rag.search_batch(
+            llm_client.index, query_embs, top_k, min_score, llm_client.embeddings, groups=groups
+        )
+        search_seconds = time.perf_counter() - start
+    except Exception as e:
+        # Без эмбеддингов или поиска ответить не на что: ошибка у каждого вопроса порции
+        logger.info(f"batch: порция из {len(chunk)} вопросов не обработана: {e!r}")
+        for item in chunk:
+            record = {"id": item["id"], "question": item["question"], "error": repr(e)}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        return len(chunk)
+
+    errors = 0
+
+    async def answer_one(item: dict[str, Any], row) -> None:
+        nonlocal errors
+        result_contents = [
+            {"url": llm_client.content[idx]["url"], "text": llm_client.content[idx]["text"]}
+            for idx in row
+        ]
+        record: dict[str, Any] = {
+            "id": item["id"],
+            "question": item["question"],
+            "urls": [content["url"] for content in result_contents],
+        }
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                messages = llm_client.build_messages(item["question"], result_contents, log_question=False)
+                record["answer"] = await llm_client.complete(messages, max_tokens=max_tokens)
+            except Exception as e:
+                errors += 1
+                record["error"] = repr(e)
+            llm_seconds = time.perf_counter() - start
+        # Эмбеддинги и поиск считаются на порцию, на вопрос приходится доля
+        record["timings"] = {
+            "embed": round(embed_seconds / len(chunk), 4),
+            "search": round(search_seconds / len(chunk), 4),
+            "llm": round(llm_seconds, 4),
+        }
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    await asyncio.gather(*(
+        answer_one(item, row)
+        for item, row in zip(chunk, rows)
+    ))
+    return errors
+
+
+async def run(
+    in_path: Path,
+    out_path: Path,
+    concurrency: int = 8,
+    batch_size: int = 256,
+    top_k: int = 2,
+    llm_client: llm.LLMClient | None = None
+) -> dict[str, Any]:
+    if llm_client is None:
+        llm_client = llm.LLMClient(bundle.current())
+        await llm_client.init()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    # Один документ на URL: несколько чанков одной страницы не занимают весь top_k
+    groups = rag.doc_groups(llm_client.content)
+    total = errors = 0
+    start = time.perf_counter()
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as out:
+        # Пока LLM отвечает на хвост порции, следующая уже эмбеддится и ищется
+        tasks: set[asyncio.Task] = set()
+        try:
+            for chunk in chunked(read_questions(in_path), batch_size):
+                if len(tasks) >= 2:
+                    done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    errors += sum(task.result() for task in done)
+                tasks.add(asyncio.create_task(
+                    answer_chunk(llm_client, chunk, out, semaphore, top_k=top_k, groups=groups)
+                ))
+                total += len(chunk)
+                logger.info(f"batch: в работе {total}, ошибок {errors}")
+            if tasks:
+                errors += sum(await asyncio.gather(*tasks))
+                tasks = set()
+        finally:
+            # Незавершенные порции не должны писать в уже закрытый файл
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "questions": total,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "qps": round(total / elapsed, 2) if elapsed else 0.0,
+    }
+    logger.info(f"batch: {summary}")
+    return summary
@@ -4,10 +4,11 @@ from aiogram import Bot, Dispatcher, Router, types, BaseMiddleware
 from aiogram.filters import Command
 
 from config import tg_token
-from src import llm
+from src import degrade, faq as faq_module, llm, memory, metrics, profiling, sender
 
 
 router = Router()
+outbox = sender.Sender()
 
 class LLMClientMiddleware(BaseMiddleware):
     def __init__(self, llm_client: llm.LLMClient):
@@ -23,32 +24,89 @@ class LLMClientMiddleware(BaseMiddleware):
         return await handler(event, data)
 
 
+class ContextMiddleware(BaseMiddleware):
+    """Передает в хендлеры общие объекты (история диалогов, FAQ и т.п.)"""
+
+    def __init__(self, **values: Any):
+        self.values = values
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        data.update(self.values)
+        return await handler(event, data)
+
+
 @router.message(Command("start"))
-async def start_command(message: types.Message):
+async def start_command(message: types.Message, sessions: memory.SessionStore | None = None):
+    if sessions is not None:
+        sessions.clear(message.chat.id)
     start_msg = "Привет! Я бот EORA.\nЗадавай мне вопросы о EORA, и я постараюсь помочь!"
     await message.answer(start_msg)
 
 
 @router.message()
-async def question_handler(message: types.Message, llm_client: llm.LLMClient):
-    answer = await llm_client.generate_answer(
-        message.text,
-        max_tokens=300,
-        temperature=0.5,
-        top_p=0.8
-    )
-    try:
-        await message.answer(answer, parse_mode="HTML")
-    except Exception:
-        await message.answer(answer)
-
-
-async def create_bot(llm_client: llm.LLMClient) -> tuple[Bot, Dispatcher]:
-    bot = Bot(token=tg_token)
+async def question_handler(
+    message: types.Message,
+    llm_client: llm.LLMClient,
+    sessions: memory.SessionStore | None = None,
+    faq: faq_module.FAQ | None = None
+):
+    with (
+        metrics.request_timings(),
+        profiling.profiler.request(),
+        degrade.shedder.track(),
+        metrics.span("total")
+    ):
+        history = sessions.get(message.chat.id) if sessions is not None else None
+        answer = None
+        # Уточняющему вопросу нужен контекст диалога, готовый ответ не подойдет
+        if faq is not None and memory.is_standalone(message.text, history):
+            answer = await faq.match(message.text)
+        if answer is None:
+            answer = await llm_client.generate_answer(
+                message.text,
+                max_tokens=300,
+                temperature=0.5,
+                top_p=0.8,
+                history=history
+            )
+        if sessions is not None:
+            sessions.append(message.chat.id, message.text, answer)
+        with metrics.span("telegram_send"):
+            await outbox.send(message, answer)
+
+
+def create_dispatcher(
+    llm_client: llm.LLMClient,
+    sessions: memory.SessionStore | None = None,
+    faq: faq_module.FAQ | None = None
+) -> Dispatcher:
     dp = Dispatcher()
 
     dp.update.outer_middleware(LLMClientMiddleware(llm_client))
+    context = {
+        name: value
+        for name, value in (("sessions", sessions), ("faq", faq))
+        if value is not None
+    }
+    if context:
+        dp.update.outer_middleware(ContextMiddleware(**context))
 
     dp.include_router(router)
+
+    return dp
+
+
+async def create_bot(
+    llm_client: llm.LLMClient,
+    sessions: memory.SessionStore | None = None,
+    faq: faq_module.FAQ | None = None
+) -> tuple[Bot, Dispatcher]:
+    bot = Bot(token=tg_token)
+    dp = create_dispatcher(llm_client, sessions, faq)
     
     return bot, dp
\ No newline at end of file
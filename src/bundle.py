@@ -0,0 +1,228 @@
+"""
+Версии индекса: каталог data/index/<version> с index.faiss, content.json,
+embeddings.npy (для сжатых индексов) и manifest.json.
+
+Версия собирается во временном каталоге, manifest пишется последним,
+затем каталог переименовывается и симлинк data/index/current атомарно
+переключается на него. Полусобранная версия никогда не становится текущей.
+
+При запуске проверяется только manifest, размеры файлов и заголовок
+индекса — это миллисекунды, без чтения индекса и content.json целиком.
+Версия, собранная с другим INDEX_TYPE, не проходит проверку и пересобирается.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import faiss
+
+import config
+from src import pipeline, rag
+
+
+logger = config.logging.getLogger(__name__)
+
+
+BUNDLES_DIR = config.DATA_DIR / "index"
+CURRENT_LINK = BUNDLES_DIR / "current"
+
+INDEX_NAME = "index.faiss"
+CONTENT_NAME = "content.json"
+EMBEDDINGS_NAME = "embeddings.npy"
+MANIFEST_NAME = "manifest.json"
+
+FORMAT_VERSION = 1
+
+
+class BundleError(Exception):
+    pass
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_index_header(path: Path) -> tuple[int, int]:
+    """
+    Размерность и число векторов из заголовка файла FAISS (fourcc, d, ntotal)
+    без чтения самого индекса
+    """
+    with open(path, "rb") as f:
+        header = f.read(16)
+    if len(header) < 16:
+        raise BundleError(f"{path.name}: файл индекса обрезан")
+    dim, ntotal = struct.unpack("<iq", header[4:16])
+    return dim, ntotal
+
+
+def expected_params() -> dict[str, Any]:
+    """Параметры сборки из config, от которых зависит индекс"""
+    return {"index_type": config.index_type}
+
+
+def make_manifest(bundle_dir: Path, params: dict[str, Any]) -> dict[str, Any]:
+    index = faiss.read_index(str(bundle_dir / INDEX_NAME))
+    docs = len(json.loads((bundle_dir / CONTENT_NAME).read_text(encoding="utf-8")))
+    if docs != index.ntotal:
+        raise BundleError(f"в content.json {docs} документов, в индексе {index.ntotal}")
+    content_hash = file_sha256(bundle_dir / CONTENT_NAME)
+    files = {
+        path.name: path.stat().st_size
+        for path in sorted(bundle_dir.iterdir())
+        if path.name in (INDEX_NAME, CONTENT_NAME, EMBEDDINGS_NAME)
+    }
+    return {
+        "format": FORMAT_VERSION,
+        # Имена версий сортируются по времени сборки
+        "version": f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{content_hash[:8]}",
+        "created": int(time.time()),
+        "model": rag.MODEL_NAME,
+        "dim": index.d,
+        "ntotal": index.ntotal,
+        "content_sha256": content_hash,
+        "files": files,
+        "params": params,
+    }
+
+
+def validate(bundle_dir: Path, deep: bool = False) -> dict[str, Any]:
+    """
+    Проверяет версию и возвращает ее manifest, при несоответствии — BundleError.
+    deep: дополнительно пересчитать хэш content.json
+    """
+    manifest_path = bundle_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        raise BundleError(f"{bundle_dir.name}: нет {MANIFEST_NAME}")
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+
+    if manifest.get("format") != FORMAT_VERSION:
+        raise BundleError(f"{bundle_dir.name}: формат {manifest.get('format')}, ожидается {FORMAT_VERSION}")
+    if manifest.get("model") != rag.MODEL_NAME:
+        raise BundleError(f"{bundle_dir.name}: собран моделью {manifest.get('model')}, сейчас {rag.MODEL_NAME}")
+    params = manifest.get("params", {})
+    for name, value in expected_params().items():
+        if params.get(name) != value:
+            raise BundleError(f"{bundle_dir.name}: собран с {name}={params.get(name)}, сейчас {value}")
+    for name, size in manifest["files"].items():
+        path = bundle_dir / name
+        if not path.exists() or path.stat().st_size != size:
+            raise BundleError(f"{bundle_dir.name}: {name} отсутствует или изменен")
+    if (manifest["dim"], manifest["ntotal"]) != read_index_header(bundle_dir / INDEX_NAME):
+        raise BundleError(f"{bundle_dir.name}: заголовок индекса не совпадает с manifest")
+    if deep and file_sha256(bundle_dir / CONTENT_NAME) != manifest["content_sha256"]:
+        raise BundleError(f"{bundle_dir.name}: хэш content.json не совпадает с manifest")
+    return manifest
+
+
+def publish(build_dir: Path, params: dict[str, Any], keep: int = 3) -> Path:
+    """Превращает собранный каталог в версию и делает ее текущей"""
+    manifest = make_manifest(build_dir, params)
+    manifest_tmp = build_dir / (MANIFEST_NAME + ".tmp")
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_tmp, build_dir / MANIFEST_NAME)
+
+    bundle_dir = BUNDLES_DIR / manifest["version"]
+    # mkdtemp создает каталог с правами 0700, версию читают и другие процессы
+    os.chmod(build_dir, 0o755)
+    os.rename(build_dir, bundle_dir)
+
+    link_tmp = BUNDLES_DIR / f".current-{os.getpid()}"
+    link_tmp.unlink(missing_ok=True)
+    os.symlink(bundle_dir.name, link_tmp)
+    os.replace(link_tmp, CURRENT_LINK)
+    logger.info(f"bundle: текущая версия {manifest['version']} ({manifest['ntotal']} документов)")
+
+    prune(keep)
+    return bundle_dir
+
+
+def prune(keep: int = 3) -> None:
+    """Удаляет старые версии, кроме текущей и keep последних"""
+    current = CURRENT_LINK.resolve() if CURRENT_LINK.exists() else None
+    versions = sorted(
+        path for path in BUNDLES_DIR.iterdir()
+        if path.is_dir() and not path.is_symlink() and not path.name.startswith(".")
+    )
+    for path in versions[:-keep] if keep else versions:
+        if path.resolve() != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def current() -> Path | None:
+    """Каталог текущей версии, если она есть и проходит проверку"""
+    if not CURRENT_LINK.exists():
+        return None
+    bundle_dir = CURRENT_LINK.resolve()
+    try:
+        manifest = validate(bundle_dir)
+    except (BundleError, OSError, ValueError, KeyError) as e:
+        logger.info(f"bundle: текущая версия не прошла проверку: {e}")
+        return None
+    logger.info(f"bundle: версия {manifest['version']}, {manifest['ntotal']} документов")
+    return bundle_dir
+
+
+async def build(
+    index_type: str = config.index_type,
+    content_path: Path | None = None,
+    links: list[str] | None = None,
+    **pipeline_kwargs: Any
+) -> Path:
+    """
+    Собирает и публикует новую версию.
+    content_path: уже скачанный content.json — считаются только эмбеддинги,
+    иначе сайт обходится заново; в обоих случаях через потоковый pipeline.build
+    """
+    BUNDLES_DIR.mkdir(exist_ok=True)
+    build_dir = Path(tempfile.mkdtemp(prefix=".build-", dir=BUNDLES_DIR))
+    try:
+        params: dict[str, Any] = {"index_type": index_type}
+        # Незаданные параметры не пишем: в manifest только то, с чем собрано
+        params.update((name, value) for name, value in pipeline_kwargs.items() if value is not None)
+        if content_path is not None:
+            # Готовый content.json идет теми же порциями эмбеддингов, без обхода сайта
+            pipeline_kwargs["records"] = json.loads(content_path.read_text(encoding="utf-8"))
+            params["source"] = str(content_path)
+        await pipeline.build(
+            links,
+            content_path=build_dir / CONTENT_NAME,
+            index_path=build_dir / INDEX_NAME,
+            index_type=index_type,
+            **pipeline_kwargs
+        )
+        return publish(build_dir, params)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Версии RAG индекса")
+    arg_parser.add_argument("--build", action="store_true", help="обойти сайт и опубликовать новую версию")
+    arg_parser.add_argument("--from-content", type=Path, default=None, help="собрать из готового content.json")
+    arg_parser.add_argument("--index-type", choices=rag.INDEX_TYPES, default=config.index_type)
+    arg_parser.add_argument("--chunk-chars", type=int, default=None)
+    arg_parser.add_argument("--verify", action="store_true", help="проверить текущую версию, включая хэш")
+    args = arg_parser.parse_args()
+
+    if args.build or args.from_content:
+        kwargs = {} if args.from_content or args.chunk_chars is None else {"chunk_chars": args.chunk_chars}
+        asyncio.run(build(args.index_type, content_path=args.from_content, **kwargs))
+    if args.verify:
+        print(json.dumps(validate(CURRENT_LINK.resolve(), deep=True), ensure_ascii=False, indent=4))
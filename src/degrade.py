@@ -0,0 +1,254 @@
+"""
+Деградация под нагрузкой.
+
+LoadShedder следит за числом вопросов в обработке и за средней
+длительностью стадий embed и llm (по span-ам за последние window секунд).
+Давление — максимум из отношений к лимитам: in_flight / max_in_flight,
+средняя стадии / ее бюджет. Пока давление >= 1, уровень повышается
+на ступень не чаще раза в step_interval:
+
+    0 normal  — полный пайплайн
+    1 reduced — меньше документов в контексте, без MMR и точного пересчета скоров
+    2 cached  — повторный вопрос отвечается из кэша последних ответов
+    3 links   — без LLM: ответ из кэша или ссылки на найденные материалы
+
+Когда давление ниже recover_ratio дольше cooldown, уровень снижается
+на ступень за каждый cooldown спокойствия. Текущий уровень —
+метрика eora_degradation_level.
+"""
+import asyncio
+import html
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from types import FrameType
+from typing import Any, Callable, Iterator
+
+import config
+from src import embed_cache, metrics
+
+
+logger = config.logging.getLogger(__name__)
+
+
+NORMAL, REDUCED, CACHED, LINKS = range(4)
+LEVEL_NAMES = ("normal", "reduced", "cached", "links")
+
+DEGRADATION_LEVEL = metrics.Gauge(
+    "eora_degradation_level",
+    "Уровень деградации: 0 normal, 1 reduced, 2 cached, 3 links"
+)
+DEGRADED_ANSWERS = metrics.Counter(
+    "eora_degraded_answers_total",
+    "Ответы без LLM под нагрузкой по источнику (cache/links)",
+    ("source",)
+)
+
+LINKS_INTRO = "Сейчас много вопросов, поэтому вместо подробного ответа — материалы по теме:"
+BUSY_TEXT = "Сейчас много вопросов, попробуйте повторить свой чуть позже."
+
+
+class AnswerCache:
+    """LRU последних ответов LLM на самостоятельные вопросы, ключ — embed_cache.query_key"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._answers: OrderedDict[str, str] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def get(self, question: str) -> str | None:
+        key = embed_cache.query_key(question)
+        answer = self._answers.get(key)
+        if answer is not None:
+            self._answers.move_to_end(key)
+        return answer
+
+    def put(self, question: str, answer: str) -> None:
+        if self.max_size <= 0:
+            return
+        key = embed_cache.query_key(question)
+        self._answers[key] = answer
+        self._answers.move_to_end(key)
+        while len(self._answers) > self.max_size:
+            self._answers.popitem(last=False)
+
+    def clear(self) -> None:
+        self._answers.clear()
+
+
+def links_answer(results: list[dict[str, Any]], limit: int = 3) -> str:
+    """HTML со ссылками на найденные документы: заголовок — первая строка текста"""
+    lines = [LINKS_INTRO]
+    seen = set()
+    for item in results:
+        if item["url"] in seen:
+            continue
+        seen.add(item["url"])
+        title = item["text"].split("\n", 1)[0].strip() or item["url"]
+        if len(title) > 100:
+            title = title[:97].rstrip() + "..."
+        lines.append(f'— <a href="{html.escape(item["url"])}">{html.escape(title, quote=False)}</a>')
+        if len(seen) >= limit:
+            break
+    return "\n".join(lines) if seen else BUSY_TEXT
+
+
+class LoadShedder:
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        budgets: dict[str, float] | None = None,
+        window: float = 30.0,
+        step_interval: float = 5.0,
+        cooldown: float = 30.0,
+        recover_ratio: float = 0.5,
+        answer_cache_size: int = 1024
+    ):
+        """
+        max_in_flight: вопросов в обработке, при котором давление равно 1 (0 — не учитывать)
+        budgets: допустимая средняя длительность стадий, {"embed": 0.5, "llm": 8.0}
+        """
+        self.max_in_flight = max_in_flight
+        self.budgets = budgets if budgets is not None else {"embed": 0.5, "llm": 8.0}
+        self.window = window
+        self.step_interval = step_interval
+        self.cooldown = cooldown
+        self.recover_ratio = recover_ratio
+        self.answers = AnswerCache(answer_cache_size)
+        self.level = NORMAL
+        self.in_flight = 0
+        # Стадия -> [(время, длительность)], сумма длительностей в окне
+        self._samples: dict[str, deque[tuple[float, float]]] = {stage: deque() for stage in self.budgets}
+        self._sums: dict[str, float] = dict.fromkeys(self.budgets, 0.0)
+        self._changed = time.monotonic()
+        self._last_high = self._changed
+        self._started = False
+        self._ticker: asyncio.Task | None = None
+        DEGRADATION_LEVEL.set(NORMAL)
+
+    @property
+    def level_name(self) -> str:
+        return LEVEL_NAMES[self.level]
+
+    def start(self) -> None:
+        if self._started:
+            return
+        metrics.stage_hooks.append(self._enter_stage)
+        self._started = True
+        try:
+            # Без трафика уровень и метрика тоже должны возвращаться к normal
+            self._ticker = asyncio.get_running_loop().create_task(self._tick())
+        except RuntimeError:
+            self._ticker = None
+        logger.info(f"degrade: лимиты {self.max_in_flight} вопросов, бюджеты стадий {self.budgets}")
+
+    def stop(self) -> None:
+        if not self._started:
+            return
+        metrics.stage_hooks.remove(self._enter_stage)
+        self._started = False
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+
+    async def _tick(self) -> None:
+        # Снижение уровня идет шагами по cooldown, чаще проверять незачем
+        interval = max(self.cooldown / 2, 0.01)
+        while True:
+            await asyncio.sleep(interval)
+            self.update()
+
+    @contextmanager
+    def track(self) -> Iterator[int]:
+        """Учет вопроса в обработке, отдает уровень на момент начала"""
+        self.in_flight += 1
+        self.update()
+        try:
+            yield self.level
+        finally:
+            self.in_flight -= 1
+
+    def _enter_stage(self, stage: str, frame: FrameType) -> Callable[[], None] | None:
+        if stage not in self.budgets:
+            return None
+        start = time.monotonic()
+
+        def exit_stage() -> None:
+            self.observe(stage, time.monotonic() - start)
+
+        return exit_stage
+
+    def observe(self, stage: str, seconds: float, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._samples[stage].append((now, seconds))
+        self._sums[stage] += seconds
+        self.update(now)
+
+    def stage_mean(self, stage: str, now: float | None = None) -> float:
+        """Средняя длительность стадии за окно, 0 если замеров нет"""
+        now = time.monotonic() if now is None else now
+        samples = self._samples[stage]
+        while samples and now - samples[0][0] > self.window:
+            self._sums[stage] -= samples.popleft()[1]
+        if not samples:
+            self._sums[stage] = 0.0
+            return 0.0
+        return self._sums[stage] / len(samples)
+
+    def pressure(self, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        values = [self.in_flight / self.max_in_flight] if self.max_in_flight > 0 else []
+        values.extend(
+            self.stage_mean(stage, now) / budget
+            for stage, budget in self.budgets.items()
+            if budget > 0
+        )
+        return max(values, default=0.0)
+
+    def update(self, now: float | None = None) -> int:
+        if not self._started:
+            return self.level
+        now = time.monotonic() if now is None else now
+        pressure = self.pressure(now)
+        level = self.level
+        if pressure >= self.recover_ratio:
+            self._last_high = now
+        if pressure >= 1.0:
+            if level < LINKS and now - self._changed >= self.step_interval:
+                level += 1
+        elif level > NORMAL:
+            quiet = now - max(self._changed, self._last_high)
+            if quiet >= self.cooldown:
+                level -= min(level, int(quiet // self.cooldown))
+        if level != self.level:
+            logger.info(f"degrade: {LEVEL_NAMES[self.level]} -> {LEVEL_NAMES[level]}, давление {pressure:.2f}")
+            self.level = level
+            self._changed = now
+            DEGRADATION_LEVEL.set(level)
+        return self.level
+
+    def cached_answer(self, question: str) -> str | None:
+        """Готовый ответ на повторный вопрос, только начиная с уровня cached"""
+        if self.level < CACHED:
+            return None
+        answer = self.answers.get(question)
+        if answer is not None:
+            DEGRADED_ANSWERS.inc(source="cache")
+            logger.info("degrade: ответ из кэша последних ответов")
+        return answer
+
+    def links_only(self, results: list[dict[str, Any]]) -> str:
+        DEGRADED_ANSWERS.inc(source="links")
+        logger.info(f"degrade: ответ ссылками без LLM ({len(results)} документов)")
+        return links_answer(results)
+
+
+shedder = LoadShedder(
+    max_in_flight=config.degrade_max_in_flight,
+    budgets={"embed": config.degrade_embed_budget, "llm": config.degrade_llm_budget},
+    window=config.degrade_window,
+    cooldown=config.degrade_cooldown,
+    answer_cache_size=config.answer_cache_size
+)
@@ -0,0 +1,217 @@
+"""
+Кэш эмбеддингов запросов.
+
+Ключ — нормализованный текст запроса: регистр, пробелы, пунктуация и "ё"
+не влияют на эмбеддинг настолько, чтобы считать его заново. Повторный
+вопрос отвечается без вызова модели.
+"""
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import numpy as np
+
+import config
+from src import metrics, parser
+
+
+logger = config.logging.getLogger(__name__)
+
+
+EMBED_CACHE_PATH = config.DATA_DIR / "embed_cache.sqlite"
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+
+
+def query_key(text: str) -> str:
+    text = parser.normalize(text).lower().replace("ё", "е")
+    return " ".join(_PUNCT_RE.sub(" ", text).split())
+
+
+class EmbeddingCache:
+    """
+    LRU в памяти процесса: самые старые ключи снимаются с начала OrderedDict.
+    Векторы хранятся копиями только для чтения, чтобы вызывающий код
+    не мог испортить закэшированное значение.
+    """
+
+    def __init__(self, max_size: int = config.embed_cache_size):
+        self.max_size = max_size
+        self._vectors: OrderedDict[str, np.ndarray] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def get(self, key: str) -> np.ndarray | None:
+        vector = self._vectors.get(key)
+        if vector is not None:
+            self._vectors.move_to_end(key)
+        return vector
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        self._vectors[key] = vector
+        self._vectors.move_to_end(key)
+        while len(self._vectors) > self.max_size:
+            self._vectors.popitem(last=False)
+
+    def clear(self) -> None:
+        self._vectors.clear()
+
+    async def lookup(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """Найденные векторы по списку ключей"""
+        return {key: vector for key in keys if (vector := self.get(key)) is not None}
+
+    async def store(self, vectors: dict[str, np.ndarray]) -> None:
+        for key, vector in vectors.items():
+            self.put(key, vector)
+
+    async def embed(
+        self,
+        queries: list[str],
+        encode: Callable[[list[str]], Awaitable[np.ndarray]]
+    ) -> np.ndarray:
+        """Эмбеддинги запросов (n, dim): промахи считаются одним вызовом encode"""
+        if not queries:
+            return await encode(queries)
+        keys = [query_key(query) for query in queries]
+        found = await self.lookup(list(dict.fromkeys(keys)))
+        misses: dict[str, str] = {}
+        for key, query in zip(keys, queries):
+            hit = key in found
+            metrics.cache_hit("embedding", hit)
+            if not hit:
+                misses.setdefault(key, query)
+
+        if misses:
+            embs = await encode(list(misses.values()))
+            computed = dict(zip(misses, embs))
+            await self.store(computed)
+            found.update(computed)
+            if len(misses) == len(keys):
+                return embs
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+
+
+class SQLiteEmbeddingCache(EmbeddingCache):
+    """
+    LRU в памяти поверх общего локального SQLite: векторы, посчитанные
+    одним процессом, достаются остальным без вызова модели.
+    В embed запросы к SQLite идут в потоке (asyncio.to_thread), по одному
+    переходу на чтение и на запись порции, event loop их не ждет.
+    namespace: имя модели, чтобы после ее смены не отдавать старые векторы
+    """
+
+    def __init__(
+        self,
+        path: Path = EMBED_CACHE_PATH,
+        namespace: str = "",
+        max_rows: int = 100_000,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.namespace = namespace
+        self.max_rows = max_rows
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings(used)")
+        # Соединение одно на процесс, а запросы идут из потоков пула
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def _load(self, keys: list[str]) -> dict[str, bytes]:
+        """Векторы из SQLite по ключам, отмечает их использованными"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self.conn.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (f"{self.namespace}:{key}",)
+                ).fetchone()
+                if row is None:
+                    continue
+                self.conn.execute(
+                    "UPDATE embeddings SET used = ? WHERE key = ?", (time.time(), f"{self.namespace}:{key}")
+                )
+                found[key] = row[0]
+        return found
+
+    def _save(self, vectors: dict[str, np.ndarray]) -> None:
+        with self._lock:
+            now = time.time()
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, used) VALUES (?, ?, ?)",
+                [
+                    (f"{self.namespace}:{key}", np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in vectors.items()
+                ]
+            )
+            # Как и в SQLiteSessionStore, COUNT(*) проверяется не на каждой записи
+            before, self._puts = self._puts, self._puts + len(vectors)
+            if before // 256 == self._puts // 256:
+                return
+            count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_rows:
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY used LIMIT ?)",
+                    (count - self.max_rows,)
+                )
+
+    def _remember(self, rows: dict[str, bytes]) -> dict[str, np.ndarray]:
+        """Кладет векторы из SQLite в LRU в памяти, отдает их копии только для чтения"""
+        vectors = {}
+        for key, blob in rows.items():
+            super().put(key, np.frombuffer(blob, dtype=np.float32))
+            vectors[key] = super().get(key)
+        return vectors
+
+    def get(self, key: str) -> np.ndarray | None:
+        vector = super().get(key)
+        if vector is not None:
+            return vector
+        return self._remember(self._load([key])).get(key)
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        super().put(key, vector)
+        self._save({key: vector})
+
+    async def lookup(self, keys: list[str]) -> dict[str, np.ndarray]:
+        found, missing = {}, []
+        for key in keys:
+            vector = super().get(key)
+            if vector is None:
+                missing.append(key)
+            else:
+                found[key] = vector
+        if missing:
+            # LRU в памяти меняется только в потоке event loop
+            found.update(self._remember(await asyncio.to_thread(self._load, missing)))
+        return found
+
+    async def store(self, vectors: dict[str, np.ndarray]) -> None:
+        for key, vector in vectors.items():
+            super().put(key, vector)
+        await asyncio.to_thread(self._save, vectors)
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self.conn.execute("DELETE FROM embeddings WHERE key LIKE ?", (f"{self.namespace}:%",))
+
+
+def create_embedding_cache(namespace: str = "") -> EmbeddingCache | None:
+    if config.embed_cache_size <= 0:
+        return None
+    if config.embed_cache_backend == "sqlite":
+        return SQLiteEmbeddingCache(namespace=namespace)
+    return EmbeddingCache()
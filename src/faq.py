@@ -0,0 +1,284 @@
+"""
+Заранее подготовленные ответы на частые вопросы.
+
+Офлайн: вопросы из логов (строки "question: ...") или из файла прогоняются
+через LLMClient, ответы проверяются и сохраняются вместе с индексом
+эмбеддингов вопросов:
+
+    python -m src.faq --from-logs --top 100
+    python -m src.faq --questions data/faq_questions.txt --review
+    python -m src.faq --pending          # непроверенные ответы с номерами
+    python -m src.faq --approve 0 3      # одобрить по номерам, без номеров — все
+
+Сразу проверенными сохраняются только ответы со ссылками на источники,
+остальные ждут --approve. Каждая запись помнит хэш content.json версии
+индекса (bundle), по которой получен ответ: после пересборки корпуса
+старые ответы не отдаются, а --append генерирует их заново.
+
+Онлайн: FAQ.match находит ответ, если вопрос похож на сохраненный выше порога.
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+import faiss
+import numpy as np
+
+import config
+from src import bundle, llm, metrics, rag
+
+
+logger = config.logging.getLogger(__name__)
+
+
+FAQ_PATH = config.DATA_DIR / "faq.json"
+FAQ_INDEX_PATH = config.DATA_DIR / "faq.faiss"
+
+_QUESTION_RE = re.compile(r"question: (.+)$")
+
+
+def questions_from_logs(logs_dir: Path = config.LOG_FILE.parent, top: int = 100, min_count: int = 2) -> list[str]:
+    """Самые частые вопросы из логов (включая ротированные файлы)"""
+    counter: Counter[str] = Counter()
+    for path in sorted(logs_dir.glob(f"{config.LOG_FILE.name}*")):
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if line.startswith("{"):
+                    try:
+                        line = json.loads(line).get("message", "")
+                    except json.JSONDecodeError:
+                        continue
+                found = _QUESTION_RE.search(line.rstrip("\n"))
+                if found:
+                    counter[" ".join(found.group(1).split())] += 1
+    return [question for question, count in counter.most_common(top) if count >= min_count]
+
+
+def questions_from_file(path: Path) -> list[str]:
+    """Текстовый файл (вопрос на строку) или JSONL с полем question"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            questions.append(json.loads(line)["question"] if line.startswith("{") else line)
+    return questions
+
+
+def vet_answer(answer: str) -> bool:
+    """Отсекает ответы, которые LLM вернула не в формате JSON или пустыми"""
+    stripped = answer.strip()
+    return (
+        bool(stripped)
+        and not stripped.startswith(("{", "```"))
+        and len(stripped) < 4096
+    )
+
+
+def cites_sources(answer: str) -> bool:
+    """Ответ ссылается на материалы корпуса (ссылки [N] из complete)"""
+    return '<a href="' in answer
+
+
+def bundle_hash(bundle_dir: Path | None) -> str | None:
+    """Хэш content.json версии индекса из ее manifest"""
+    if bundle_dir is None:
+        return None
+    manifest = json.loads((bundle_dir / bundle.MANIFEST_NAME).read_text(encoding="utf-8"))
+    return manifest["content_sha256"]
+
+
+class FAQ:
+    def __init__(
+        self,
+        entries: list[dict[str, Any]] | None = None,
+        index: faiss.Index | None = None,
+        threshold: float = config.faq_threshold,
+        content_hash: str | None = None
+    ):
+        """content_hash: хэш content.json текущей версии индекса (bundle_hash)"""
+        self.entries = entries or []
+        self.index = index
+        self.threshold = threshold
+        self.content_hash = content_hash
+
+    @classmethod
+    async def load(
+        cls,
+        path: Path = FAQ_PATH,
+        index_path: Path = FAQ_INDEX_PATH,
+        threshold: float = config.faq_threshold,
+        content_hash: str | None = None
+    ) -> "FAQ":
+        if not path.exists() or not index_path.exists():
+            return cls(threshold=threshold, content_hash=content_hash)
+        entries = json.loads(path.read_text(encoding="utf-8"))
+        index = await rag.load_index(index_path)
+        faq = cls(entries, index, threshold, content_hash)
+        stale = sum(not faq.fresh(entry) for entry in entries)
+        if stale:
+            logger.info(f"faq: {stale} ответов получены по другой версии индекса и не отдаются")
+        return faq
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def fresh(self, entry: dict[str, Any]) -> bool:
+        return entry.get("content_sha256") == self.content_hash
+
+    def pending(self) -> list[tuple[int, dict[str, Any]]]:
+        """Непроверенные записи текущей версии индекса с их номерами"""
+        return [
+            (num, entry) for num, entry in enumerate(self.entries)
+            if not entry.get("vetted", False) and self.fresh(entry)
+        ]
+
+    def approve(self, nums: list[int] | None = None) -> int:
+        """Отмечает записи проверенными; nums=None — все из pending"""
+        pending = dict(self.pending())
+        nums = list(pending) if nums is None else nums
+        approved = 0
+        for num in nums:
+            if num not in pending:
+                logger.info(f"faq: записи {num} нет среди непроверенных")
+                continue
+            pending[num]["vetted"] = True
+            approved += 1
+        return approved
+
+    def drop_stale(self) -> list[str]:
+        """Удаляет записи другой версии индекса, возвращает их вопросы для повторной генерации"""
+        keep = [num for num, entry in enumerate(self.entries) if self.fresh(entry)]
+        stale = [entry["question"] for entry in self.entries if not self.fresh(entry)]
+        if not stale:
+            return []
+        if self.index is not None:
+            embs = self.index.reconstruct_n(0, self.index.ntotal)[keep]
+            self.index = faiss.IndexFlatIP(self.index.d)
+            self.index.add(embs)
+        self.entries = [self.entries[num] for num in keep]
+        return stale
+
+    def search(self, query_emb: np.ndarray) -> tuple[float, dict[str, Any]] | None:
+        if self.index is None or self.index.ntotal == 0:
+            return None
+        scores, ids = self.index.search(query_emb, 1)
+        if ids[0][0] < 0:
+            return None
+        return float(scores[0][0]), self.entries[ids[0][0]]
+
+    async def match(self, question: str) -> str | None:
+        """Проверенный ответ на похожий вопрос или None"""
+        if not self.entries:
+            return None
+        with metrics.span("faq"):
+            query_emb = await rag.embed_queries([question])
+            found = self.search(query_emb)
+        hit = (
+            found is not None
+            and found[0] >= self.threshold
+            and found[1].get("vetted", False)
+            and self.fresh(found[1])
+        )
+        metrics.cache_hit("faq", hit)
+        if not hit:
+            return None
+        logger.info(f"faq: ответ на похожий вопрос ({found[0]:.3f}) {found[1]['question']}")
+        return found[1]["answer"]
+
+    async def add(self, question: str, answer: str, vetted: bool = True, dedup: float = 0.95) -> bool:
+        """Добавляет запись, если похожего вопроса еще нет"""
+        emb = await rag.to_embeddings([question])
+        found = self.search(emb)
+        if found is not None and found[0] >= dedup:
+            return False
+        if self.index is None:
+            self.index = faiss.IndexFlatIP(emb.shape[1])
+        self.index.add(emb)
+        self.entries.append({
+            "question": question,
+            "answer": answer,
+            "vetted": vetted,
+            "content_sha256": self.content_hash,
+            "created": int(time.time()),
+        })
+        return True
+
+    def save(self, path: Path = FAQ_PATH, index_path: Path = FAQ_INDEX_PATH) -> None:
+        path.write_text(json.dumps(self.entries, ensure_ascii=False, indent=4), encoding="utf-8")
+        if self.index is not None:
+            faiss.write_index(self.index, str(index_path))
+
+
+async def build_faq(
+    llm_client: llm.LLMClient,
+    questions: list[str],
+    faq: FAQ | None = None,
+    review: bool = False
+) -> FAQ:
+    """
+    Прогоняет вопросы через полный пайплайн LLMClient.
+    review: сохранить ответы непроверенными (vetted=false) для ручной проверки,
+    без review непроверенными остаются только ответы без ссылок на источники
+    """
+    faq = faq or FAQ()
+    added = skipped = 0
+    for question in questions:
+        answer = await llm_client.generate_answer(question)
+        if not vet_answer(answer):
+            skipped += 1
+            logger.info(f"faq: ответ отклонен: {question}")
+            continue
+        if await faq.add(question, answer, vetted=not review and cites_sources(answer)):
+            added += 1
+    logger.info(f"faq: добавлено {added}, отклонено {skipped}, всего {len(faq)}, ждут проверки {len(faq.pending())}")
+    return faq
+
+
+async def main(args: argparse.Namespace) -> None:
+    bundle_dir = bundle.current()
+    content_hash = bundle_hash(bundle_dir)
+    if args.pending or args.approve is not None:
+        faq = await FAQ.load(content_hash=content_hash)
+        if args.approve is not None:
+            approved = faq.approve(args.approve or None)
+            faq.save()
+            logger.info(f"faq: одобрено {approved}")
+        for num, entry in faq.pending():
+            print(f"[{num}] {entry['question']}\n{entry['answer']}\n")
+        return
+
+    questions = questions_from_file(args.questions) if args.questions else []
+    if args.from_logs:
+        questions += questions_from_logs(top=args.top, min_count=args.min_count)
+    faq = await FAQ.load(content_hash=content_hash) if args.append else FAQ(content_hash=content_hash)
+    # Ответы по прошлой версии корпуса генерируются заново
+    stale = faq.drop_stale()
+    if stale:
+        logger.info(f"faq: {len(stale)} ответов устарели после пересборки индекса, генерируем заново")
+    questions = stale + questions
+
+    llm_client = llm.LLMClient(bundle_dir)
+    await llm_client.init()
+    faq = await build_faq(llm_client, questions, faq, review=args.review)
+    faq.save()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Подготовка ответов на частые вопросы")
+    arg_parser.add_argument("--questions", type=Path, default=None, help="txt или JSONL с вопросами")
+    arg_parser.add_argument("--from-logs", action="store_true", help="взять частые вопросы из логов")
+    arg_parser.add_argument("--top", type=int, default=100)
+    arg_parser.add_argument("--min-count", type=int, default=2)
+    arg_parser.add_argument("--append", action="store_true", help="дополнить существующую таблицу")
+    arg_parser.add_argument("--review", action="store_true", help="сохранить ответы как непроверенные")
+    arg_parser.add_argument("--pending", action="store_true", help="показать непроверенные ответы")
+    arg_parser.add_argument("--approve", type=int, nargs="*", default=None,
+                            help="одобрить ответы по номерам из --pending, без номеров — все")
+    asyncio.run(main(arg_parser.parse_args()))
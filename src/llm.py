@@ -1,10 +1,13 @@
+import asyncio
 import json
+from pathlib import Path
 from typing import Any
 
+import numpy as np
 from openai import OpenAI
 
 import config
-from src import rag
+from src import degrade, memory, metrics, rag, router
 
 
 logger = config.logging.getLogger(__name__)
@@ -43,40 +46,85 @@ base_prompt = """
 
 
 class LLMClient:
-    def __init__(self):
+    def __init__(self, bundle_dir: Path | None = None):
+        """bundle_dir: версия индекса (см. bundle), без нее — файлы из data/"""
         self.client: OpenAI = OpenAI(
             api_key=config.llm_token, 
             base_url=config.llm_url
         )
+        self.router: router.LLMRouter | None = router.create_router()
+        self.bundle_dir = bundle_dir
+        content_path = rag.CONTENT_PATH if bundle_dir is None else bundle_dir / "content.json"
         self.content: list[dict[str, Any]] = json.loads(
-            rag.CONTENT_PATH.read_text(encoding="utf-8")
+            content_path.read_text(encoding="utf-8")
         )
+        self.embeddings: np.ndarray | None = None
 
     async def init(self):
-        self.index = await rag.load_index()
-
-    async def build_prompt(self, user_question: str):
-        result_contents = await rag.retrieve(
+        if self.bundle_dir is None:
+            self.index = await rag.load_index()
+            self.embeddings = await rag.load_embeddings()
+            return
+        self.index = await rag.load_index(self.bundle_dir / "index.faiss")
+        self.embeddings = await rag.load_embeddings(self.bundle_dir / "embeddings.npy")
+
+    async def find_context(
+        self,
+        user_question: str,
+        history: list[memory.Turn] | None = None,
+        top_k: int = 2
+    ) -> list[dict[str, Any]]:
+        """Под нагрузкой (degrade.REDUCED) — вдвое меньше документов, без MMR и точного пересчета"""
+        query = memory.condense_query(user_question, history)
+        if degrade.shedder.level >= degrade.REDUCED:
+            return await rag.retrieve(self.index, self.content, query, top_k=max(1, top_k // 2))
+        return await rag.retrieve(
             self.index,
             self.content,
-            user_question,
-            top_k=2
+            query,
+            top_k=top_k,
+            embeddings=self.embeddings,
+            mmr_lambda=config.mmr_lambda,
+            per_url=config.per_url_cap
         )
-        context = '\n'.join([content["text"] for content in result_contents])
 
-        logger.info(f"question: {user_question}")
-        logger.info(f'context: {context}')
-
-        prompt = [
-            {"role": "system", "content": base_prompt},
-            {"role": "user", "content": user_question}
-        ]
+    async def build_prompt(
+        self,
+        user_question: str,
+        history: list[memory.Turn] | None = None
+    ):
+        result_contents = await self.find_context(user_question, history)
+        return self.build_messages(user_question, result_contents, history)
 
-        for content in result_contents:
-            prompt.append({
-                "role": "user", 
-                "content": f'Контент из источника {content["url"]}:\n{content["text"]}'
-            })
+    def build_messages(
+        self,
+        user_question: str,
+        result_contents: list[dict[str, Any]],
+        history: list[memory.Turn] | None = None,
+        log_question: bool = True
+    ) -> list[dict[str, str]]:
+        """
+        Промпт из уже найденного контекста.
+        log_question: строки "question: ..." — источник faq.questions_from_logs,
+        вопросы не от пользователей бота (пакетный прогон) туда не пишутся
+        """
+        with metrics.span("prompt_build"):
+            if log_question:
+                logger.info(f"question: {user_question}")
+            logger.info(f'context: {sum(len(content["text"]) for content in result_contents)} символов')
+            if config.payload_sampled():
+                logger.info(f'context payload: {[content["text"] for content in result_contents]}')
+
+            prompt = [{"role": "system", "content": base_prompt}]
+            for role, text in memory.trim_history(history, config.history_token_budget):
+                prompt.append({"role": role, "content": text})
+            prompt.append({"role": "user", "content": user_question})
+
+            for content in result_contents:
+                prompt.append({
+                    "role": "user", 
+                    "content": f'Контент из источника {content["url"]}:\n{content["text"]}'
+                })
             
         return prompt
 
@@ -85,24 +133,64 @@ class LLMClient:
         user_question: str,
         max_tokens: int = 300,
         temperature: float = 0.5,
-        top_p: float = 0.8
+        top_p: float = 0.8,
+        history: list[memory.Turn] | None = None
     ) -> str:
         """
         user_question:
+        history: прошлые реплики чата [(role, text), ...]
         max_tokens: максимальное количество токенов в ответе
         temperature: ближе к нулю - более детерминированные ответы, 1 (default) наиболее разнообразные
         top_p: Ограничение выбора токенов: 1=100% выборки, 0.5=50% выборки (больше фокуса)
         """
 
-        answer = self.client.chat.completions.create(
-            model="deepseek-chat",
-            messages=await self.build_prompt(user_question),
+        config.sample_payload()
+        shedder = degrade.shedder
+        shedder.update()
+        # Повторный самостоятельный вопрос под нагрузкой отвечается из кэша
+        standalone = memory.is_standalone(user_question, history)
+        answer = shedder.cached_answer(user_question) if standalone else None
+        if answer is not None:
+            return answer
+        if shedder.level >= degrade.LINKS:
+            return shedder.links_only(await self.find_context(user_question, history, top_k=6))
+
+        messages = await self.build_prompt(user_question, history)
+        answer = await self.complete(messages, max_tokens, temperature, top_p)
+        if standalone:
+            shedder.answers.put(user_question, answer)
+        return answer
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        max_tokens: int = 300,
+        temperature: float = 0.5,
+        top_p: float = 0.8
+    ) -> str:
+        """Запрос к LLM по готовому промпту и разбор JSON ответа в HTML"""
+        # Ответ не стримится, поэтому время до первого токена равно времени всего ответа
+        params = dict(
+            messages=messages,
             stream=False,
             temperature=round(temperature, 2),
             top_p=round(top_p, 2),
             max_tokens=max_tokens
         )
-        logger.info(f'answer: {answer}')
+        with metrics.span("llm"):
+            if self.router is not None:
+                answer = await self.router.create(**params)
+            else:
+                # Синхронный клиент не должен блокировать event loop
+                answer = await asyncio.to_thread(
+                    self.client.chat.completions.create,
+                    model=config.llm_model,
+                    **params
+                )
+        metrics.record_usage(getattr(answer, "usage", None))
+        logger.info(f'answer: {len(answer.choices[0].message.content or "")} символов')
+        if config.payload_sampled():
+            logger.info(f'answer payload: {answer.choices[0].message.content}')
 
         try:
             raw_content = answer.choices[0].message.content
@@ -0,0 +1,224 @@
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import config
+
+
+logger = config.logging.getLogger(__name__)
+
+
+SESSIONS_PATH = config.DATA_DIR / "sessions.sqlite"
+
+# (role, text) — роль "user" или "assistant"
+Turn = tuple[str, str]
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WORD_RE = re.compile(r"\w+")
+
+# Отсылки к прошлому ответу: местоимения и слова-связки
+_FOLLOW_UP_WORDS = frozenset({
+    "это", "этот", "эта", "эти", "этого", "этом", "этим", "этой",
+    "он", "она", "оно", "они", "его", "ее", "её", "их", "им", "ней", "нем", "нём",
+    "там", "тут", "тогда", "такой", "такие", "тот", "та", "те",
+    "а", "еще", "ещё", "подробнее",
+})
+# Вопрос только из таких слов ("почему?", "а сколько?") без истории не понять
+_QUESTION_WORDS = frozenset({
+    "сколько", "почему", "зачем", "как", "когда", "где", "что", "какой", "какая", "какие",
+    "и", "а", "ну", "так", "точно", "правда", "да", "нет",
+})
+
+
+def compact_text(text: str, max_chars: int) -> str:
+    """Убирает HTML и лишние пробелы, обрезает до max_chars"""
+    text = " ".join(_TAG_RE.sub("", text or "").split())
+    return text[:max_chars]
+
+
+def is_follow_up(question: str, max_words: int = 5) -> bool:
+    """
+    Уточняющий вопрос: отсылка в первых трех словах ("а сколько это стоило?")
+    или короткий вопрос с отсылкой либо из одних вопросительных слов ("почему?").
+    Короткий самостоятельный вопрос ("Сколько стоит чат-бот?") уточняющим не считается.
+    """
+    words = _WORD_RE.findall(question.lower())
+    if not words:
+        return False
+    if any(word in _FOLLOW_UP_WORDS for word in words[:3]):
+        return True
+    if len(words) > max_words:
+        return False
+    return (
+        any(word in _FOLLOW_UP_WORDS for word in words)
+        or all(word in _QUESTION_WORDS for word in words)
+    )
+
+
+def is_standalone(question: str, history: list[Turn] | None) -> bool:
+    """Вопрос понятен без истории: ему подходят FAQ и кэш готовых ответов"""
+    return not history or not is_follow_up(question)
+
+
+def condense_query(question: str, history: list[Turn] | None) -> str:
+    """
+    Запрос для поиска: уточняющий вопрос дополняется прошлым вопросом пользователя,
+    самостоятельный — ищется как есть
+    """
+    if is_standalone(question, history):
+        return question
+    for role, text in reversed(history):
+        if role == "user":
+            return f"{text} {question}"
+    return question
+
+
+def estimate_tokens(text: str) -> int:
+    # Для русского текста в среднем ~3 символа на токен
+    return len(text) // 3 + 1
+
+
+def trim_history(history: list[Turn] | None, token_budget: int) -> list[Turn]:
+    """Оставляет самые свежие реплики, укладывающиеся в бюджет токенов"""
+    result: list[Turn] = []
+    used = 0
+    for role, text in reversed(history or []):
+        used += estimate_tokens(text)
+        if used > token_budget:
+            break
+        result.append((role, text))
+    result.reverse()
+    return result
+
+
+class SessionStore:
+    """
+    История диалогов в памяти.
+    Чаты хранятся в порядке последнего обращения: вытеснение по max_chats
+    и очистка по TTL снимают самые старые записи с начала OrderedDict.
+    Реплики — кортежи обрезанных строк, поэтому память на чат ограничена
+    max_turns * max_chars.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = config.session_max_turns,
+        ttl: float = config.session_ttl,
+        max_chats: int = config.session_max_chats,
+        max_chars: int = 500
+    ):
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.max_chars = max_chars
+        self._sessions: OrderedDict[int, tuple[float, tuple[Turn, ...]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            chat_id, (updated, _) = next(iter(self._sessions.items()))
+            if now - updated <= self.ttl:
+                break
+            del self._sessions[chat_id]
+
+    def get(self, chat_id: int) -> list[Turn]:
+        now = time.monotonic()
+        self._expire(now)
+        session = self._sessions.get(chat_id)
+        if session is None:
+            return []
+        return list(session[1])
+
+    def append(self, chat_id: int, question: str, answer: str) -> None:
+        # max_turns <= 0 — история выключена (срез [-0:] вернул бы все реплики)
+        if self.max_turns <= 0:
+            return
+        now = time.monotonic()
+        self._expire(now)
+        _, turns = self._sessions.pop(chat_id, (now, ()))
+        turns = turns + (
+            ("user", compact_text(question, self.max_chars)),
+            ("assistant", compact_text(answer, self.max_chars)),
+        )
+        self._sessions[chat_id] = (now, turns[-self.max_turns * 2:])
+        while len(self._sessions) > self.max_chats:
+            self._sessions.popitem(last=False)
+
+    def clear(self, chat_id: int) -> None:
+        self._sessions.pop(chat_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    История диалогов в локальном SQLite: в памяти процесса ничего не копится,
+    история переживает перезапуск и доступна нескольким процессам на одной машине.
+    Запросы синхронные и выполняются прямо в обработчике: это вариант для
+    небольшой нагрузки. Каждый get/append — одна короткая транзакция
+    по первичному ключу, WAL с synchronous=NORMAL не делает fsync на каждую
+    запись, но при медленном диске event loop все равно ждет SQLite.
+    """
+
+    def __init__(self, path: Path = SESSIONS_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "chat_id INTEGER PRIMARY KEY, updated REAL NOT NULL, turns TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated)")
+        self._appends = 0
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _expire(self, now: float) -> None:
+        self.conn.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+
+    def get(self, chat_id: int) -> list[Turn]:
+        row = self.conn.execute(
+            "SELECT updated, turns FROM sessions WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return []
+        return [tuple(turn) for turn in json.loads(row[1])]
+
+    def append(self, chat_id: int, question: str, answer: str) -> None:
+        if self.max_turns <= 0:
+            return
+        now = time.time()
+        turns = self.get(chat_id) + [
+            ("user", compact_text(question, self.max_chars)),
+            ("assistant", compact_text(answer, self.max_chars)),
+        ]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sessions (chat_id, updated, turns) VALUES (?, ?, ?)",
+            (chat_id, now, json.dumps(turns[-self.max_turns * 2:], ensure_ascii=False))
+        )
+        self._expire(now)
+        # COUNT(*) проходит всю таблицу, поэтому лимит проверяется не на каждой записи
+        self._appends += 1
+        if self._appends % 256:
+            return
+        count = len(self)
+        if count > self.max_chats:
+            self.conn.execute(
+                "DELETE FROM sessions WHERE chat_id IN "
+                "(SELECT chat_id FROM sessions ORDER BY updated LIMIT ?)",
+                (count - self.max_chats,)
+            )
+
+    def clear(self, chat_id: int) -> None:
+        self.conn.execute("DELETE FROM sessions WHERE chat_id = ?", (chat_id,))
+
+
+def create_session_store() -> SessionStore:
+    if config.session_backend == "sqlite":
+        return SQLiteSessionStore()
+    return SessionStore()
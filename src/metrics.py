@@ -0,0 +1,229 @@
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import FrameType
+from typing import Callable, Iterator
+
+from aiohttp import web
+
+import config
+
+
+logger = config.logging.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Тайминги стадий текущего запроса (заполняются span-ами внутри request_timings)
+_timings: ContextVar[dict[str, float] | None] = ContextVar("timings", default=None)
+
+
+def _labels_str(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        if not config.metrics_enabled:
+            return
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + value
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_labels_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        if not config.metrics_enabled:
+            return
+        self.values[self._key(labels)] = value
+
+    def dec(self, value: float = 1.0, **labels: str) -> None:
+        self.inc(-value, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [счетчики по бакетам..., +Inf, sum]
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not config.metrics_enabled:
+            return
+        key = self._key(labels)
+        row = self.values.get(key)
+        if row is None:
+            row = self.values[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += 1
+        row[-1] += value
+
+    def count(self, **labels: str) -> int:
+        row = self.values.get(self._key(labels))
+        return int(row[-2]) if row else 0
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, row in self.values.items():
+            for bound, value in zip(self.buckets, row):
+                le = _labels_str(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {value}")
+            le = _labels_str(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {row[-2]}")
+            labels = _labels_str(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {row[-1]}")
+            lines.append(f"{self.name}_count{labels} {row[-2]}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+
+STAGE_SECONDS = Histogram(
+    "eora_stage_seconds",
+    "Длительность стадий обработки вопроса",
+    ("stage",)
+)
+LLM_TOKENS = Counter(
+    "eora_llm_tokens_total",
+    "Токены LLM по типу (prompt/completion)",
+    ("kind",)
+)
+CACHE_REQUESTS = Counter(
+    "eora_cache_requests_total",
+    "Обращения к кэшам по результату (hit/miss)",
+    ("cache", "result")
+)
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Подписчики на вход в стадию (профилировщик): hook(stage, frame) -> функция выхода или None
+stage_hooks: list[Callable[[str, FrameType], Callable[[], None] | None]] = []
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Замеряет стадию в гистограмму и в тайминги текущего запроса"""
+    exits = []
+    if stage_hooks:
+        # 0 — этот генератор, 1 — __enter__ контекстного менеджера, 2 — код со span
+        frame = sys._getframe(2)
+        exits = [hook(stage, frame) for hook in stage_hooks]
+    if not config.metrics_enabled:
+        try:
+            yield
+        finally:
+            for exit_hook in exits:
+                if exit_hook is not None:
+                    exit_hook()
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+        for exit_hook in exits:
+            if exit_hook is not None:
+                exit_hook()
+
+
+@contextmanager
+def request_timings() -> Iterator[dict[str, float]]:
+    """Собирает span-ы одного запроса и пишет их одной структурированной строкой"""
+    timings: dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+        if timings:
+            rounded = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+            logger.info(f"timings: {rounded}")
+
+
+def cache_hit(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_usage(usage) -> None:
+    """usage: объект usage из ответа OpenAI-совместимого API"""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, kind="completion")
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str | None = None, port: int | None = None) -> web.AppRunner:
+    host = host or config.metrics_host
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port or config.metrics_port)
+    await site.start()
+    logger.info(f"metrics: http://{host}:{port or config.metrics_port}/metrics")
+    return runner
@@ -1,26 +1,49 @@
 import asyncio
 import json
 import re
+from html.parser import HTMLParser
 
 import aiohttp
 from bs4 import BeautifulSoup
 
 NBSP = u'\xa0'
 
+LRM = '\u200e'
+# \s в str-шаблонах включает NBSP, отдельная замена не нужна
+_SPACES_RE = re.compile(r'\s+')
+
+# Служебные блоки страниц (согласие с политикой, форма обратной связи)
+SKIP_PHRASES = ("с нашей Политикой", "Напишите нам")
+
+
 def normalize(s: str) -> str:
-    _TRANSLATION_TABLE = {
-        NBSP: " ",
-        ord('\u200e'): None
-    }
-    s = (s or "").translate(_TRANSLATION_TABLE)
-    s = re.sub(r'\s+', ' ', s).strip()
-    return s
+    s = s or ""
+    if LRM in s:
+        s = s.replace(LRM, "")
+    return _SPACES_RE.sub(' ', s).strip()
+
 
 async def extract_tilda_content_html(html: str) -> list[str]:
+    return extract_tilda_blocks(html)
+
+
+def extract_tilda_blocks(html: str) -> list[str]:
     """
     Возвращает список текстовых блоков, начиная с первого <h1> (включая его)
     и до подвала <footer id="t-footer">, отфильтровав только элементы
     с data-elem-type="text" + сам заголовок.
+    Разбор потоковый, за один проход (см. TildaExtractor).
+    """
+    extractor = TildaExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.blocks()
+
+
+def extract_tilda_blocks_soup(html: str) -> list[str]:
+    """
+    Эталонная реализация extract_tilda_blocks на BeautifulSoup: строит
+    дерево всей страницы. Используется в тестах эквивалентности и в бенчмарке.
     """
     soup = BeautifulSoup(html, "html.parser")
 
@@ -56,24 +79,241 @@ async def extract_tilda_content_html(html: str) -> list[str]:
         if element.attrs.get("data-elem-type") == "text":
             atom = element.select_one(".tn-atom")
             text = normalize(atom.get_text(" ", strip=True) if atom else element.get_text(" ", strip=True))
-            if not text or "с нашей Политикой" in text or "Напишите нам" in text:
+            if not text or any(phrase in text for phrase in SKIP_PHRASES):
                 continue
             result.append(text)
 
     return result
 
 
-async def extract_content_url(url: str) -> list[str]:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                      "AppleWebKit/537.36 (KHTML, like Gecko) "
-                      "Chrome/124.0 Safari/537.36"
-    }
+# Теги без закрывающего тега (как в BeautifulSoup с html.parser)
+VOID_TAGS = frozenset({
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr",
+    "image", "img", "input", "isindex", "keygen", "link", "menuitem", "meta", "nextid",
+    "param", "source", "spacer", "track", "wbr",
+})
+# Текст внутри этих тегов BeautifulSoup не отдает в get_text() родителей
+STRING_CONTAINERS = frozenset({"script", "style", "template", "rt", "rp"})
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class _Block:
+    """Собираемый текст элемента: весь текст и текст первого .tn-atom внутри"""
+    __slots__ = ("kind", "parts", "atom", "atom_kind", "atom_open", "lookup_atom", "filtered")
+
+    def __init__(self, kind: str | None, lookup_atom: bool):
+        self.kind = kind
+        self.parts: list[str] = []
+        self.atom: list[str] | None = None
+        self.atom_kind: str | None = None
+        self.atom_open = False
+        self.lookup_atom = lookup_atom
+        self.filtered = lookup_atom
+
+    def text(self) -> str:
+        return normalize(" ".join(self.parts if self.atom is None else self.atom))
+
+
+class _Element:
+    __slots__ = ("name", "kind", "header", "blocks", "atoms", "scope")
+
+    def __init__(self, name: str, kind: str | None, header: bool):
+        self.name = name
+        self.kind = kind
+        self.header = header
+        # Блоки, которые открыл этот элемент, и блоки, для которых он .tn-atom
+        self.blocks: list[_Block] = []
+        self.atoms: list[_Block] = []
+        self.scope = False
+
+
+class TildaExtractor(HTMLParser):
+    """
+    Извлечение текста страницы Tilda за один проход токенизатора html.parser,
+    без дерева и CSS-селекторов. Повторяет extract_tilda_blocks_soup:
+    область — #allrecords (или вся страница), первый <h1> вне <header>,
+    затем элементы data-elem-type="text" (текст первого .tn-atom внутри
+    или всего элемента) до footer#t-footer. Вложенность тегов обрабатывается
+    как в BeautifulSoup с html.parser: без неявного закрытия, лишние
+    закрывающие теги игнорируются. Разбор останавливается, как только
+    после подвала закрыты все собираемые элементы.
+
+    Можно кормить страницу частями по мере загрузки: feed(chunk), close(), blocks().
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._stack: list[_Element] = []
+        self._containers: list[str] = []
+        self._headers = 0
+        self._pending: list[str] = []
+        self._stopped = False
+        self._scope_found = False
+        self._reset_scope()
+
+    def _reset_scope(self) -> None:
+        self._h1: _Block | None = None
+        self._slots: list[_Block] = []
+        self._open: list[_Block] = []
+        self._after_h1 = False
+        self._footer = False
 
+    def feed(self, data: str) -> None:
+        if self._stopped:
+            return
+        try:
+            super().feed(data)
+        except _StopParsing:
+            self._stopped = True
+
+    def close(self) -> None:
+        if self._stopped:
+            return
+        try:
+            super().close()
+            self._flush()
+        except _StopParsing:
+            pass
+        self._stopped = True
+
+    def blocks(self) -> list[str]:
+        if self._h1 is None:
+            return []
+        result = []
+        for block in self._slots:
+            text = block.text()
+            if not text or block.filtered and any(phrase in text for phrase in SKIP_PHRASES):
+                continue
+            result.append(text)
+        return result
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        data = "".join(self._pending) if len(self._pending) > 1 else self._pending[0]
+        self._pending.clear()
+        self._route(data, self._containers[-1] if self._containers else None)
+
+    def _route(self, data: str, kind: str | None) -> None:
+        for block in self._open:
+            if kind == block.kind:
+                block.parts.append(data)
+            if block.atom_open and kind == block.atom_kind:
+                block.atom.append(data)
+
+    def handle_data(self, data: str) -> None:
+        # html.parser может отдать один текстовый узел несколькими вызовами
+        self._pending.append(data)
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self._flush()
+        kind = tag if tag in STRING_CONTAINERS else None
+        element = _Element(tag, kind, tag == "header")
+        attrs_dict = dict(attrs)
+
+        if not self._scope_found and attrs_dict.get("id") == "allrecords":
+            # Все, что было до #allrecords, не считается
+            self._scope_found = True
+            element.scope = True
+            self._reset_scope()
+        else:
+            self._start_in_scope(tag, element, attrs_dict)
+
+        if tag in VOID_TAGS:
+            self._end(element)
+            return
+        self._stack.append(element)
+        if kind is not None:
+            self._containers.append(kind)
+        if element.header:
+            self._headers += 1
+
+    def _start_in_scope(self, tag: str, element: _Element, attrs: dict[str, str | None]) -> None:
+        classes = attrs.get("class")
+        if classes and "tn-atom" in classes.split():
+            for block in self._open:
+                if block.lookup_atom and block.atom is None:
+                    block.atom = []
+                    block.atom_kind = element.kind
+                    block.atom_open = True
+                    element.atoms.append(block)
+
+        if not self._footer and tag == "footer" and attrs.get("id") == "t-footer":
+            self._footer = True
+            self._after_h1 = False
+        if self._h1 is None and tag == "h1" and not self._headers:
+            # Подвал до заголовка: остается только сам заголовок
+            block = self._h1 = _Block(element.kind, lookup_atom=False)
+            self._after_h1 = not self._footer
+        elif self._after_h1 and attrs.get("data-elem-type") == "text":
+            block = _Block(element.kind, lookup_atom=True)
+        else:
+            return
+        self._slots.append(block)
+        self._open.append(block)
+        element.blocks.append(block)
+
+    def handle_endtag(self, tag: str) -> None:
+        self._flush()
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i].name == tag:
+                break
+        else:
+            return
+        while len(self._stack) > i:
+            element = self._stack.pop()
+            if element.kind is not None:
+                self._containers.pop()
+            if element.header:
+                self._headers -= 1
+            self._end(element)
+
+    def _end(self, element: _Element) -> None:
+        for block in element.atoms:
+            block.atom_open = False
+        for block in element.blocks:
+            self._open.remove(block)
+        # Дальше #allrecords и после подвала (когда все собрано) читать нечего
+        if element.scope or self._scope_found and self._footer and self._h1 is not None and not self._open:
+            raise _StopParsing
+
+    def handle_comment(self, data: str) -> None:
+        self._flush()
+
+    def handle_decl(self, decl: str) -> None:
+        self._flush()
+
+    def handle_pi(self, data: str) -> None:
+        self._flush()
+
+    def unknown_decl(self, data: str) -> None:
+        self._flush()
+        if data.upper().startswith("CDATA["):
+            # CDATA — отдельный текстовый узел, считается в get_text() любого тега
+            self._route(data[len("CDATA["):], None)
+
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                  "AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/124.0 Safari/537.36"
+}
+
+
+async def fetch_html(session: aiohttp.ClientSession, url: str) -> str:
+    async with session.get(url, headers=HEADERS) as response:
+        response.raise_for_status()
+        return await response.text()
+
+
+async def extract_content_url(url: str) -> list[str]:
     async with aiohttp.request(
         "GET",
         url=url,
-        headers=headers
+        headers=HEADERS
     ) as response:
         response.raise_for_status()
         html = await response.text()
@@ -0,0 +1,382 @@
+"""
+Потоковая сборка индекса: загрузка → извлечение текста → чанки →
+эмбеддинги порциями → добавление в FAISS.
+
+    python -m src.pipeline --fetch-concurrency 8 --batch-size 64
+
+Стадии связаны ограниченными очередями, поэтому эмбеддинги считаются,
+пока страницы еще скачиваются, а в памяти одновременно находится не больше
+queue_size страниц и одной порции векторов. content.json пишется на диск
+по мере добавления векторов, порядок записей совпадает с id в индексе.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+import aiohttp
+import faiss
+import numpy as np
+
+import config
+from src import parser, rag
+
+
+logger = config.logging.getLogger(__name__)
+
+
+LINKS_PATH = config.DATA_DIR / "links.json"
+
+# Конец потока: каждая стадия передает его дальше после своих данных
+_DONE = object()
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+
+    @contextmanager
+    def track(self, items: int = 1) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        self.busy += time.perf_counter() - start
+        self.items += items
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy, 3),
+            "items_per_sec": round(self.items / self.busy, 2) if self.busy else 0.0,
+        }
+
+
+def split_chunks(blocks: list[str], chunk_chars: int | None = None) -> list[str]:
+    """
+    Склеивает текстовые блоки страницы в чанки до chunk_chars символов.
+    Без chunk_chars вся страница — один чанк, как в content.json от parser.main.
+    Блок длиннее chunk_chars остается отдельным чанком целиком.
+    """
+    if not blocks:
+        return []
+    if not chunk_chars:
+        return ["\n\n".join(blocks)]
+
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for block in blocks:
+        if current and size + len(block) > chunk_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(block)
+        size += len(block) + 2
+    chunks.append("\n\n".join(current))
+    return chunks
+
+
+class ContentWriter:
+    """JSON-массив записей, дописываемый на диск по одной"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp_path = path.with_name(path.name + ".tmp")
+        self.file = open(self.tmp_path, "w", encoding="utf-8")
+        self.file.write("[")
+        self.count = 0
+
+    def write(self, record: dict[str, Any]) -> None:
+        self.file.write(",\n    " if self.count else "\n    ")
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.count += 1
+
+    def close(self, commit: bool = True) -> None:
+        """commit=False — сборка упала, прежний content.json не трогаем"""
+        self.file.write("\n]\n")
+        self.file.close()
+        if commit:
+            os.replace(self.tmp_path, self.path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+
+
+class IndexWriter:
+    """
+    Наполняет индекс порциями.
+    Сжатым индексам нужно обучение: первые train_size векторов копятся
+    в буфере, на них индекс обучается, дальше векторы добавляются сразу.
+    Полноточные векторы для rescore пишутся в сырой файл и в конце
+    переупаковываются в .npy без загрузки в память целиком.
+    Индекс и .npy пишутся во временные файлы и переименовываются в конце finish.
+    """
+
+    def __init__(
+        self,
+        index_type: str = config.index_type,
+        train_size: int = 4096,
+        embeddings_path: Path = rag.EMBEDDINGS_PATH
+    ):
+        if index_type not in rag.INDEX_TYPES:
+            raise ValueError(f"Неизвестный тип индекса: {index_type}")
+        self.index_type = index_type
+        self.train_size = train_size
+        self.embeddings_path = embeddings_path
+        self.raw_path = embeddings_path.with_suffix(".f32")
+        self.raw_file = open(self.raw_path, "wb") if index_type != "flat" else None
+        self.index: faiss.Index | None = None
+        self.buffer: list[np.ndarray] = []
+        self.buffered = 0
+        self.dim: int | None = None
+        self.tmp_paths: list[Path] = []
+
+    @property
+    def ntotal(self) -> int:
+        return (self.index.ntotal if self.index is not None else 0) + self.buffered
+
+    def add(self, embs: np.ndarray) -> None:
+        self.dim = embs.shape[1]
+        if self.raw_file is not None:
+            self.raw_file.write(np.ascontiguousarray(embs, dtype=np.float32).tobytes())
+        if self.index is not None:
+            self.index.add(embs)
+        elif self.index_type == "flat":
+            self.index = faiss.IndexFlatIP(self.dim)
+            self.index.add(embs)
+        else:
+            self.buffer.append(embs)
+            self.buffered += len(embs)
+            if self.buffered >= self.train_size:
+                self._train()
+
+    def _train(self) -> None:
+        self.index = rag.make_index(np.concatenate(self.buffer), self.index_type)
+        self.buffer, self.buffered = [], 0
+
+    def abort(self) -> None:
+        if self.raw_file is not None:
+            self.raw_file.close()
+            self.raw_path.unlink(missing_ok=True)
+        for path in self.tmp_paths:
+            path.unlink(missing_ok=True)
+
+    def _tmp_path(self, path: Path) -> Path:
+        tmp_path = path.with_name(path.name + ".tmp")
+        self.tmp_paths.append(tmp_path)
+        return tmp_path
+
+    def finish(self, index_path: Path = rag.INDEX_PATH) -> faiss.Index:
+        """При ошибке прежние файлы не тронуты, временные убирает abort"""
+        if self.buffer:
+            self._train()
+        if self.index is None:
+            raise ValueError("Нет ни одного вектора для индекса")
+        index_tmp = self._tmp_path(index_path)
+        faiss.write_index(self.index, str(index_tmp))
+
+        if self.raw_file is None:
+            os.replace(index_tmp, index_path)
+            self.embeddings_path.unlink(missing_ok=True)
+            return self.index
+        self.raw_file.close()
+        embeddings_tmp = self._tmp_path(self.embeddings_path)
+        raw = np.memmap(self.raw_path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+        out = np.lib.format.open_memmap(
+            embeddings_tmp, mode="w+", dtype=np.float32, shape=raw.shape
+        )
+        for start in range(0, len(raw), 65536):
+            out[start:start + 65536] = raw[start:start + 65536]
+        out.flush()
+        del raw, out
+        os.replace(embeddings_tmp, self.embeddings_path)
+        os.replace(index_tmp, index_path)
+        self.raw_path.unlink()
+        return self.index
+
+
+async def build(
+    links: list[str] | None = None,
+    content_path: Path = rag.CONTENT_PATH,
+    index_path: Path = rag.INDEX_PATH,
+    index_type: str = config.index_type,
+    fetch_concurrency: int = 8,
+    batch_size: int = 64,
+    queue_size: int = 32,
+    chunk_chars: int | None = None,
+    progress_every: float = 5.0,
+    fetch_html=None,
+    records: list[dict[str, Any]] | None = None
+) -> dict[str, Any]:
+    """
+    Собирает content.json и индекс из списка ссылок (по умолчанию data/links.json).
+    fetch_html(session, url): загрузчик страницы, по умолчанию parser.fetch_html
+    records: готовые записи content.json — сайт не обходится, записи идут
+    сразу в стадии эмбеддингов и индекса теми же порциями
+    """
+    if records is not None:
+        links = []
+        stage_names: tuple[str, ...] = ("read", "embed", "add")
+    else:
+        if links is None:
+            links = json.loads(LINKS_PATH.read_text(encoding="utf-8"))
+        stage_names = ("fetch", "extract", "chunk", "embed", "add")
+    fetch_html = fetch_html or parser.fetch_html
+
+    stats = {name: StageStats(name) for name in stage_names}
+    urls: asyncio.Queue = asyncio.Queue()
+    for url in links:
+        urls.put_nowait(url)
+    pages: asyncio.Queue = asyncio.Queue(queue_size)
+    blocks: asyncio.Queue = asyncio.Queue(queue_size)
+    chunks: asyncio.Queue = asyncio.Queue(batch_size * 2)
+    batches: asyncio.Queue = asyncio.Queue(2)
+    queues = {"pages": pages, "blocks": blocks, "chunks": chunks, "batches": batches}
+
+    content_writer = ContentWriter(content_path)
+    index_writer = IndexWriter(index_type, embeddings_path=index_path.parent / rag.EMBEDDINGS_PATH.name)
+
+    async def fetch_worker(session: aiohttp.ClientSession) -> None:
+        while True:
+            try:
+                url = urls.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                with stats["fetch"].track():
+                    html = await fetch_html(session, url)
+            except Exception as e:
+                stats["fetch"].errors += 1
+                logger.info(f"pipeline: не удалось скачать {url}: {e!r}")
+                continue
+            await pages.put((url, html))
+
+    async def fetch() -> None:
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(fetch_worker(session) for _ in range(fetch_concurrency)))
+        await pages.put(_DONE)
+
+    async def extract() -> None:
+        while (item := await pages.get()) is not _DONE:
+            url, html = item
+            try:
+                with stats["extract"].track():
+                    # Разбор HTML — чистый CPU, в потоке он не блокирует загрузку
+                    page_blocks = await asyncio.to_thread(parser.extract_tilda_blocks, html)
+            except Exception as e:
+                stats["extract"].errors += 1
+                logger.info(f"pipeline: не удалось разобрать {url}: {e!r}")
+                continue
+            await blocks.put((url, page_blocks))
+        await blocks.put(_DONE)
+
+    async def chunk() -> None:
+        while (item := await blocks.get()) is not _DONE:
+            url, page_blocks = item
+            with stats["chunk"].track():
+                texts = split_chunks(page_blocks, chunk_chars)
+            for text in texts:
+                await chunks.put({"url": url, "text": text})
+        await chunks.put(_DONE)
+
+    async def read() -> None:
+        for record in records:
+            stats["read"].items += 1
+            await chunks.put(record)
+        await chunks.put(_DONE)
+
+    async def embed() -> None:
+        batch: list[dict[str, Any]] = []
+
+        async def flush() -> None:
+            with stats["embed"].track(len(batch)):
+                embs = await rag.to_embeddings([record["text"] for record in batch])
+            await batches.put((batch, embs))
+
+        while (item := await chunks.get()) is not _DONE:
+            batch.append(item)
+            if len(batch) == batch_size:
+                await flush()
+                batch = []
+        if batch:
+            await flush()
+        await batches.put(_DONE)
+
+    async def add() -> None:
+        while (item := await batches.get()) is not _DONE:
+            records, embs = item
+            with stats["add"].track(len(records)):
+                for record in records:
+                    content_writer.write(record)
+                # Добавление в FAISS (и обучение сжатого индекса) — CPU, loop не держим
+                await asyncio.to_thread(index_writer.add, embs)
+
+    async def progress() -> None:
+        while True:
+            await asyncio.sleep(progress_every)
+            log_progress()
+
+    def log_progress() -> None:
+        elapsed = time.perf_counter() - start
+        done = ", ".join(
+            f"{name} {stage.items} ({stage.items / elapsed:.1f}/с)" for name, stage in stats.items()
+        )
+        depth = ", ".join(f"{name} {queue.qsize()}" for name, queue in queues.items())
+        logger.info(f"pipeline: {done}; очереди: {depth}")
+
+    start = time.perf_counter()
+    reporter = asyncio.create_task(progress())
+    stages = (read, embed, add) if records is not None else (fetch, extract, chunk, embed, add)
+    tasks = [asyncio.create_task(stage()) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+        if not content_writer.count:
+            # Пустой обход не должен заменить рабочий content.json
+            raise ValueError("Нет ни одного вектора для индекса")
+        log_progress()
+        # content.json заменяется последним: индекс без своего content не останется
+        await asyncio.to_thread(index_writer.finish, index_path)
+    except BaseException:
+        content_writer.close(commit=False)
+        index_writer.abort()
+        raise
+    else:
+        content_writer.close()
+    finally:
+        # Если одна стадия упала, остальные иначе навсегда повиснут на очередях
+        for task in tasks + [reporter]:
+            task.cancel()
+
+    report = {
+        "pages": len(links) if records is None else len({record["url"] for record in records}),
+        "chunks": content_writer.count,
+        "index_type": index_type,
+        "seconds": round(time.perf_counter() - start, 2),
+        "stages": {name: stage.report() for name, stage in stats.items()},
+    }
+    logger.info(f"pipeline: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Потоковая сборка content.json и индекса")
+    arg_parser.add_argument("--links", type=Path, default=LINKS_PATH)
+    arg_parser.add_argument("--index-type", choices=rag.INDEX_TYPES, default=config.index_type)
+    arg_parser.add_argument("--fetch-concurrency", type=int, default=8)
+    arg_parser.add_argument("--batch-size", type=int, default=64)
+    arg_parser.add_argument("--queue-size", type=int, default=32)
+    arg_parser.add_argument("--chunk-chars", type=int, default=None, help="по умолчанию страница целиком")
+    args = arg_parser.parse_args()
+    print(json.dumps(asyncio.run(build(
+        json.loads(args.links.read_text(encoding="utf-8")),
+        index_type=args.index_type,
+        fetch_concurrency=args.fetch_concurrency,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        chunk_chars=args.chunk_chars
+    )), ensure_ascii=False, indent=4))
@@ -0,0 +1,314 @@
+"""
+Профилирование по запросу (PROFILE_RATE > 0).
+
+Сэмплирующий профилировщик: фоновый поток раз в PROFILE_INTERVAL снимает
+стеки потоков через sys._current_frames(), пока идет хотя бы один
+отобранный запрос. Код запроса не инструментируется, поэтому накладные
+расходы не зависят от глубины вызовов, а неотобранные запросы платят
+только за проверку ContextVar в metrics.span.
+
+Каждый сэмпл относится к стадии (metrics.span): в потоке event loop —
+по кадру, открывшему span, в пуле потоков (asyncio.to_thread) — по
+стадии из contextvars.Context задачи. Результат пишется в формате
+collapsed stacks ("стадия;функция;функция N"), который понимают
+flamegraph.pl, speedscope и inferno. Файл пишется раз в
+PROFILE_DUMP_INTERVAL, при PROFILE_MAX_STACKS разных стеках в памяти
+и при остановке — накопленное не теряется при падении и не растет без предела.
+
+LoopLagMonitor отдельно следит за event loop: если heartbeat не
+отрабатывает дольше LOOP_LAG_THRESHOLD, в лог пишется стек кода,
+который держит loop.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Callable, Iterator
+
+import config
+from src import metrics
+
+
+logger = config.logging.getLogger(__name__)
+
+
+PROFILES_DIR = config.DATA_DIR / "profiles"
+# Стадия для сэмплов отобранного запроса вне span-ов
+UNATTRIBUTED = "other"
+# Event loop ждет сеть (select/epoll) — запросы в это время ждут ответа LLM/Telegram
+IDLE = "idle"
+
+LOOP_LAG = metrics.Histogram(
+    "eora_event_loop_lag_seconds",
+    "Задержка heartbeat event loop относительно расписания",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+LOOP_BLOCKS = metrics.Counter(
+    "eora_event_loop_blocked_total",
+    "Блокировки event loop дольше порога"
+)
+
+# Отобран ли текущий запрос и стек его стадий (виден и в asyncio.to_thread)
+_profiled: ContextVar[bool] = ContextVar("profiled", default=False)
+_stages: ContextVar[tuple[str, ...]] = ContextVar("profile_stages", default=())
+
+_WORKER_FILE = os.path.join("concurrent", "futures", "thread.py")
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _worker_context(frame: FrameType) -> Context | None:
+    """Context задачи пула потоков: _WorkItem.run -> partial(context.run, func)"""
+    while frame is not None:
+        if frame.f_code.co_name == "run" and frame.f_code.co_filename.endswith(_WORKER_FILE):
+            work_item = frame.f_locals.get("self")
+            runner = getattr(getattr(work_item, "fn", None), "func", None)
+            context = getattr(runner, "__self__", None)
+            return context if isinstance(context, Context) else None
+        frame = frame.f_back
+    return None
+
+
+class Profiler:
+    def __init__(
+        self,
+        rate: float = 0.0,
+        interval: float = 0.005,
+        output_dir: Path = PROFILES_DIR,
+        dump_interval: float = 300.0,
+        max_stacks: int = 10000
+    ):
+        """
+        dump_interval: как часто сбрасывать сэмплы в файл, сек (0 — только при остановке)
+        max_stacks: разных стеков в памяти, при достижении сэмплы сбрасываются сразу
+        """
+        self.rate = rate
+        self.interval = interval
+        self.output_dir = output_dir
+        self.dump_interval = dump_interval
+        self.max_stacks = max_stacks
+        # Свернутый стек (от корня) -> число сэмплов
+        self.samples: Counter[str] = Counter()
+        self.requests = 0
+        # id кадра, открывшего span отобранного запроса -> вложенные стадии этого кадра
+        self._frames: dict[int, list[str]] = {}
+        self._active = 0
+        self._loop_thread: int | None = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        metrics.stage_hooks.append(self._enter_stage)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"profiling: отбираем {self.rate:.1%} запросов, интервал {self.interval * 1000:.0f} мс")
+
+    def stop(self) -> Path | None:
+        if self._thread is None:
+            return None
+        metrics.stage_hooks.remove(self._enter_stage)
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        return self.dump()
+
+    @contextmanager
+    def request(self) -> Iterator[bool]:
+        """Отбирает запрос с вероятностью rate, пока он идет — сэмплер работает"""
+        if self._thread is None or random.random() >= self.rate:
+            yield False
+            return
+        token = _profiled.set(True)
+        with self._lock:
+            self._loop_thread = threading.get_ident()
+            self._active += 1
+            self.requests += 1
+            self._wake.set()
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self._active -= 1
+                if not self._active:
+                    self._wake.clear()
+            _profiled.reset(token)
+
+    def _enter_stage(self, stage: str, frame: FrameType) -> Callable[[], None] | None:
+        if not _profiled.get():
+            return None
+        token = _stages.set(_stages.get() + (stage,))
+        key = id(frame)
+        self._frames.setdefault(key, []).append(stage)
+
+        def exit_stage() -> None:
+            stages = self._frames[key]
+            stages.pop()
+            if not stages:
+                del self._frames[key]
+            _stages.reset(token)
+
+        return exit_stage
+
+    def _stage_of(self, stack: list[FrameType], thread_id: int) -> str | None:
+        """Стадия сэмпла или None, если поток не работает на отобранный запрос"""
+        if thread_id == self._loop_thread:
+            # Самый вложенный кадр со span-ом; кадры без span-ов — чужой код на loop
+            for frame in stack:
+                stages = self._frames.get(id(frame))
+                if stages:
+                    return stages[-1]
+            if stack and stack[0].f_code.co_filename.endswith("selectors.py"):
+                return IDLE
+            return UNATTRIBUTED
+        context = _worker_context(stack[0]) if stack else None
+        if context is None or not context.get(_profiled, False):
+            return None
+        stages = context.get(_stages, ())
+        return stages[-1] if stages else UNATTRIBUTED
+
+    def sample(self) -> None:
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame)
+                frame = frame.f_back
+            stage = self._stage_of(stack, thread_id)
+            if stage is None:
+                continue
+            self.samples[";".join([stage, *map(_frame_label, reversed(stack))])] += 1
+
+    def _run(self) -> None:
+        # Сэмплы пишет и сбрасывает только этот поток, блокировка не нужна
+        next_dump = time.monotonic() + self.dump_interval
+        while not self._stopped.is_set():
+            sampling = self._wake.wait(self.dump_interval if self.dump_interval > 0 else None)
+            if self._stopped.is_set():
+                break
+            if sampling:
+                self.sample()
+            due = self.dump_interval > 0 and time.monotonic() >= next_dump
+            if due or len(self.samples) >= self.max_stacks:
+                self.dump()
+                next_dump = time.monotonic() + self.dump_interval
+            if sampling:
+                time.sleep(self.interval)
+
+    def stage_seconds(self, samples: Counter[str] | None = None) -> dict[str, float]:
+        """Оценка времени по стадиям: число сэмплов * интервал"""
+        totals: Counter[str] = Counter()
+        for stack, count in (self.samples if samples is None else samples).items():
+            totals[stack.split(";", 1)[0]] += count
+        return {stage: round(count * self.interval, 3) for stage, count in totals.most_common()}
+
+    def dump(self, path: Path | None = None) -> Path | None:
+        """Пишет накопленные сэмплы в .folded (collapsed stacks) и сбрасывает их"""
+        if not self.samples:
+            return None
+        if path is None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            path = self.output_dir / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.folded"
+        samples, self.samples = self.samples, Counter()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in samples.items():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"profiling: {self.requests} запросов, {sum(samples.values())} сэмплов, "
+                    f"стадии (с): {self.stage_seconds(samples)} -> {path}")
+        self.requests = 0
+        return path
+
+
+class LoopLagMonitor:
+    """
+    Heartbeat-задача раз в interval отмечается в event loop и пишет задержку
+    в гистограмму. Watchdog-поток проверяет отметку: если loop не отвечает
+    дольше threshold, логирует стек потока loop — это и есть блокирующий callback.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.blocks = 0
+        self._beat = time.monotonic()
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.threshold <= 0 or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"loop lag: порог {self.threshold * 1000:.0f} мс")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._watchdog.join()
+        self._task = self._watchdog = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            LOOP_LAG.observe(max(0.0, now - expected))
+            self._beat = now
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(min(self.threshold / 2, self.interval)):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked <= self.threshold or reported == beat:
+                continue
+            # Одна запись на одну блокировку
+            reported = beat
+            self.blocks += 1
+            LOOP_BLOCKS.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            logger.warning(f"loop lag: event loop заблокирован {blocked * 1000:.0f} мс, стек:\n{stack}")
+
+
+profiler = Profiler(
+    config.profile_rate,
+    config.profile_interval,
+    dump_interval=config.profile_dump_interval,
+    max_stacks=config.profile_max_stacks
+)
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import json
 from pathlib import Path
@@ -7,7 +8,8 @@ import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
-from config import DATA_DIR, logging
+from config import DATA_DIR, index_type as default_index_type, logging
+from src import embed_cache, metrics
 
 
 logger = logging.getLogger(__name__)
@@ -15,9 +17,17 @@ logger = logging.getLogger(__name__)
 
 INDEX_PATH = DATA_DIR / "index.faiss"
 CONTENT_PATH = DATA_DIR / "content.json"
+EMBEDDINGS_PATH = DATA_DIR / "embeddings.npy"
 
+# flat — исходные float32, fp16 — в 2 раза меньше, sq8 — в 4 раза, pq — в dim/pq_m*4 раз
+INDEX_TYPES = ("flat", "fp16", "sq8", "pq")
 
-_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+_model = SentenceTransformer(MODEL_NAME)
+
+query_cache = embed_cache.create_embedding_cache(MODEL_NAME)
 
 
 async def to_embeddings(texts: list[str]) -> np.ndarray:
@@ -31,16 +41,63 @@ async def to_embeddings(texts: list[str]) -> np.ndarray:
     return embs.astype(np.float32)
 
 
-async def build_index(content_path: Path = CONTENT_PATH) -> None:
+async def embed_queries(queries: list[str]) -> np.ndarray:
+    """Эмбеддинги поисковых запросов через кэш (см. embed_cache)"""
+    if query_cache is None:
+        return await to_embeddings(queries)
+    return await query_cache.embed(queries, to_embeddings)
+
+
+def make_index(embs: np.ndarray, index_type: str = "flat", pq_m: int = 48) -> faiss.Index:
+    """
+    Создает и наполняет индекс с нужным способом хранения векторов.
+    pq_m: количество подвекторов для PQ (должно делить размерность)
+    """
+    dim = embs.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "fp16":
+        index = faiss.IndexScalarQuantizer(
+            dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+        )
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(
+            dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+    elif index_type == "pq":
+        # 2**nbits центроидов не может быть больше числа обучающих векторов
+        nbits = max(1, min(8, int(np.log2(max(len(embs), 2)))))
+        index = faiss.IndexPQ(dim, pq_m, nbits, faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"Неизвестный тип индекса: {index_type}")
+
+    if not index.is_trained:
+        index.train(embs)
+    index.add(embs)
+    return index
+
+
+async def build_index(
+    content_path: Path = CONTENT_PATH,
+    index_type: str = default_index_type,
+    index_path: Path | None = None,
+    embeddings_path: Path | None = None
+) -> None:
     content = json.loads(content_path.read_text(encoding="utf-8"))
     texts = [it["text"] for it in content]
 
     embs = await to_embeddings(texts)
-    index = faiss.IndexFlatIP(embs.shape[1])
-    index.add(embs)
+    index = make_index(embs, index_type)
 
-    faiss.write_index(index, str(INDEX_PATH))
-    logger.info('embedding_index создан')
+    index_path = index_path or INDEX_PATH
+    embeddings_path = embeddings_path or EMBEDDINGS_PATH
+    faiss.write_index(index, str(index_path))
+    # Полноточные векторы нужны только для пересчета скоров у сжатых индексов
+    if index_type == "flat":
+        embeddings_path.unlink(missing_ok=True)
+    else:
+        np.save(embeddings_path, embs)
+    logger.info(f'embedding_index создан ({index_type})')
 
 
 async def load_index(index_path: Path = INDEX_PATH) -> faiss.Index:
@@ -48,21 +105,352 @@ async def load_index(index_path: Path = INDEX_PATH) -> faiss.Index:
     return index
 
 
+async def load_embeddings(embeddings_path: Path = EMBEDDINGS_PATH) -> np.ndarray | None:
+    """Полноточные векторы через mmap: в RAM попадают только нужные строки"""
+    if not embeddings_path.exists():
+        return None
+    return await asyncio.to_thread(np.load, str(embeddings_path), mmap_mode="r")
+
+
+def rescore(
+    embeddings: np.ndarray,
+    query_emb: np.ndarray,
+    ids: np.ndarray,
+    top_k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Точный пересчет скоров кандидатов по float32 векторам"""
+    # Сортировка id — последовательное чтение из mmap
+    ids = np.sort(ids[ids >= 0])
+    scores = np.asarray(embeddings[ids], dtype=np.float32) @ query_emb[0]
+    order = np.argsort(-scores)[:top_k]
+    return scores[order], ids[order]
+
+
+async def search(
+    index: faiss.Index,
+    query_embs: np.ndarray,
+    top_k: int,
+    embeddings: np.ndarray | None = None,
+    rescore_factor: int = 4
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Поиск сразу по всем запросам (n, dim) -> scores, ids формы (n, top_k).
+    embeddings: полноточные векторы, если переданы — из индекса берется
+    top_k * rescore_factor кандидатов и скоры пересчитываются точно
+    """
+    if embeddings is None:
+        return await asyncio.to_thread(index.search, query_embs, top_k)
+
+    _, cand_ids = await asyncio.to_thread(index.search, query_embs, top_k * rescore_factor)
+    scores = np.full((len(query_embs), top_k), -np.inf, dtype=np.float32)
+    ids = np.full((len(query_embs), top_k), -1, dtype=np.int64)
+    for row, (query_emb, cand_row) in enumerate(zip(query_embs, cand_ids)):
+        row_scores, row_ids = rescore(embeddings, query_emb[None, :], cand_row, top_k)
+        scores[row, :len(row_ids)] = row_scores
+        ids[row, :len(row_ids)] = row_ids
+    return scores, ids
+
+
+def doc_groups(content: list[dict[str, Any]]) -> np.ndarray:
+    """Номер URL для каждого документа: чанки одной страницы получают один номер"""
+    codes: dict[str, int] = {}
+    return np.array([codes.setdefault(item["url"], len(codes)) for item in content], dtype=np.int64)
+
+
+def select(
+    scores: np.ndarray,
+    ids: np.ndarray,
+    min_score: float | None,
+    top_k: int,
+    groups: np.ndarray | None = None
+) -> list[np.ndarray]:
+    """
+    Отбор результатов поиска (n, k) без цикла по элементам: пустые слоты
+    и скоры ниже min_score отбрасываются, с groups из одной группы (URL)
+    остается только лучший документ, в каждой строке — не больше top_k.
+    Строки должны быть отсортированы по убыванию скора, как их отдает FAISS.
+    """
+    valid = ids >= 0
+    if min_score is not None:
+        valid &= scores >= min_score
+    if groups is not None and ids.size:
+        n, k = ids.shape
+        row_groups = np.where(valid, groups[np.where(valid, ids, 0)], -1).ravel()
+        rows = np.repeat(np.arange(n), k)
+        positions = np.tile(np.arange(k), n)
+        order = np.lexsort((positions, row_groups, rows))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (
+            (rows[order][1:] != rows[order][:-1])
+            | (row_groups[order][1:] != row_groups[order][:-1])
+        )
+        duplicate = np.ones(n * k, dtype=bool)
+        duplicate[order[first]] = False
+        valid &= ~duplicate.reshape(n, k)
+    valid &= np.cumsum(valid, axis=1) <= top_k
+    return [row_ids[row_valid] for row_ids, row_valid in zip(ids, valid)]
+
+
+def collect(
+    content: list[dict[str, Any]],
+    scores: np.ndarray,
+    ids: np.ndarray,
+    min_score: float | None
+) -> list[dict[str, Any]]:
+    """Документы одной строки результатов поиска"""
+    keep = select(scores[None, :], ids[None, :], min_score, len(ids))[0]
+    return [{"url": content[idx]["url"], "text": content[idx]["text"]} for idx in keep]
+
+
+async def range_search(
+    index: faiss.Index,
+    query_embs: np.ndarray,
+    min_score: float,
+    max_results: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Все документы со скором выше min_score, приведенные к форме search:
+    (n, max_results), лучшие первыми, пустые слоты -1 / -inf
+    """
+    lims, found_scores, found_ids = await asyncio.to_thread(index.range_search, query_embs, min_score)
+    lims = lims.astype(np.int64)
+    n = len(query_embs)
+    rows = np.repeat(np.arange(n), np.diff(lims))
+    order = np.lexsort((-found_scores, rows))
+    rows = rows[order]
+    positions = np.arange(len(order)) - lims[rows]
+    keep = positions < max_results
+
+    scores = np.full((n, max_results), -np.inf, dtype=np.float32)
+    ids = np.full((n, max_results), -1, dtype=np.int64)
+    scores[rows[keep], positions[keep]] = found_scores[order][keep]
+    ids[rows[keep], positions[keep]] = found_ids[order][keep]
+    return scores, ids
+
+
+async def search_batch(
+    index: faiss.Index,
+    query_embs: np.ndarray,
+    top_k: int = 5,
+    min_score: float | None = 0.3,
+    embeddings: np.ndarray | None = None,
+    rescore_factor: int = 4,
+    groups: np.ndarray | None = None,
+    overfetch: int = 4
+) -> list[np.ndarray]:
+    """
+    id документов для каждого запроса (см. select).
+    С порогом и без пересчета скоров используется range_search: FAISS сам
+    отбрасывает слабые результаты. С groups кандидатов берется
+    top_k * overfetch, чтобы после удаления дублей URL осталось top_k.
+    """
+    k = top_k * overfetch if groups is not None else top_k
+    k = min(k, index.ntotal) or 1
+    scores = ids = None
+    if min_score is not None and embeddings is None:
+        try:
+            scores, ids = await range_search(index, query_embs, min_score, k)
+        except RuntimeError:
+            # Не все типы индексов FAISS умеют range_search
+            pass
+    if ids is None:
+        scores, ids = await search(index, query_embs, k, embeddings, rescore_factor)
+    return select(scores, ids, min_score, top_k, groups)
+
+
+def truncated(items: list[Any], limit: int = 5) -> str:
+    if len(items) <= limit:
+        return str(items)
+    return f"{items[:limit]} ... (+{len(items) - limit})"
+
+
+async def retrieve_batch(
+    index: faiss.Index,
+    content: list[dict[str, Any]],
+    queries: list[str],
+    top_k: int = 5,
+    min_score: float | None = 0.3,
+    embeddings: np.ndarray | None = None,
+    rescore_factor: int = 4,
+    groups: np.ndarray | None = None,
+    dedup: bool = True
+) -> list[list[dict[str, Any]]]:
+    """
+    Поиск сразу по многим запросам: одна порция эмбеддингов, один вызов FAISS.
+    dedup: не больше одного документа на URL (groups можно посчитать заранее
+    через doc_groups, иначе считается по content)
+    """
+    if not queries:
+        return []
+    if dedup and groups is None:
+        groups = doc_groups(content)
+    with metrics.span("embed"):
+        query_embs = await embed_queries(queries)
+    with metrics.span("search"):
+        rows = await search_batch(
+            index, query_embs, top_k, min_score, embeddings, rescore_factor,
+            groups if dedup else None
+        )
+    results = [
+        [{"url": content[idx]["url"], "text": content[idx]["text"]} for idx in row]
+        for row in rows
+    ]
+    logger.info(
+        f"results: {len(queries)} запросов, {sum(len(row) for row in results)} документов, "
+        f"первый: {truncated([it['url'] for it in results[0]], 3)}"
+    )
+    return results
+
+
+def reconstruct(
+    index: faiss.Index,
+    ids: np.ndarray,
+    embeddings: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Векторы документов: из полноточных embeddings, если они есть,
+    иначе восстановленные из индекса (для сжатых — приближенные)
+    """
+    if embeddings is not None:
+        return np.asarray(embeddings[ids], dtype=np.float32)
+    return index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+
+
+def mmr(
+    query_emb: np.ndarray,
+    cand_embs: np.ndarray,
+    top_k: int,
+    mmr_lambda: float = 0.7,
+    groups: np.ndarray | None = None,
+    per_url: int | None = None
+) -> np.ndarray:
+    """
+    Maximal marginal relevance: на каждом шаге берется кандидат с лучшим
+    mmr_lambda * sim(query) - (1 - mmr_lambda) * max sim(уже выбранные).
+    mmr_lambda=1 — обычная сортировка по скору, меньше — разнообразнее.
+    per_url: не больше per_url кандидатов одной группы (URL).
+    Возвращает позиции выбранных кандидатов в порядке выбора.
+    """
+    relevance = cand_embs @ query_emb
+    similarity = cand_embs @ cand_embs.T
+    redundancy = np.zeros(len(cand_embs), dtype=np.float32)
+    available = np.ones(len(cand_embs), dtype=bool)
+    taken: dict[int, int] = {}
+    chosen: list[int] = []
+    for _ in range(min(top_k, len(cand_embs))):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not available[best]:
+            break
+        chosen.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        if groups is not None and per_url:
+            group = int(groups[best])
+            taken[group] = taken.get(group, 0) + 1
+            if taken[group] >= per_url:
+                available &= groups != group
+    return np.array(chosen, dtype=np.int64)
+
+
 async def retrieve(
     index: faiss.Index, 
     content: list[dict[str, Any]], 
     query: str, 
     top_k: int = 5,
-    min_score: float | None = 0.3  # 0.35–0.45 — средний порог, 0.5–0.6 — строгий
+    min_score: float | None = 0.3,  # 0.35–0.45 — средний порог, 0.5–0.6 — строгий
+    embeddings: np.ndarray | None = None,
+    rescore_factor: int = 4,
+    mmr_lambda: float | None = None,
+    per_url: int | None = None,
+    candidates: int = 4
 ) -> list[dict[str, Any]]:
-    query_emb = await to_embeddings([query])
-    scores, ids = await asyncio.to_thread(index.search, query_emb, top_k)
-    results: list[dict[str, Any]] = []
-    for score, idx in zip(scores[0], ids[0]):
-        if (min_score is not None) and (score < min_score):
-            continue
-        item = content[idx]
-        results.append({"url": item["url"], "text": item["text"]})
-    logger.info(f"results: {results}")
+    """
+    embeddings: полноточные векторы для точного пересчета скоров (см. search)
+    mmr_lambda, per_url: из top_k * candidates кандидатов выбираются top_k
+    разнообразных (см. mmr), без них — просто top_k лучших
+    """
+    diverse = mmr_lambda is not None or per_url is not None
+    with metrics.span("embed"):
+        query_emb = await embed_queries([query])
+    with metrics.span("search"):
+        k = top_k * candidates if diverse else top_k
+        scores, ids = await search(index, query_emb, k, embeddings, rescore_factor)
+    if diverse:
+        with metrics.span("mmr"):
+            keep = select(scores, ids, min_score, k)[0]
+            groups = doc_groups([content[idx] for idx in keep]) if per_url else None
+            positions = mmr(
+                query_emb[0],
+                reconstruct(index, keep, embeddings),
+                top_k,
+                1.0 if mmr_lambda is None else mmr_lambda,
+                groups,
+                per_url
+            )
+            keep = keep[positions]
+        results = [{"url": content[idx]["url"], "text": content[idx]["text"]} for idx in keep]
+    else:
+        results = collect(content, scores[0], ids[0], min_score)
+    logger.info(f"results: {truncated([it['url'] for it in results])}")
     return results
 
+
+def index_report(
+    embs: np.ndarray,
+    index_type: str,
+    queries: np.ndarray | None = None,
+    top_k: int = 5
+) -> dict[str, Any]:
+    """
+    Сравнивает сжатый индекс с IndexFlatIP: размер и recall@k
+    (без пересчета и с точным пересчетом кандидатов).
+    Если запросы не переданы, запросами служат сами векторы.
+    """
+    queries = embs if queries is None else queries
+    top_k = min(top_k, len(embs))
+
+    flat = make_index(embs, "flat")
+    compressed = make_index(embs, index_type)
+    _, exact_ids = flat.search(queries, top_k)
+    _, approx_ids = compressed.search(queries, top_k)
+    _, cand_ids = compressed.search(queries, min(top_k * 4, len(embs)))
+
+    def recall(found: np.ndarray) -> float:
+        hits = sum(
+            len(set(row_exact) & set(row_found))
+            for row_exact, row_found in zip(exact_ids.tolist(), found.tolist())
+        )
+        return hits / exact_ids.size
+
+    rescored = np.stack([
+        rescore(embs, q[None, :], ids, top_k)[1] for q, ids in zip(queries, cand_ids)
+    ])
+
+    flat_bytes = faiss.serialize_index(flat).nbytes
+    index_bytes = faiss.serialize_index(compressed).nbytes
+    return {
+        "index_type": index_type,
+        "vectors": len(embs),
+        "flat_bytes": int(flat_bytes),
+        "index_bytes": int(index_bytes),
+        "saved_bytes": int(flat_bytes - index_bytes),
+        "compression": round(flat_bytes / index_bytes, 2),
+        f"recall@{top_k}": round(recall(approx_ids), 4),
+        f"recall@{top_k}_rescored": round(recall(rescored), 4),
+    }
+
+
+async def compare_index_types(content_path: Path = CONTENT_PATH, top_k: int = 5) -> list[dict[str, Any]]:
+    content = json.loads(content_path.read_text(encoding="utf-8"))
+    embs = await to_embeddings([it["text"] for it in content])
+    return [index_report(embs, index_type, top_k=top_k) for index_type in INDEX_TYPES[1:]]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Сравнение способов хранения векторов")
+    arg_parser.add_argument("--top-k", type=int, default=5)
+    args = arg_parser.parse_args()
+    reports = asyncio.run(compare_index_types(top_k=args.top_k))
+    print(json.dumps(reports, ensure_ascii=False, indent=4))
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any
+
+import numpy as np
+from openai import AsyncOpenAI
+
+import config
+from src import metrics
+
+
+logger = config.logging.getLogger(__name__)
+
+
+BACKEND_UP = metrics.Gauge(
+    "eora_llm_backend_up",
+    "1 — backend принимает запросы, 0 — открыт circuit breaker",
+    ("backend",)
+)
+BACKEND_REQUESTS = metrics.Counter(
+    "eora_llm_backend_requests_total",
+    "Запросы к LLM backend по результату (ok/error/cancelled)",
+    ("backend", "result")
+)
+BACKEND_SECONDS = metrics.Histogram(
+    "eora_llm_backend_seconds",
+    "Длительность успешных запросов к LLM backend",
+    ("backend",)
+)
+BACKEND_ERROR_RATE = metrics.Gauge(
+    "eora_llm_backend_error_rate",
+    "Доля ошибок LLM backend за последние window запросов",
+    ("backend",)
+)
+HEDGES = metrics.Counter("eora_llm_hedges_total", "Отправленные дублирующие запросы")
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class Backend:
+    """
+    Один OpenAI-совместимый endpoint со статистикой и circuit breaker.
+    failure_threshold: подряд идущих ошибок до открытия breaker
+    cooldown: сколько секунд breaker открыт, затем пропускается один пробный запрос
+    window: сколько последних запросов учитывают p95 и доля ошибок
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        model: str,
+        api_key: str | None = None,
+        timeout: float = 60.0,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        window: int = 200
+    ):
+        self.name = name
+        self.model = model
+        self.client = AsyncOpenAI(
+            api_key=api_key or "none",
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0
+        )
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        BACKEND_UP.set(1, backend=name)
+        BACKEND_ERROR_RATE.set(0, backend=name)
+
+    def p95(self, min_samples: int = 20) -> float | None:
+        if len(self.latencies) < min_samples:
+            return None
+        return float(np.percentile(self.latencies, 95))
+
+    def error_rate(self, min_samples: int = 10) -> float | None:
+        """Доля ошибок за окно, None пока статистики мало"""
+        if len(self.outcomes) < min_samples:
+            return None
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def _record_outcome(self, ok: bool) -> None:
+        self.outcomes.append(ok)
+        BACKEND_ERROR_RATE.set(1 - sum(self.outcomes) / len(self.outcomes), backend=self.name)
+
+    def available(self, now: float | None = None) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic() if now is None else now
+        # half-open: после cooldown пропускаем один пробный запрос
+        return not self.probing and now - self.opened_at >= self.cooldown
+
+    def acquire(self, now: float | None = None) -> bool:
+        """
+        Занимает backend под запрос. Для открытого breaker пробный запрос
+        занимается сразу, чтобы параллельные запросы его не дублировали
+        """
+        if not self.available(now):
+            return False
+        if self.opened_at is not None:
+            self.probing = True
+        return True
+
+    def release(self) -> None:
+        """Запрос отменен без ответа — пробный запрос можно отправить снова"""
+        self.probing = False
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self._record_outcome(True)
+        self.consecutive_failures = 0
+        self.probing = False
+        if self.opened_at is not None:
+            logger.info(f"router: backend {self.name} снова доступен")
+            self.opened_at = None
+            BACKEND_UP.set(1, backend=self.name)
+        BACKEND_REQUESTS.inc(backend=self.name, result="ok")
+        BACKEND_SECONDS.observe(latency, backend=self.name)
+
+    def record_failure(self) -> None:
+        self._record_outcome(False)
+        self.consecutive_failures += 1
+        BACKEND_REQUESTS.inc(backend=self.name, result="error")
+        if self.probing or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.info(f"router: backend {self.name} отключен после ошибок")
+            self.opened_at = time.monotonic()
+            self.probing = False
+            BACKEND_UP.set(0, backend=self.name)
+
+    async def create(self, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            answer = await self.client.chat.completions.create(model=self.model, **kwargs)
+        except asyncio.CancelledError:
+            BACKEND_REQUESTS.inc(backend=self.name, result="cancelled")
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.perf_counter() - start)
+        return answer
+
+
+class LLMRouter:
+    """
+    Маршрутизация между несколькими backend-ами в порядке приоритета.
+    Backend-ы с долей ошибок выше max_error_rate опускаются в конец очереди,
+    но остаются запасными. Если основной не ответил за свой p95 (или hedge_delay, пока статистики мало),
+    параллельно отправляется запрос следующему; первый успешный ответ
+    побеждает, остальные запросы отменяются. При ошибке сразу пробуется следующий.
+    """
+
+    def __init__(
+        self,
+        backends: list[Backend],
+        hedge: bool = True,
+        hedge_delay: float = 2.0,
+        min_hedge_delay: float = 0.2,
+        max_error_rate: float = 0.5
+    ):
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_error_rate = max_error_rate
+
+    def unhealthy(self, backend: Backend) -> bool:
+        error_rate = backend.error_rate()
+        return error_rate is not None and error_rate > self.max_error_rate
+
+    def candidates(self) -> list[Backend]:
+        """Доступные backend-ы: сначала здоровые, внутри групп — по приоритету"""
+        now = time.monotonic()
+        available = [backend for backend in self.backends if backend.available(now)]
+        return sorted(available, key=self.unhealthy)
+
+    def hedge_after(self, backend: Backend) -> float:
+        p95 = backend.p95()
+        return self.hedge_delay if p95 is None else max(self.min_hedge_delay, p95)
+
+    async def create(self, **kwargs: Any) -> Any:
+        """Аналог client.chat.completions.create, model берется из backend"""
+        queue = self.candidates()
+        tasks: dict[asyncio.Task, Backend] = {}
+        # Backend-ы, для которых этот вызов занял пробный запрос
+        probes: set[Backend] = set()
+        last_error: BaseException | None = None
+        hedged = False
+
+        def launch() -> Backend | None:
+            # Пробный запрос к backend мог уже занять параллельный вызов
+            while queue:
+                backend = queue.pop(0)
+                if backend.acquire():
+                    if backend.probing:
+                        probes.add(backend)
+                    tasks[asyncio.create_task(backend.create(**kwargs))] = backend
+                    return backend
+            return None
+
+        current = launch()
+        if current is None:
+            raise NoBackendAvailable("все LLM backend-ы отключены circuit breaker-ом")
+        try:
+            while tasks:
+                timeout = None
+                if self.hedge and not hedged and queue:
+                    timeout = self.hedge_after(current)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    HEDGES.inc()
+                    logger.info(f"router: {current.name} медленнее {timeout:.2f}с, дублируем запрос")
+                    launch()
+                    continue
+                for task in done:
+                    backend = tasks.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.info(f"router: ошибка {backend.name}: {last_error!r}")
+                if queue and not tasks:
+                    current = launch() or current
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            # Отмененный пробный запрос не ответил — его можно отправить снова
+            for backend in tasks.values():
+                if backend in probes:
+                    backend.release()
+
+        raise last_error
+
+
+def create_router() -> LLMRouter | None:
+    """
+    Роутер из LLM_BACKENDS (JSON список {"name", "base_url", "model", "api_key"}).
+    Без LLM_BACKENDS используется один клиент из LLM_URL/LLM_TOKEN.
+    """
+    if not config.llm_backends:
+        return None
+    backends = [
+        Backend(
+            name=item.get("name") or item["base_url"],
+            base_url=item["base_url"],
+            model=item.get("model", config.llm_model),
+            api_key=item.get("api_key", config.llm_token),
+            timeout=item.get("timeout", 60.0),
+            failure_threshold=config.llm_failure_threshold,
+            cooldown=config.llm_breaker_cooldown
+        )
+        for item in json.loads(config.llm_backends)
+    ]
+    return LLMRouter(
+        backends,
+        hedge=config.llm_hedge,
+        hedge_delay=config.llm_hedge_delay,
+        max_error_rate=config.llm_max_error_rate
+    )
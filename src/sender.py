@@ -0,0 +1,277 @@
+"""
+Отправка ответов в Telegram.
+
+HTML от LLM чинится локально до отправки (неизвестные теги убираются,
+незакрытые закрываются, лишние < > & экранируются), поэтому Telegram
+почти никогда не отвечает ошибкой разбора. Длинный ответ режется на
+сообщения до 4096 символов по границам строк и слов, открытые теги
+закрываются в конце части и открываются заново в следующей.
+Сообщения одного чата уходят строго по очереди, на 429 ждем retry_after.
+"""
+import asyncio
+import html
+import re
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+
+import config
+from src import metrics
+
+
+logger = config.logging.getLogger(__name__)
+
+
+MESSAGE_LIMIT = 4096
+
+SENDS = metrics.Counter(
+    "eora_telegram_sends_total",
+    "Отправка сообщений в Telegram по результату (ok/retry_after/network_error/plain_fallback)",
+    ("result",)
+)
+
+# Теги, которые понимает parse_mode="HTML" в Telegram
+ALLOWED_TAGS = frozenset({
+    "b", "strong", "i", "em", "u", "ins", "s", "strike", "del",
+    "a", "code", "pre", "tg-spoiler", "blockquote",
+})
+
+_TOKEN_RE = re.compile(r"<br\s*/?>|<(/?)([a-zA-Z][\w-]*)((?:\s[^<>]*)?)/?>", re.IGNORECASE)
+_HREF_RE = re.compile(r"""href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+_ENTITY_RE = re.compile(r"&(?:[a-zA-Z]+|#\d+|#x[0-9a-fA-F]+);")
+_PIECE_RE = re.compile(r"\S+\s*|\s+")
+
+
+def escape_text(text: str) -> str:
+    """Экранирует < > и & вне готовых сущностей (&amp;, &#39; и т.п.)"""
+    result = []
+    pos = 0
+    for found in _ENTITY_RE.finditer(text):
+        result.append(html.escape(text[pos:found.start()], quote=False))
+        result.append(found.group(0))
+        pos = found.end()
+    result.append(html.escape(text[pos:], quote=False))
+    return "".join(result)
+
+
+def _tokenize(text: str) -> list[tuple[str, str, str]]:
+    """(kind, name, raw): kind — text, open, close или br"""
+    tokens = []
+    pos = 0
+    for found in _TOKEN_RE.finditer(text):
+        if found.start() > pos:
+            tokens.append(("text", "", text[pos:found.start()]))
+        if found.group(2) is None:
+            tokens.append(("br", "br", found.group(0)))
+        else:
+            kind = "close" if found.group(1) else "open"
+            tokens.append((kind, found.group(2).lower(), found.group(0)))
+        pos = found.end()
+    if pos < len(text):
+        tokens.append(("text", "", text[pos:]))
+    return tokens
+
+
+def _open_tag(name: str, attrs: str) -> str | None:
+    if name != "a":
+        return f"<{name}>"
+    found = _HREF_RE.search(attrs)
+    if not found:
+        return None
+    href = next(group for group in found.groups() if group is not None)
+    return f'<a href="{html.escape(html.unescape(href))}">'
+
+
+def repair_html(text: str) -> str:
+    """
+    Приводит HTML к подмножеству Telegram: неизвестные теги снимаются
+    (текст остается), <br> становится переносом строки, закрывающие теги
+    без пары выбрасываются, незакрытые — закрываются.
+    """
+    result: list[str] = []
+    stack: list[str] = []
+    # Теги, снятые без пары (например <a> без href): их закрывающие тоже снимаются
+    skipped: list[str] = []
+    for kind, name, raw in _tokenize(text):
+        if kind == "text":
+            result.append(escape_text(raw))
+        elif kind == "br":
+            result.append("\n")
+        elif name not in ALLOWED_TAGS:
+            continue
+        elif kind == "open":
+            tag = _open_tag(name, _TOKEN_RE.match(raw).group(3) or "")
+            if tag is None:
+                skipped.append(name)
+                continue
+            result.append(tag)
+            stack.append(name)
+        elif name in stack:
+            # Неправильная вложенность: закрываем все до парного тега
+            while stack:
+                top = stack.pop()
+                result.append(f"</{top}>")
+                if top == name:
+                    break
+        elif name in skipped:
+            skipped.remove(name)
+    result.extend(f"</{name}>" for name in reversed(stack))
+    return "".join(result)
+
+
+def html_to_text(text: str) -> str:
+    return html.unescape(re.sub(r"<[^>]+>", "", text))
+
+
+def _hard_split(raw: str, size: int) -> list[str]:
+    """Режет слишком длинный кусок текста, не разрывая сущности &...;"""
+    pieces = []
+    while len(raw) > size:
+        cut = size
+        amp = raw.rfind("&", max(0, cut - 10), cut)
+        if amp > 0 and ";" not in raw[amp:cut]:
+            cut = amp
+        pieces.append(raw[:cut])
+        raw = raw[cut:]
+    pieces.append(raw)
+    return pieces
+
+
+def split_html(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Делит корректный HTML (см. repair_html) на части не длиннее limit.
+    Разрез по возможности после переноса строки во второй половине части,
+    иначе между словами. Открытые на месте разреза теги закрываются
+    и открываются заново в следующей части.
+    """
+    if len(text) <= limit:
+        return [text]
+
+    # (kind, name, raw) с текстом, разбитым на слова
+    tokens: list[tuple[str, str, str]] = []
+    for kind, name, raw in _tokenize(text):
+        if kind == "text":
+            tokens.extend(("text", "", piece) for piece in _PIECE_RE.findall(raw))
+        else:
+            tokens.append((kind, name, raw))
+
+    chunks: list[str] = []
+    stack: list[tuple[str, str]] = []  # (name, открывающий тег)
+    start_stack: list[tuple[str, str]] = []
+    body: list[str] = []
+    size = 0
+    # Последний перенос строки: (число токенов в body, size, stack)
+    line_break: tuple[int, int, list[tuple[str, str]]] | None = None
+
+    def reopen(tags: list[tuple[str, str]]) -> str:
+        return "".join(tag for _, tag in tags)
+
+    def close(tags: list[tuple[str, str]]) -> str:
+        return "".join(f"</{name}>" for name, _ in reversed(tags))
+
+    def emit(count: int, at_stack: list[tuple[str, str]]) -> None:
+        nonlocal body, size, start_stack, line_break
+        chunks.append(reopen(start_stack) + "".join(body[:count]) + close(at_stack))
+        body = body[count:]
+        start_stack = list(at_stack)
+        size = sum(map(len, body))
+        line_break = None
+
+    i = 0
+    while i < len(tokens):
+        kind, name, raw = tokens[i]
+        next_stack = stack
+        if kind == "open":
+            next_stack = stack + [(name, raw)]
+        elif kind == "close" and stack and stack[-1][0] == name:
+            next_stack = stack[:-1]
+
+        overhead = len(reopen(start_stack)) + len(close(next_stack))
+        if size + len(raw) + overhead > limit:
+            if line_break is not None and line_break[1] >= limit // 2:
+                count, _, at_stack = line_break
+                emit(count, at_stack)
+                continue
+            if body:
+                emit(len(body), stack)
+                continue
+            # Один кусок не помещается даже в пустую часть
+            room = limit - overhead
+            tokens[i:i + 1] = [(kind, name, piece) for piece in _hard_split(raw, max(room, 1))]
+            kind, name, raw = tokens[i]
+
+        body.append(raw)
+        size += len(raw)
+        stack = next_stack
+        if kind == "text" and raw.endswith("\n"):
+            line_break = (len(body), size, list(stack))
+        elif kind == "br":
+            line_break = (len(body), size, list(stack))
+        i += 1
+
+    if body:
+        chunks.append(reopen(start_stack) + "".join(body) + close(stack))
+    return chunks
+
+
+class Sender:
+    """
+    Отправка ответов с повторами.
+    Сообщения одного чата идут по очереди (asyncio.Lock отдает очередь
+    в порядке ожидания), поэтому части длинного ответа не перемешиваются
+    с соседними ответами и ожидание retry_after не блокирует другие чаты.
+    """
+
+    def __init__(self, max_retries: int = 3, backoff: float = 0.5, max_retry_after: float = 60.0):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._waiters: dict[int, int] = {}
+
+    async def send(self, message: types.Message, text: str) -> list[types.Message]:
+        chunks = split_html(repair_html(text))
+        chat_id = message.chat.id
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._waiters[chat_id] = self._waiters.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                return [await self._send_chunk(message, chunk) for chunk in chunks]
+        finally:
+            self._waiters[chat_id] -= 1
+            # Очереди чатов не копятся в памяти после ответа
+            if not self._waiters[chat_id]:
+                del self._waiters[chat_id]
+                del self._locks[chat_id]
+
+    async def _send_chunk(self, message: types.Message, chunk: str) -> types.Message:
+        parse_mode: str | None = "HTML"
+        attempt = 0
+        while True:
+            try:
+                kwargs = {"parse_mode": parse_mode} if parse_mode else {}
+                sent = await message.answer(chunk, **kwargs)
+                SENDS.inc(result="ok")
+                return sent
+            except TelegramRetryAfter as e:
+                SENDS.inc(result="retry_after")
+                attempt += 1
+                if attempt > self.max_retries or e.retry_after > self.max_retry_after:
+                    raise
+                logger.info(f"sender: flood control, ждем {e.retry_after}с")
+                await asyncio.sleep(e.retry_after)
+            except TelegramNetworkError:
+                SENDS.inc(result="network_error")
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            except TelegramBadRequest as e:
+                # HTML уже починен локально, сюда попадаем только при неожиданной ошибке разбора.
+                # Остальные ошибки (chat not found, message is too long) текст не исправит
+                if parse_mode is None or "can't parse entities" not in str(e).lower():
+                    raise
+                SENDS.inc(result="plain_fallback")
+                logger.info(f"sender: Telegram не принял HTML, отправляем текстом: {e}")
+                chunk = html_to_text(chunk)
+                parse_mode = None
@@ -0,0 +1,41 @@
+import os
+import tempfile
+from pathlib import Path
+
+# config настраивает лог при импорте: тесты не должны дописывать data/logs/log.txt
+os.environ.setdefault("LOG_FILE", str(Path(tempfile.mkdtemp(prefix="eora-test-logs-")) / "log.txt"))
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from src import rag
+
+
+@pytest.fixture(autouse=True)
+def clear_query_cache():
+    # Кэш эмбеддингов общий для процесса: тесты с разными заглушками модели не должны его делить
+    if rag.query_cache is not None:
+        rag.query_cache.clear()
+    yield
+
+
+@pytest.fixture
+def embedding_mapping() -> dict[str, list[float]] | None:
+    # Модули тестов переопределяют фикстуру, когда важна близость конкретных текстов
+    return None
+
+
+@pytest.fixture
+def fake_embeddings(embedding_mapping):
+    """Подменяет rag.to_embeddings: векторы из embedding_mapping или случайные, но повторяемые"""
+    async def to_embeddings(texts: list[str]) -> np.ndarray:
+        if embedding_mapping is None:
+            rng = np.random.default_rng(len(texts))
+            embs = rng.standard_normal((len(texts), 16)).astype(np.float32)
+        else:
+            embs = np.array([embedding_mapping[text] for text in texts], dtype=np.float32)
+        return embs / np.linalg.norm(embs, axis=1, keepdims=True)
+
+    with patch("src.rag.to_embeddings", new=to_embeddings):
+        yield to_embeddings
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.batch import chunked, read_questions, run
+from src.rag import make_index
+
+
+def make_llm_client() -> MagicMock:
+    embs = np.eye(3, dtype=np.float32)
+    llm_client = MagicMock()
+    llm_client.index = make_index(embs, "flat")
+    llm_client.embeddings = None
+    llm_client.content = [{"url": f"test{i}.com", "text": f"Документ {i}"} for i in range(3)]
+    llm_client.build_messages = MagicMock(side_effect=lambda question, contents, **kwargs: [question, contents])
+    return llm_client
+
+
+@pytest.fixture
+def embedding_mapping() -> dict[str, list[float]]:
+    # Вопрос "qN" похож на документ N
+    return {f"q{i}": row for i, row in enumerate(np.eye(3).tolist())}
+
+
+class TestReadQuestions:
+    def test_read_questions_shapes(self, tmp_path):
+        """Проверяем чтение вопросов и формата requests.jsonl"""
+        path = tmp_path / "in.jsonl"
+        path.write_text(
+            '{"id": "a", "question": "Вопрос 1"}\n'
+            '\n'
+            '{"request_id": "user-1", "title": "Заголовок", "body": "Вопрос 2"}\n',
+            encoding="utf-8"
+        )
+
+        assert list(read_questions(path)) == [
+            {"id": "a", "question": "Вопрос 1"},
+            {"id": "user-1", "question": "Вопрос 2"},
+        ]
+
+    def test_chunked(self):
+        """Проверяем разбиение на порции"""
+        assert list(chunked(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+
+
+class TestRun:
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_run_writes_jsonl(self, tmp_path):
+        """Проверяем пакетный прогон с потоковой записью"""
+        in_path = tmp_path / "in.jsonl"
+        in_path.write_text("".join(
+            json.dumps({"id": i, "question": f"q{i % 3}"}) + "\n" for i in range(5)
+        ), encoding="utf-8")
+        out_path = tmp_path / "out.jsonl"
+
+        llm_client = make_llm_client()
+        llm_client.complete = AsyncMock(side_effect=["ответ"] * 4 + [RuntimeError("boom")])
+
+        summary = await run(in_path, out_path, concurrency=2, batch_size=2, top_k=1, llm_client=llm_client)
+
+        records = {record["id"]: record for record in map(json.loads, out_path.read_text().splitlines())}
+        assert summary["questions"] == 5
+        assert summary["errors"] == 1
+        assert set(records) == set(range(5))
+        assert records[1]["urls"] == ["test1.com"]
+        assert set(records[1]["timings"]) == {"embed", "search", "llm"}
+        assert sum("error" in record for record in records.values()) == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_run_skips_query_cache_and_question_log(self, tmp_path):
+        """Проверяем, что пакет не трогает кэш запросов бота и не пишет вопросы для FAQ"""
+        in_path = tmp_path / "in.jsonl"
+        in_path.write_text(json.dumps({"id": 1, "question": "q1"}) + "\n", encoding="utf-8")
+        llm_client = make_llm_client()
+        llm_client.complete = AsyncMock(return_value="ответ")
+
+        with patch('src.batch.rag.embed_queries') as mock_embed_queries:
+            await run(in_path, tmp_path / "out.jsonl", llm_client=llm_client)
+
+        mock_embed_queries.assert_not_called()
+        assert llm_client.build_messages.call_args.kwargs == {"log_question": False}
+
+    @pytest.mark.asyncio
+    async def test_failed_chunk_counted_as_errors(self, tmp_path, fake_embeddings):
+        """Проверяем, что сбой эмбеддингов одной порции не прерывает прогон"""
+        in_path = tmp_path / "in.jsonl"
+        in_path.write_text("".join(
+            json.dumps({"id": i, "question": f"q{i % 3}"}) + "\n" for i in range(4)
+        ), encoding="utf-8")
+        out_path = tmp_path / "out.jsonl"
+        llm_client = make_llm_client()
+        llm_client.complete = AsyncMock(return_value="ответ")
+
+        async def flaky_embeddings(texts: list[str]) -> np.ndarray:
+            if texts[0] == "q0":
+                raise RuntimeError("encoder")
+            return await fake_embeddings(texts)
+
+        with patch('src.batch.rag.to_embeddings', new=flaky_embeddings):
+            summary = await run(in_path, out_path, batch_size=2, top_k=1, llm_client=llm_client)
+
+        records = {record["id"]: record for record in map(json.loads, out_path.read_text().splitlines())}
+        assert summary["errors"] == 2
+        assert "error" in records[0] and "error" in records[1]
+        assert records[2]["answer"] == "ответ" and records[3]["answer"] == "ответ"
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_error_cancels_chunks_in_flight(self, tmp_path):
+        """Проверяем, что при ошибке прогона порции в работе отменяются до закрытия файла"""
+        in_path = tmp_path / "in.jsonl"
+        in_path.write_text(json.dumps({"id": 1, "question": "q1"}) + "\n{битая строка\n", encoding="utf-8")
+        llm_client = make_llm_client()
+        llm_client.complete = AsyncMock(side_effect=lambda *args, **kwargs: asyncio.sleep(10))
+
+        with pytest.raises(json.JSONDecodeError):
+            await run(in_path, tmp_path / "out.jsonl", batch_size=1, llm_client=llm_client)
+
+        assert asyncio.all_tasks() == {asyncio.current_task()}
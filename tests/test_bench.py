@@ -0,0 +1,156 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from bench.load_test import LoadTest, Latency, StubLLMClient, StubSession, find_saturation
+from bench.parser_bench import make_tilda_page, run as run_parser_bench
+from bench.rag_bench import evaluate_retrieval, percentiles, recall_at_k, reciprocal_rank, stage_report
+from bench.stub_llm import StubLLM
+from src.bot import create_dispatcher
+
+
+class TestBenchMetrics:
+    def test_percentiles(self):
+        """Проверяем расчет перцентилей"""
+        result = percentiles([float(i) for i in range(1, 101)])
+
+        assert result["p50"] == pytest.approx(50.5)
+        assert result["p99"] == pytest.approx(99.01)
+        assert percentiles([]) == {}
+
+    def test_recall_at_k(self):
+        """Проверяем recall@k по размеченным ссылкам"""
+        found = ["a.com", "b.com", "c.com"]
+
+        assert recall_at_k(found, ["b.com", "d.com"], 3) == 0.5
+        assert recall_at_k(found, ["c.com"], 2) == 0.0
+        assert recall_at_k(found, [], 3) == 0.0
+
+    def test_parser_bench(self):
+        """Проверяем отчет бенчмарка парсера: оба движка и сверка результатов"""
+        report = run_parser_bench([make_tilda_page(records=5, seed=seed) for seed in range(2)])
+
+        assert report["pages"] == 2
+        assert report["mismatches"] == []
+        assert report["fast"]["pages_per_sec"] > 0 and report["soup"]["pages_per_sec"] > 0
+
+    def test_reciprocal_rank(self):
+        """Проверяем обратный ранг первой релевантной ссылки"""
+        assert reciprocal_rank(["a.com", "b.com"], ["b.com"]) == 0.5
+        assert reciprocal_rank(["a.com"], ["b.com"]) == 0.0
+
+    def test_stage_report(self):
+        """Проверяем отчет по стадиям с пропусками"""
+        report = stage_report([{"embed": 0.1, "llm": 1.0}, {"embed": 0.3}])
+
+        assert set(report) == {"embed", "llm"}
+        assert report["embed"]["mean"] == pytest.approx(0.2)
+
+    @pytest.mark.asyncio
+    async def test_retrieval_through_find_context(self):
+        """Проверяем, что recall и MRR считаются по поиску бота, а голый индекс — только по флагу"""
+        client = MagicMock()
+        client.find_context = AsyncMock(return_value=[{"url": "b.com"}, {"url": "a.com"}])
+        questions = [{"question": "Кейсы?", "urls": ["a.com"]}]
+
+        with patch("src.rag.retrieve_batch", new=AsyncMock(return_value=[[{"url": "a.com"}]])) as mock_batch:
+            report = await evaluate_retrieval(client, questions, top_k=2)
+            assert report == {"recall@2": 1.0, "mrr": 0.5}
+            client.find_context.assert_awaited_once_with("Кейсы?", top_k=2)
+            mock_batch.assert_not_awaited()
+
+            raw = await evaluate_retrieval(client, questions, top_k=2, raw=True)
+        assert raw == {"recall@2": 1.0, "mrr": 1.0}
+        assert mock_batch.call_args.kwargs["min_score"] is None
+
+
+class TestStubLLM:
+    @pytest.mark.asyncio
+    async def test_stub_answers_with_sources(self):
+        """Проверяем ответ заглушки в формате base_prompt"""
+        stub = StubLLM()
+        base_url = await stub.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{base_url}/chat/completions", json={
+                    "model": "stub",
+                    "messages": [{"role": "user", "content": "Контент из источника https://a.com:\nтекст"}]
+                }) as response:
+                    body = await response.json()
+        finally:
+            await stub.stop()
+
+        content = json.loads(body["choices"][0]["message"]["content"])
+        assert content["urls"] == [{"1": "https://a.com"}]
+        assert "[1]" in content["content"]
+        assert body["usage"]["completion_tokens"] > 0
+        assert stub.requests == 1
+
+    @pytest.mark.asyncio
+    async def test_stub_error_rate(self):
+        """Проверяем инъекцию ошибок"""
+        stub = StubLLM(error_rate=1.0)
+        base_url = await stub.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{base_url}/chat/completions", json={"messages": []}) as response:
+                    status = response.status
+        finally:
+            await stub.stop()
+
+        assert status == 500
+
+
+class TestLoadTest:
+    def test_latency_sample(self):
+        """Проверяем распределение задержек"""
+        assert Latency(0.5).sample() == 0.5
+        assert Latency(0.0, 1.0).sample() == 0.0
+        assert Latency(0.5, 0.5, seed=0).sample() > 0
+
+    def test_find_saturation_by_throughput(self):
+        """Проверяем точку насыщения по остановке роста пропускной способности"""
+        stages = [
+            {"users": 1, "throughput": 1.0, "latency": {"p95": 1.0}},
+            {"users": 2, "throughput": 2.0, "latency": {"p95": 1.0}},
+            {"users": 4, "throughput": 2.1, "latency": {"p95": 2.0}},
+        ]
+        assert find_saturation(stages, slo_p95=5.0) == 4
+
+    def test_find_saturation_by_slo(self):
+        """Проверяем точку насыщения по p95"""
+        stages = [
+            {"users": 1, "throughput": 1.0, "latency": {"p95": 1.0}},
+            {"users": 2, "throughput": 2.0, "latency": {"p95": 6.0}},
+        ]
+        assert find_saturation(stages, slo_p95=5.0) == 2
+        assert find_saturation(stages[:1], slo_p95=5.0) is None
+
+    @pytest.mark.asyncio
+    async def test_stub_session_flood(self):
+        """Проверяем инъекцию 429 в заглушке Bot API"""
+        session = StubSession(Latency(0.0), flood_rate=1.0)
+        bot = Bot(token="42:TEST", session=session)
+
+        with pytest.raises(TelegramRetryAfter):
+            await bot.send_message(1, "текст")
+        assert session.sent == []
+
+    @pytest.mark.asyncio
+    async def test_run_stage(self):
+        """Проверяем прогон ступени через реальный Dispatcher"""
+        session = StubSession(Latency(0.001))
+        bot = Bot(token="42:TEST", session=session)
+        llm_client = StubLLMClient(Latency(0.01), capacity=1)
+        load_test = LoadTest(create_dispatcher(llm_client), bot, llm_client, ["Вопрос"], Latency(0.0))
+
+        stage = await load_test.run_stage(users=3, seconds=0.2)
+
+        assert stage["requests"] > 0
+        assert stage["error_rate"] == 0.0
+        assert stage["queue_delay"]["p50"] >= 0
+        assert stage["llm_queue_delay"]["p95"] > 0
+        assert len(session.sent) == stage["requests"]
@@ -1,9 +1,12 @@
 import pytest
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, call, patch
 from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
 
 from src.bot import create_bot, question_handler, start_command
+from src.faq import FAQ
 from src.llm import LLMClient
+from src.memory import SessionStore
 
 
 class TestBotHandlers:
@@ -23,6 +26,7 @@ class TestBotHandlers:
         """Проверяем обработку вопроса с успешным ответом"""
         mock_message = AsyncMock(spec=types.Message)
         mock_message.text = "Тестовый вопрос"
+        mock_message.chat = MagicMock(id=1)
         mock_message.answer = AsyncMock()
         
         mock_llm_client = AsyncMock(spec=LLMClient)
@@ -34,29 +38,126 @@ class TestBotHandlers:
             "Тестовый вопрос",
             max_tokens=300,
             temperature=0.5,
-            top_p=0.8
+            top_p=0.8,
+            history=None
         )
-        mock_message.answer.assert_called_once_with("Тестовый ответ", parse_mode="Markdown")
+        mock_message.answer.assert_called_once_with("Тестовый ответ", parse_mode="HTML")
 
     @pytest.mark.asyncio
-    async def test_question_handler_markdown_fallback(self):
-        """Проверяем fallback при ошибке с Markdown"""
+    async def test_question_handler_html_fallback(self):
+        """Проверяем fallback на обычный текст, если Telegram не принял HTML"""
         mock_message = AsyncMock(spec=types.Message)
         mock_message.text = "Тестовый вопрос"
+        mock_message.chat = MagicMock(id=1)
         
         mock_answer = AsyncMock()
-        mock_answer.side_effect = [Exception("Markdown error"), None]
+        mock_answer.side_effect = [
+            TelegramBadRequest(method=MagicMock(), message="can't parse entities"),
+            None
+        ]
         mock_message.answer = mock_answer
         
         mock_llm_client = AsyncMock(spec=LLMClient)
-        mock_llm_client.generate_answer.return_value = "Тестовый ответ"
+        mock_llm_client.generate_answer.return_value = "Тестовый <b>ответ</b>"
         
         await question_handler(mock_message, mock_llm_client)
         
         assert mock_message.answer.call_count == 2
-        mock_message.answer.assert_any_call("Тестовый ответ", parse_mode="Markdown")
+        mock_message.answer.assert_any_call("Тестовый <b>ответ</b>", parse_mode="HTML")
         mock_message.answer.assert_any_call("Тестовый ответ")
 
+    @pytest.mark.asyncio
+    async def test_question_handler_network_error_not_doubled(self):
+        """Проверяем, что сетевая ошибка повторяет тот же HTML, а не шлет копию текстом"""
+        mock_message = AsyncMock(spec=types.Message)
+        mock_message.text = "Тестовый вопрос"
+        mock_message.chat = MagicMock(id=1)
+        mock_message.answer = AsyncMock(side_effect=[
+            TelegramNetworkError(method=MagicMock(), message="timeout"),
+            None
+        ])
+
+        mock_llm_client = AsyncMock(spec=LLMClient)
+        mock_llm_client.generate_answer.return_value = "Тестовый ответ"
+
+        with patch('src.sender.asyncio.sleep', new=AsyncMock()):
+            await question_handler(mock_message, mock_llm_client)
+
+        assert mock_message.answer.call_args_list == [
+            call("Тестовый ответ", parse_mode="HTML"),
+            call("Тестовый ответ", parse_mode="HTML"),
+        ]
+
+
+    @pytest.mark.asyncio
+    async def test_question_handler_with_sessions(self):
+        """Проверяем передачу истории и сохранение реплик"""
+        mock_message = AsyncMock(spec=types.Message)
+        mock_message.text = "а сколько это стоило?"
+        mock_message.chat = MagicMock(id=42)
+        mock_message.answer = AsyncMock()
+
+        mock_llm_client = AsyncMock(spec=LLMClient)
+        mock_llm_client.generate_answer.return_value = "Ответ"
+
+        sessions = SessionStore()
+        sessions.append(42, "Что вы делали для Dodo Pizza?", "Робота-аналитика")
+
+        await question_handler(mock_message, mock_llm_client, sessions)
+
+        assert mock_llm_client.generate_answer.call_args.kwargs["history"] == [
+            ("user", "Что вы делали для Dodo Pizza?"),
+            ("assistant", "Робота-аналитика"),
+        ]
+        assert sessions.get(42)[-2:] == [("user", "а сколько это стоило?"), ("assistant", "Ответ")]
+
+
+    @pytest.mark.asyncio
+    async def test_question_handler_faq_hit(self):
+        """Проверяем ответ из FAQ без вызова LLM"""
+        mock_message = AsyncMock(spec=types.Message)
+        mock_message.text = "Что вы делали для ритейлеров?"
+        mock_message.chat = MagicMock(id=1)
+        mock_message.answer = AsyncMock()
+
+        mock_llm_client = AsyncMock(spec=LLMClient)
+        mock_faq = AsyncMock(spec=FAQ)
+        mock_faq.match.return_value = "Готовый ответ"
+
+        await question_handler(mock_message, mock_llm_client, faq=mock_faq)
+
+        mock_faq.match.assert_called_once_with("Что вы делали для ритейлеров?")
+        mock_llm_client.generate_answer.assert_not_called()
+        mock_message.answer.assert_called_once_with("Готовый ответ", parse_mode="HTML")
+
+    @pytest.mark.asyncio
+    async def test_question_handler_faq_in_ongoing_chat(self):
+        """Проверяем, что самостоятельный вопрос посреди диалога отвечается из FAQ, а уточняющий — нет"""
+        mock_message = AsyncMock(spec=types.Message)
+        mock_message.chat = MagicMock(id=7)
+        mock_message.answer = AsyncMock()
+
+        mock_llm_client = AsyncMock(spec=LLMClient)
+        mock_llm_client.generate_answer.return_value = "Ответ LLM"
+        mock_faq = AsyncMock(spec=FAQ)
+        mock_faq.match.return_value = "Готовый ответ"
+
+        sessions = SessionStore()
+        sessions.append(7, "Что вы делали для Dodo Pizza?", "Робота-аналитика")
+
+        mock_message.text = "Сколько стоит бот?"
+        await question_handler(mock_message, mock_llm_client, sessions, mock_faq)
+
+        mock_faq.match.assert_called_once_with("Сколько стоит бот?")
+        mock_llm_client.generate_answer.assert_not_called()
+        mock_message.answer.assert_called_once_with("Готовый ответ", parse_mode="HTML")
+
+        mock_message.text = "а сколько это стоило?"
+        await question_handler(mock_message, mock_llm_client, sessions, mock_faq)
+
+        assert mock_faq.match.call_count == 1
+        mock_llm_client.generate_answer.assert_called_once()
+
 
 class TestCreateBot:
     @pytest.mark.asyncio
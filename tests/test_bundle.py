@@ -0,0 +1,136 @@
+import json
+import pytest
+import numpy as np
+from unittest.mock import patch
+
+from src import bundle, rag
+from src.bundle import BundleError, build, current, read_index_header, validate
+
+
+@pytest.fixture
+def bundles_dir(tmp_path):
+    with patch.object(bundle, "BUNDLES_DIR", tmp_path / "index"), \
+            patch.object(bundle, "CURRENT_LINK", tmp_path / "index" / "current"):
+        yield tmp_path / "index"
+
+
+@pytest.fixture
+def content_path(tmp_path):
+    path = tmp_path / "content.json"
+    path.write_text(json.dumps([
+        {"url": f"https://eora.ru/cases/{i}", "text": f"Кейс {i}"} for i in range(5)
+    ], ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+class TestBundle:
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_build_publish_and_validate(self, bundles_dir, content_path):
+        """Проверяем сборку версии, manifest и переключение current"""
+        bundle_dir = await build("sq8", content_path=content_path)
+
+        with patch("config.index_type", "sq8"):
+            manifest = validate(bundle_dir, deep=True)
+            assert current() == bundle_dir
+        assert manifest["ntotal"] == 5
+        assert manifest["dim"] == 16
+        assert manifest["params"]["index_type"] == "sq8"
+        assert set(manifest["files"]) == {"index.faiss", "content.json", "embeddings.npy"}
+        assert (bundles_dir / "current").resolve() == bundle_dir
+        assert read_index_header(bundle_dir / "index.faiss") == (16, 5)
+        assert not [path for path in bundles_dir.iterdir() if path.name.startswith(".")]
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_invalid_bundle_rejected(self, bundles_dir, content_path):
+        """Проверяем, что измененный content, обрезанный индекс и чужая модель не проходят проверку"""
+        bundle_dir = await build("flat", content_path=content_path)
+
+        with open(bundle_dir / "content.json", "a", encoding="utf-8") as f:
+            f.write(" ")
+        with pytest.raises(BundleError):
+            validate(bundle_dir)
+        assert current() is None
+
+        bundle_dir = await build("flat", content_path=content_path)
+        with patch("src.rag.MODEL_NAME", "other-model"):
+            with pytest.raises(BundleError):
+                validate(bundle_dir)
+
+        (bundle_dir / "index.faiss").write_bytes(b"IxFI")
+        with pytest.raises(BundleError):
+            validate(bundle_dir)
+
+    @pytest.mark.asyncio
+    async def test_build_from_content_in_batches(self, bundles_dir, content_path, fake_embeddings):
+        """Проверяем, что готовый content.json кодируется порциями, а не одним вызовом"""
+        sizes = []
+
+        async def embeddings(texts: list[str]) -> np.ndarray:
+            sizes.append(len(texts))
+            return await fake_embeddings(texts)
+
+        with patch('src.rag.to_embeddings', side_effect=embeddings):
+            bundle_dir = await build("sq8", content_path=content_path, batch_size=2)
+
+        assert sizes == [2, 2, 1]
+        assert json.loads((bundle_dir / "content.json").read_text(encoding="utf-8")) == \
+            json.loads(content_path.read_text(encoding="utf-8"))
+        with patch("config.index_type", "sq8"):
+            manifest = validate(bundle_dir, deep=True)
+        assert manifest["params"] == {"index_type": "sq8", "batch_size": 2, "source": str(content_path)}
+        assert manifest["ntotal"] == 5
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_other_index_type_rejected(self, bundles_dir, content_path):
+        """Проверяем, что версия с другим INDEX_TYPE не считается текущей"""
+        with patch("config.index_type", "flat"):
+            bundle_dir = await build("flat", content_path=content_path)
+            assert current() == bundle_dir
+
+        with patch("config.index_type", "sq8"):
+            with pytest.raises(BundleError, match="index_type"):
+                validate(bundle_dir)
+            assert current() is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_unset_params_not_recorded(self, bundles_dir, content_path):
+        """Проверяем, что незаданные параметры pipeline не попадают в manifest"""
+        source = content_path.read_text(encoding="utf-8")
+
+        async def fake_crawl(links, content_path, index_path, index_type, **kwargs):
+            content_path.write_text(source, encoding="utf-8")
+            await rag.build_index(content_path, index_type, index_path, content_path.with_name("embeddings.npy"))
+
+        with patch("src.pipeline.build", side_effect=fake_crawl) as mock_pipeline_build:
+            bundle_dir = await build("flat", chunk_chars=None, batch_size=32)
+
+        assert mock_pipeline_build.call_args.kwargs["chunk_chars"] is None
+        params = validate(bundle_dir)["params"]
+        assert params == {"index_type": "flat", "batch_size": 32}
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_failed_build_keeps_current(self, bundles_dir, content_path):
+        """Проверяем, что упавшая сборка не трогает текущую версию и не оставляет мусор"""
+        bundle_dir = await build("flat", content_path=content_path)
+
+        with patch('src.rag.to_embeddings', side_effect=RuntimeError("encoder")):
+            with pytest.raises(RuntimeError):
+                await build("flat", content_path=content_path)
+
+        assert current() == bundle_dir
+        assert sorted(path.name for path in bundles_dir.iterdir()) == sorted(["current", bundle_dir.name])
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_prune_keeps_recent(self, bundles_dir, content_path):
+        """Проверяем, что хранятся только последние версии"""
+        built = [await build("flat", content_path=content_path) for _ in range(5)]
+
+        versions = sorted(path for path in bundles_dir.iterdir() if path.name != "current")
+        assert versions == built[-3:]
+        assert current() == built[-1]
@@ -0,0 +1,75 @@
+import json
+import logging
+import queue
+import sys
+from unittest.mock import patch
+
+import config
+
+
+class TestLogging:
+    def test_root_logger_uses_queue(self):
+        """Проверяем, что запись в лог только кладет запись в очередь"""
+        handlers = logging.getLogger().handlers
+        assert any(isinstance(handler, logging.handlers.QueueHandler) for handler in handlers)
+        log_path = str(config.LOG_FILE)
+        assert not any(getattr(handler, "baseFilename", None) == log_path for handler in handlers)
+        assert any(
+            isinstance(handler, logging.handlers.RotatingFileHandler)
+            for handler in config.log_listener.handlers
+        )
+
+    def test_tests_do_not_write_project_log(self):
+        """Проверяем, что тесты пишут лог во временный файл, а не в data/logs"""
+        assert config.LOG_FILE != config.LOGS_DIR / "log.txt"
+
+    def test_json_formatter(self):
+        """Проверяем структурированный формат записи"""
+        record = logging.LogRecord("src.llm", logging.INFO, __file__, 1, "answer: %s", ("ok",), None)
+
+        data = json.loads(config.JsonFormatter().format(record))
+
+        assert data["logger"] == "src.llm"
+        assert data["level"] == "INFO"
+        assert data["message"] == "answer: ok"
+
+    def _queued(self, formatter: logging.Formatter) -> str:
+        log_queue = queue.SimpleQueue()
+        handler = config.ExcQueueHandler(log_queue)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.LogRecord(
+                "src.llm", logging.ERROR, __file__, 1, "failed: %s", ("q",), sys.exc_info()
+            )
+        handler.emit(record)
+        return formatter.format(log_queue.get_nowait())
+
+    def test_json_exc_through_queue(self):
+        """Проверяем, что после очереди traceback попадает в отдельное поле exc"""
+        data = json.loads(self._queued(config.JsonFormatter()))
+
+        assert data["message"] == "failed: q"
+        assert "ValueError: boom" in data["exc"]
+
+    def test_text_exc_through_queue(self):
+        """Проверяем, что в текстовом формате traceback идет после сообщения"""
+        text = self._queued(logging.Formatter("%(message)s"))
+
+        assert text.startswith("failed: q\n")
+        assert text.count("ValueError: boom") == 1
+
+
+class TestPayloadSampling:
+    def test_sample_payload_always(self):
+        """Проверяем логирование полных текстов при доле 1"""
+        with patch('config.log_payload_rate', 1.0):
+            assert config.sample_payload() is True
+        assert config.payload_sampled() is True
+
+    def test_sample_payload_never(self):
+        """Проверяем отключение полных текстов при доле 0"""
+        with patch('config.log_payload_rate', 0.0):
+            assert config.sample_payload() is False
+        assert config.payload_sampled() is False
@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+
+from src import degrade, metrics
+from src.degrade import CACHED, LINKS, NORMAL, REDUCED, LoadShedder, links_answer
+
+
+@pytest.fixture
+def shedder():
+    shedder = LoadShedder(
+        max_in_flight=4,
+        budgets={"embed": 0.5, "llm": 8.0},
+        window=30.0,
+        step_interval=5.0,
+        cooldown=30.0
+    )
+    # Замеры в тестах идут с now=1000 и дальше
+    shedder._changed = shedder._last_high = 0.0
+    shedder.start()
+    yield shedder
+    shedder.stop()
+
+
+class TestLoadShedder:
+    def test_steps_down_under_slow_llm(self, shedder):
+        """Проверяем пошаговое повышение уровня, пока LLM медленнее бюджета"""
+        levels = []
+        for second in range(0, 20, 5):
+            shedder.observe("llm", 12.0, now=1000.0 + second)
+            levels.append(shedder.level)
+
+        assert levels == [REDUCED, CACHED, LINKS, LINKS]
+        assert degrade.DEGRADATION_LEVEL.get() == LINKS
+
+    def test_queue_depth_pressure(self, shedder):
+        """Проверяем, что очередь вопросов сверх лимита повышает уровень"""
+        with shedder.track(), shedder.track(), shedder.track():
+            assert shedder.level == NORMAL
+            with shedder.track() as level:
+                assert level == REDUCED
+        assert shedder.in_flight == 0
+
+    def test_recovers_when_pressure_drops(self, shedder):
+        """Проверяем возврат на ступень за каждый cooldown без нагрузки"""
+        for second in range(0, 15, 5):
+            shedder.observe("llm", 12.0, now=1000.0 + second)
+        assert shedder.level == LINKS
+
+        # Медленные замеры выходят из окна, дальше только быстрые ответы
+        assert shedder.update(now=1030.0) == LINKS
+        assert shedder.update(now=1045.0) == LINKS
+        assert shedder.update(now=1076.0) == CACHED
+        assert shedder.update(now=1140.0) == NORMAL
+
+    def test_holds_level_between_thresholds(self, shedder):
+        """Проверяем гистерезис: давление между recover_ratio и 1 не меняет уровень"""
+        shedder.observe("embed", 0.6, now=1000.0)
+        assert shedder.level == REDUCED
+        for second in range(10, 200, 10):
+            shedder.observe("embed", 0.3, now=1000.0 + second)
+        assert shedder.level == REDUCED
+
+        shedder.observe("embed", 0.1, now=1300.0)
+        assert shedder.level == NORMAL
+
+    @pytest.mark.asyncio
+    async def test_recovers_without_traffic(self):
+        """Проверяем, что без запросов уровень и метрика возвращаются к normal по таймеру"""
+        shedder = LoadShedder(window=0.01, step_interval=0.0, cooldown=0.02)
+        shedder.start()
+        try:
+            shedder.observe("llm", 100.0)
+            assert shedder.level == REDUCED
+            await asyncio.sleep(0.15)
+            assert shedder.level == NORMAL
+            assert degrade.DEGRADATION_LEVEL.get() == NORMAL
+        finally:
+            shedder.stop()
+        assert shedder._ticker is None
+
+    def test_stage_hook_measures_spans(self, shedder):
+        """Проверяем замер стадий через metrics.span"""
+        with metrics.span("llm"), metrics.span("search"):
+            pass
+
+        assert len(shedder._samples["llm"]) == 1
+        assert "search" not in shedder._samples
+
+    def test_disabled_until_started(self):
+        """Проверяем, что без start уровень не меняется"""
+        shedder = LoadShedder(max_in_flight=1)
+        with shedder.track(), shedder.track():
+            assert shedder.level == NORMAL
+        assert shedder._enter_stage not in metrics.stage_hooks
+
+
+class TestLinksAnswer:
+    def test_links_from_results(self):
+        """Проверяем ответ ссылками: заголовок — первая строка, без повторов URL"""
+        results = [
+            {"url": "https://eora.ru/cases/1", "text": "Бот для <Магнита>\n\nТекст"},
+            {"url": "https://eora.ru/cases/1", "text": "Другой фрагмент"},
+            {"url": "https://eora.ru/cases/2?a=1&b=2", "text": "x" * 150},
+        ]
+
+        answer = links_answer(results)
+
+        lines = answer.split("\n")
+        assert lines[0] == degrade.LINKS_INTRO
+        assert lines[1] == '— <a href="https://eora.ru/cases/1">Бот для &lt;Магнита&gt;</a>'
+        assert lines[2].startswith('— <a href="https://eora.ru/cases/2?a=1&amp;b=2">xxx')
+        assert lines[2].endswith('...</a>') and len(lines) == 3
+
+    def test_nothing_found(self):
+        """Проверяем ответ, когда искать нечего"""
+        assert links_answer([]) == degrade.BUSY_TEXT
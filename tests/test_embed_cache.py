@@ -0,0 +1,104 @@
+import threading
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock
+
+from src import metrics
+from src.embed_cache import EmbeddingCache, SQLiteEmbeddingCache, query_key
+
+
+def make_encoder() -> AsyncMock:
+    async def encode(texts: list[str]) -> np.ndarray:
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+    return AsyncMock(side_effect=encode)
+
+
+class TestQueryKey:
+    def test_trivial_differences(self):
+        """Проверяем, что регистр, пробелы, пунктуация и ё не меняют ключ"""
+        assert query_key("  Что вы делали для Магнита?! ") == "что вы делали для магнита"
+        assert query_key("Ещё\xa0кейсы,  пожалуйста") == query_key("еще кейсы пожалуйста")
+
+    def test_different_questions(self):
+        """Проверяем, что разные вопросы не склеиваются"""
+        assert query_key("Сколько стоит бот?") != query_key("Сколько стоит сайт?")
+
+
+class TestEmbeddingCache:
+    @pytest.mark.asyncio
+    async def test_hits_skip_encoder(self):
+        """Проверяем, что повтор запроса не вызывает модель и считается в метриках"""
+        cache = EmbeddingCache(max_size=10)
+        encode = make_encoder()
+        hits_before = metrics.CACHE_REQUESTS.get(cache="embedding", result="hit")
+
+        first = await cache.embed(["Сколько стоит бот?"], encode)
+        second = await cache.embed(["сколько  стоит бот"], encode)
+
+        encode.assert_awaited_once_with(["Сколько стоит бот?"])
+        np.testing.assert_array_equal(first, second)
+        assert metrics.CACHE_REQUESTS.get(cache="embedding", result="hit") == hits_before + 1
+
+    @pytest.mark.asyncio
+    async def test_batch_encodes_only_unique_misses(self):
+        """Проверяем, что в порции считаются только новые уникальные запросы, порядок сохраняется"""
+        cache = EmbeddingCache(max_size=10)
+        encode = make_encoder()
+        await cache.embed(["a"], encode)
+
+        embs = await cache.embed(["a", "bb", "BB!", "ccc"], encode)
+
+        assert encode.await_args_list[-1].args == (["bb", "ccc"],)
+        assert embs[:, 0].tolist() == [1.0, 2.0, 2.0, 3.0]
+        assert embs.dtype == np.float32
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_and_readonly(self):
+        """Проверяем вытеснение самых давно использованных и защиту от изменения"""
+        cache = EmbeddingCache(max_size=2)
+        encode = make_encoder()
+        await cache.embed(["a", "b"], encode)
+        cache.get("a")
+        await cache.embed(["c"], encode)
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        with pytest.raises(ValueError):
+            cache.get("a")[0] = 0.0
+
+
+class TestSQLiteEmbeddingCache:
+    @pytest.mark.asyncio
+    async def test_shared_between_instances(self, tmp_path):
+        """Проверяем, что вектор, посчитанный одним процессом, достается другому"""
+        path = tmp_path / "cache.sqlite"
+        encode = make_encoder()
+        await SQLiteEmbeddingCache(path, namespace="model").embed(["Сколько стоит бот?"], encode)
+
+        other = SQLiteEmbeddingCache(path, namespace="model")
+        emb = await other.embed(["сколько стоит бот"], encode)
+
+        encode.assert_awaited_once()
+        assert emb[0].tolist() == [18.0, 1.0]
+        assert SQLiteEmbeddingCache(path, namespace="other-model").get("сколько стоит бот") is None
+
+    @pytest.mark.asyncio
+    async def test_sqlite_calls_off_event_loop(self, tmp_path):
+        """Проверяем, что embed читает и пишет SQLite не в потоке event loop, одной порцией"""
+        cache = SQLiteEmbeddingCache(tmp_path / "cache.sqlite", namespace="model")
+        calls = []
+        for name in ("_load", "_save"):
+            method = getattr(cache, name)
+
+            def recorded(arg, name=name, method=method):
+                calls.append((name, threading.get_ident()))
+                return method(arg)
+
+            setattr(cache, name, recorded)
+
+        await cache.embed(["первый вопрос", "второй вопрос"], make_encoder())
+
+        assert [name for name, _ in calls] == ["_load", "_save"]
+        assert threading.get_ident() not in {thread for _, thread in calls}
+        cache.clear()
+        assert len(await cache.lookup(["первый вопрос"])) == 0
@@ -0,0 +1,150 @@
+import json
+import pytest
+from unittest.mock import AsyncMock
+
+from src.faq import FAQ, build_faq, bundle_hash, questions_from_file, questions_from_logs, vet_answer
+
+
+@pytest.fixture
+def embedding_mapping() -> dict[str, list[float]]:
+    return {
+        "Что вы делали для ритейлеров?": [1.0, 0.0, 0.0],
+        "что делали для ритейла": [0.98, 0.2, 0.0],
+        "Сколько стоит бот?": [0.0, 1.0, 0.0],
+        "Погода в Казани": [0.0, 0.0, 1.0],
+    }
+
+
+class TestQuestionSources:
+    def test_questions_from_logs(self, tmp_path):
+        """Проверяем выбор частых вопросов из текстовых и JSON логов"""
+        (tmp_path / "log.txt").write_text(
+            "2024-01-01 10:00:00 question: Сколько стоит  бот?\n"
+            "2024-01-01 10:00:01 context: 10 символов\n"
+            '{"message": "question: Сколько стоит бот?"}\n'
+            "2024-01-01 10:00:02 question: Редкий вопрос\n",
+            encoding="utf-8"
+        )
+        (tmp_path / "log.txt.1").write_text("2024-01-01 question: Сколько стоит бот?\n", encoding="utf-8")
+
+        assert questions_from_logs(tmp_path, min_count=2) == ["Сколько стоит бот?"]
+        assert questions_from_logs(tmp_path, min_count=1) == ["Сколько стоит бот?", "Редкий вопрос"]
+
+    def test_questions_from_file(self, tmp_path):
+        """Проверяем чтение txt и JSONL"""
+        path = tmp_path / "questions.jsonl"
+        path.write_text('Первый вопрос\n\n{"question": "Второй вопрос"}\n', encoding="utf-8")
+
+        assert questions_from_file(path) == ["Первый вопрос", "Второй вопрос"]
+
+    def test_vet_answer(self):
+        """Проверяем отсев ответов не в формате"""
+        assert vet_answer("Мы делали бота [1]")
+        assert not vet_answer('{"content": "сырой JSON"}')
+        assert not vet_answer("  ")
+
+
+class TestFAQ:
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_match_above_threshold(self):
+        """Проверяем ответ на похожий вопрос и промах на непохожий"""
+        faq = FAQ(threshold=0.9)
+        await faq.add("Что вы делали для ритейлеров?", "Бота для Магнита")
+
+        assert await faq.match("что делали для ритейла") == "Бота для Магнита"
+        assert await faq.match("Погода в Казани") is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_unvetted_not_served(self):
+        """Проверяем, что непроверенные ответы не отдаются"""
+        faq = FAQ(threshold=0.9)
+        await faq.add("Что вы делали для ритейлеров?", "Черновик", vetted=False)
+
+        assert await faq.match("Что вы делали для ритейлеров?") is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_add_dedup_and_save(self, tmp_path):
+        """Проверяем дедупликацию и сохранение с загрузкой"""
+        faq = FAQ()
+        assert await faq.add("Что вы делали для ритейлеров?", "Ответ 1")
+        assert not await faq.add("что делали для ритейла", "Ответ 2", dedup=0.95)
+        assert await faq.add("Сколько стоит бот?", "Ответ 3")
+
+        faq.save(tmp_path / "faq.json", tmp_path / "faq.faiss")
+        loaded = await FAQ.load(tmp_path / "faq.json", tmp_path / "faq.faiss", threshold=0.99)
+
+        assert len(loaded) == 2
+        assert await loaded.match("Сколько стоит бот?") == "Ответ 3"
+
+    @pytest.mark.asyncio
+    async def test_load_missing(self, tmp_path):
+        """Проверяем пустой FAQ без файлов"""
+        faq = await FAQ.load(tmp_path / "faq.json", tmp_path / "faq.faiss")
+
+        assert len(faq) == 0
+        assert await faq.match("вопрос") is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_build_faq(self):
+        """Проверяем прогон вопросов через LLMClient с проверкой ответов"""
+        llm_client = AsyncMock()
+        llm_client.generate_answer.side_effect = [
+            'Бота для Магнита <a href="https://eora.ru/cases/magnit">[1]</a>',
+            '{"content": "сломанный"',
+            "Без источников",
+        ]
+
+        faq = await build_faq(
+            llm_client, ["Что вы делали для ритейлеров?", "Сколько стоит бот?", "Погода в Казани"]
+        )
+
+        assert [entry["question"] for entry in faq.entries] == ["Что вы делали для ритейлеров?", "Погода в Казани"]
+        assert faq.entries[0]["vetted"] is True
+        # Ответ без ссылок на материалы ждет ручной проверки
+        assert faq.entries[1]["vetted"] is False
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_approve_pending(self):
+        """Проверяем одобрение непроверенных ответов по номерам и всех сразу"""
+        faq = FAQ(threshold=0.9)
+        await faq.add("Что вы делали для ритейлеров?", "Бота для Магнита", vetted=False)
+        await faq.add("Сколько стоит бот?", "Зависит от задачи", vetted=False)
+
+        assert [num for num, _ in faq.pending()] == [0, 1]
+        assert faq.approve([1, 5]) == 1
+        assert await faq.match("Сколько стоит бот?") == "Зависит от задачи"
+        assert await faq.match("Что вы делали для ритейлеров?") is None
+
+        assert faq.approve() == 1
+        assert faq.pending() == []
+        assert await faq.match("Что вы делали для ритейлеров?") == "Бота для Магнита"
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_stale_entries_after_rebuild(self, tmp_path):
+        """Проверяем, что ответы по другой версии индекса не отдаются и уходят на перегенерацию"""
+        faq = FAQ(threshold=0.9, content_hash="old")
+        await faq.add("Что вы делали для ритейлеров?", "Старый ответ")
+        faq.save(tmp_path / "faq.json", tmp_path / "faq.faiss")
+
+        loaded = await FAQ.load(tmp_path / "faq.json", tmp_path / "faq.faiss", threshold=0.9, content_hash="new")
+        assert loaded.entries[0]["content_sha256"] == "old"
+        assert await loaded.match("Что вы делали для ритейлеров?") is None
+
+        await loaded.add("Сколько стоит бот?", "Новый ответ")
+        assert loaded.drop_stale() == ["Что вы делали для ритейлеров?"]
+        assert [entry["question"] for entry in loaded.entries] == ["Сколько стоит бот?"]
+        assert loaded.index.ntotal == 1
+        assert await loaded.match("Сколько стоит бот?") == "Новый ответ"
+
+    def test_bundle_hash(self, tmp_path):
+        """Проверяем хэш content.json из manifest версии индекса"""
+        (tmp_path / "manifest.json").write_text(json.dumps({"content_sha256": "abc"}), encoding="utf-8")
+
+        assert bundle_hash(tmp_path) == "abc"
+        assert bundle_hash(None) is None
@@ -3,6 +3,8 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock, patch, mock_open
 from pathlib import Path
 
+import config
+from src import degrade
 from src.llm import LLMClient, base_prompt
 
 
@@ -32,6 +34,7 @@ class TestLLMClient:
         """Проверяем асинхронную инициализацию"""
         mock_index = MagicMock()
         mock_rag.load_index = AsyncMock(return_value=mock_index)
+        mock_rag.load_embeddings = AsyncMock(return_value=None)
         
         mock_content = [{"url": "test.com", "text": "test content"}]
         mock_rag.CONTENT_PATH.read_text.return_value = json.dumps(mock_content)
@@ -40,7 +43,26 @@ class TestLLMClient:
         await client.init()
         
         assert client.index is mock_index
+        assert client.embeddings is None
         mock_rag.load_index.assert_called_once()
+        mock_rag.load_embeddings.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch('src.llm.rag')
+    async def test_init_from_bundle(self, mock_rag, tmp_path):
+        """Проверяем загрузку контента и индекса из версии индекса"""
+        mock_rag.load_index = AsyncMock(return_value=MagicMock())
+        mock_rag.load_embeddings = AsyncMock(return_value=None)
+        mock_content = [{"url": "bundle.com", "text": "bundle content"}]
+        (tmp_path / "content.json").write_text(json.dumps(mock_content), encoding="utf-8")
+
+        client = LLMClient(tmp_path)
+        await client.init()
+
+        assert client.content == mock_content
+        mock_rag.CONTENT_PATH.read_text.assert_not_called()
+        mock_rag.load_index.assert_called_once_with(tmp_path / "index.faiss")
+        mock_rag.load_embeddings.assert_called_once_with(tmp_path / "embeddings.npy")
 
     @pytest.mark.asyncio
     @patch('src.llm.rag')
@@ -65,7 +87,10 @@ class TestLLMClient:
             client.index,
             client.content,
             user_question,
-            top_k=2
+            top_k=2,
+            embeddings=None,
+            mmr_lambda=config.mmr_lambda,
+            per_url=config.per_url_cap
         )
         
         expected_prompt = [
@@ -77,6 +102,41 @@ class TestLLMClient:
         
         assert prompt == expected_prompt
 
+    @patch('src.llm.rag')
+    def test_build_messages_without_question_log(self, mock_rag):
+        """Проверяем, что вопрос пакетного прогона не попадает в лог, из которого собирается FAQ"""
+        mock_rag.CONTENT_PATH.read_text.return_value = json.dumps([])
+        client = LLMClient()
+
+        with patch('src.llm.logger') as mock_logger:
+            client.build_messages("Вопрос из пакета", [], log_question=False)
+            client.build_messages("Вопрос пользователя", [])
+
+        logged = [call.args[0] for call in mock_logger.info.call_args_list]
+        assert "question: Вопрос пользователя" in logged
+        assert not any("Вопрос из пакета" in line for line in logged)
+
+    @pytest.mark.asyncio
+    @patch('src.llm.rag')
+    async def test_build_prompt_with_history(self, mock_rag):
+        """Проверяем историю в промпте и поиск по уточненному запросу"""
+        mock_rag.CONTENT_PATH.read_text.return_value = json.dumps([])
+        mock_rag.retrieve = AsyncMock(return_value=[])
+
+        client = LLMClient()
+        client.index = MagicMock()
+        history = [("user", "Что вы делали для Dodo Pizza?"), ("assistant", "Робота-аналитика")]
+
+        prompt = await client.build_prompt("а сколько это стоило?", history)
+
+        assert mock_rag.retrieve.call_args[0][2] == "Что вы делали для Dodo Pizza? а сколько это стоило?"
+        assert prompt == [
+            {"role": "system", "content": base_prompt},
+            {"role": "user", "content": "Что вы делали для Dodo Pizza?"},
+            {"role": "assistant", "content": "Робота-аналитика"},
+            {"role": "user", "content": "а сколько это стоило?"},
+        ]
+
     @pytest.mark.asyncio
     async def test_generate_answer_success(self):
         """Проверяем успешную генерацию ответа"""
@@ -156,3 +216,62 @@ class TestLLMClient:
         result = await client.generate_answer("Тестовый вопрос")
         
         assert result == "Ответ из блока кода"
+
+
+class TestLLMClientDegraded:
+    @pytest.mark.asyncio
+    @patch('src.llm.rag')
+    async def test_reduced_context(self, mock_rag):
+        """Проверяем, что под нагрузкой контекст меньше и без MMR и точного пересчета"""
+        mock_rag.CONTENT_PATH.read_text.return_value = json.dumps([])
+        mock_rag.retrieve = AsyncMock(return_value=[])
+        client = LLMClient()
+        client.index = MagicMock()
+        client.embeddings = MagicMock()
+
+        with patch.object(degrade.shedder, "level", degrade.REDUCED):
+            await client.build_prompt("Тестовый вопрос")
+
+        mock_rag.retrieve.assert_called_once_with(client.index, client.content, "Тестовый вопрос", top_k=1)
+
+    @pytest.mark.asyncio
+    @patch('src.llm.rag')
+    async def test_links_only_without_llm(self, mock_rag):
+        """Проверяем ответ ссылками без вызова LLM на последней ступени"""
+        mock_rag.CONTENT_PATH.read_text.return_value = json.dumps([])
+        mock_rag.retrieve = AsyncMock(return_value=[
+            {"url": "https://eora.ru/cases/1", "text": "Бот для Магнита\n\nПодробности"},
+        ])
+        client = LLMClient()
+        client.index = MagicMock()
+        client.complete = AsyncMock()
+
+        with patch.object(degrade.shedder, "level", degrade.LINKS):
+            result = await client.generate_answer("Что вы делали для ритейлеров?")
+
+        client.complete.assert_not_called()
+        assert '<a href="https://eora.ru/cases/1">Бот для Магнита</a>' in result
+
+    @pytest.mark.asyncio
+    @patch('src.llm.rag')
+    async def test_cached_answer_for_repeated_question(self, mock_rag):
+        """Проверяем, что повторный вопрос под нагрузкой отвечается из кэша, а без нагрузки — заново"""
+        mock_rag.CONTENT_PATH.read_text.return_value = json.dumps([])
+        client = LLMClient()
+        client.build_prompt = AsyncMock(return_value=[])
+        client.complete = AsyncMock(return_value="Ответ LLM")
+
+        with patch.object(degrade.shedder, "answers", degrade.AnswerCache()):
+            assert await client.generate_answer("Что такое EORA?") == "Ответ LLM"
+            assert await client.generate_answer("что такое eora") == "Ответ LLM"
+            assert client.complete.await_count == 2
+
+            with patch.object(degrade.shedder, "level", degrade.CACHED):
+                assert await client.generate_answer("Что такое EORA") == "Ответ LLM"
+                history = [("user", "Привет"), ("assistant", "Здравствуйте")]
+                # Самостоятельный вопрос посреди диалога тоже берется из кэша, уточняющий — нет
+                assert await client.generate_answer("Что такое EORA?", history=history) == "Ответ LLM"
+                assert client.complete.await_count == 2
+                await client.generate_answer("а сколько это стоит?", history=history)
+
+        assert client.complete.await_count == 3
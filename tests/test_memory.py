@@ -0,0 +1,115 @@
+from unittest.mock import patch
+
+from src.memory import (
+    SessionStore, SQLiteSessionStore, compact_text, condense_query, is_follow_up, trim_history
+)
+
+
+class TestHelpers:
+    def test_compact_text(self):
+        """Проверяем очистку HTML и обрезку реплики"""
+        text = 'Мы делали <a href="https://eora.ru">[1]</a>   бота'
+        assert compact_text(text, 100) == "Мы делали [1] бота"
+        assert compact_text(text, 9) == "Мы делали"
+
+    def test_is_follow_up(self):
+        """Проверяем распознавание уточняющих вопросов"""
+        assert is_follow_up("а сколько это стоило?")
+        assert is_follow_up("Подробнее")
+        assert not is_follow_up("Какие проекты вы делали для ритейлеров в прошлом году?")
+        assert is_follow_up("Почему?")
+        assert is_follow_up("А для X5?")
+
+    def test_short_standalone_question(self):
+        """Проверяем, что короткий самостоятельный вопрос не считается уточняющим"""
+        history = [("user", "Что вы делали для Dodo Pizza?"), ("assistant", "Робота-аналитика")]
+
+        assert not is_follow_up("Сколько стоит чат-бот?")
+        assert not is_follow_up("Делаете голосовых ботов?")
+        assert condense_query("Сколько стоит чат-бот?", history) == "Сколько стоит чат-бот?"
+
+    def test_condense_query(self):
+        """Проверяем дополнение уточняющего вопроса прошлым вопросом"""
+        history = [("user", "Что вы делали для Dodo Pizza?"), ("assistant", "Робота-аналитика")]
+
+        assert condense_query("а сколько это стоило?", history) == "Что вы делали для Dodo Pizza? а сколько это стоило?"
+        assert condense_query("а сколько это стоило?", None) == "а сколько это стоило?"
+        question = "Какие проекты вы делали для ритейлеров в прошлом году?"
+        assert condense_query(question, history) == question
+
+    def test_trim_history(self):
+        """Проверяем обрезку истории по бюджету токенов с конца"""
+        history = [("user", "а" * 300), ("assistant", "б" * 30), ("user", "в" * 30)]
+
+        assert trim_history(history, 30) == history[1:]
+        assert trim_history(history, 0) == []
+        assert trim_history(None, 100) == []
+
+
+class TestSessionStore:
+    def test_append_and_get(self):
+        """Проверяем хранение ограниченного числа реплик"""
+        store = SessionStore(max_turns=2, ttl=60, max_chats=10)
+        for i in range(3):
+            store.append(1, f"вопрос {i}", f"ответ {i}")
+
+        assert store.get(1) == [
+            ("user", "вопрос 1"), ("assistant", "ответ 1"),
+            ("user", "вопрос 2"), ("assistant", "ответ 2"),
+        ]
+        assert store.get(2) == []
+
+    def test_zero_max_turns_disables_history(self, tmp_path):
+        """Проверяем, что SESSION_MAX_TURNS=0 выключает историю, а не снимает лимит"""
+        for store in (SessionStore(max_turns=0), SQLiteSessionStore(tmp_path / "s.sqlite", max_turns=0)):
+            store.append(1, "вопрос", "ответ")
+            store.append(1, "вопрос 2", "ответ 2")
+            assert store.get(1) == []
+
+    def test_ttl_expiry(self):
+        """Проверяем истечение сессий по TTL"""
+        store = SessionStore(ttl=10)
+        with patch('src.memory.time.monotonic', return_value=100.0):
+            store.append(1, "вопрос", "ответ")
+        with patch('src.memory.time.monotonic', return_value=111.0):
+            assert store.get(1) == []
+        assert len(store) == 0
+
+    def test_max_chats_bounded(self):
+        """Проверяем, что число чатов в памяти не растет выше лимита"""
+        store = SessionStore(max_chats=100)
+        for chat_id in range(10_000):
+            store.append(chat_id, "вопрос", "ответ")
+
+        assert len(store) == 100
+        assert store.get(0) == []
+        assert store.get(9_999) != []
+
+    def test_clear(self):
+        """Проверяем сброс истории чата"""
+        store = SessionStore()
+        store.append(1, "вопрос", "ответ")
+        store.clear(1)
+        assert store.get(1) == []
+
+
+class TestSQLiteSessionStore:
+    def test_persists_between_instances(self, tmp_path):
+        """Проверяем хранение истории в SQLite"""
+        path = tmp_path / "sessions.sqlite"
+        SQLiteSessionStore(path, max_turns=1).append(1, "вопрос", "<b>ответ</b>")
+        store = SQLiteSessionStore(path, max_turns=1)
+        store.append(1, "второй", "ответ 2")
+
+        assert store.get(1) == [("user", "второй"), ("assistant", "ответ 2")]
+        assert len(store) == 1
+        store.clear(1)
+        assert store.get(1) == []
+
+    def test_ttl_expiry(self, tmp_path):
+        """Проверяем истечение сессий по TTL"""
+        store = SQLiteSessionStore(tmp_path / "sessions.sqlite", ttl=10)
+        with patch('src.memory.time.time', return_value=100.0):
+            store.append(1, "вопрос", "ответ")
+        with patch('src.memory.time.time', return_value=111.0):
+            assert store.get(1) == []
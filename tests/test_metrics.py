@@ -0,0 +1,86 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src import metrics
+
+
+class TestHistogram:
+    def test_observe_and_render(self):
+        """Проверяем накопление бакетов и формат Prometheus"""
+        hist = metrics.Histogram("test_seconds", "Тест", ("stage",), buckets=(0.1, 1.0))
+        hist.observe(0.05, stage="embed")
+        hist.observe(0.5, stage="embed")
+
+        lines = hist.render()
+
+        assert '# TYPE test_seconds histogram' in lines
+        assert 'test_seconds_bucket{stage="embed",le="0.1"} 1.0' in lines
+        assert 'test_seconds_bucket{stage="embed",le="1.0"} 2.0' in lines
+        assert 'test_seconds_bucket{stage="embed",le="+Inf"} 2.0' in lines
+        assert 'test_seconds_count{stage="embed"} 2.0' in lines
+        assert hist.count(stage="embed") == 2
+        metrics.REGISTRY.remove(hist)
+
+    def test_disabled_metrics(self):
+        """Проверяем, что выключенные метрики ничего не пишут"""
+        hist = metrics.Histogram("test_disabled_seconds", "Тест")
+        with patch('src.metrics.config.metrics_enabled', False):
+            hist.observe(1.0)
+            with metrics.span("embed"):
+                pass
+        assert hist.count() == 0
+        metrics.REGISTRY.remove(hist)
+
+
+class TestSpans:
+    def test_span_records_request_timings(self):
+        """Проверяем сбор таймингов стадий одного запроса"""
+        before = metrics.STAGE_SECONDS.count(stage="search")
+
+        with metrics.request_timings() as timings:
+            with metrics.span("search"):
+                pass
+            with metrics.span("search"):
+                pass
+
+        assert set(timings) == {"search"}
+        assert metrics.STAGE_SECONDS.count(stage="search") == before + 2
+
+    def test_span_outside_request(self):
+        """Проверяем span без контекста запроса"""
+        with metrics.span("embed"):
+            pass
+
+    def test_cache_hit_and_usage(self):
+        """Проверяем счетчики кэша и токенов"""
+        hits = metrics.CACHE_REQUESTS.get(cache="test", result="hit")
+        prompt_tokens = metrics.LLM_TOKENS.get(kind="prompt")
+
+        metrics.cache_hit("test", True)
+        metrics.record_usage(MagicMock(prompt_tokens=10, completion_tokens=5))
+        metrics.record_usage(None)
+
+        assert metrics.CACHE_REQUESTS.get(cache="test", result="hit") == hits + 1
+        assert metrics.LLM_TOKENS.get(kind="prompt") == prompt_tokens + 10
+
+
+class TestEndpoint:
+    @pytest.mark.asyncio
+    async def test_metrics_handler(self):
+        """Проверяем отдачу метрик по HTTP"""
+        metrics.cache_hit("test", False)
+
+        response = await metrics.metrics_handler(MagicMock())
+
+        assert response.content_type == "text/plain"
+        assert 'eora_cache_requests_total{cache="test",result="miss"}' in response.text
+
+    @pytest.mark.asyncio
+    async def test_server_listens_on_localhost_by_default(self):
+        """Проверяем, что без METRICS_HOST эндпоинт слушает только localhost"""
+        with patch("src.metrics.web.TCPSite") as mock_site:
+            mock_site.return_value.start = AsyncMock()
+            runner = await metrics.start_server(port=9199)
+            await runner.cleanup()
+
+        assert mock_site.call_args.args[1:] == ("127.0.0.1", 9199)
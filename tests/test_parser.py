@@ -2,7 +2,76 @@ import pytest
 from unittest.mock import AsyncMock, patch
 from aiohttp import ClientError
 
-from src.parser import normalize, extract_tilda_content_html, extract_content_url, NBSP
+from bench.parser_bench import make_tilda_page
+from src.parser import (
+    normalize, extract_tilda_content_html, extract_content_url, NBSP,
+    extract_tilda_blocks, extract_tilda_blocks_soup, TildaExtractor
+)
+
+
+def page(body: str) -> str:
+    return f'<html><body><div id="allrecords">{body}</div></body></html>'
+
+
+# Разметка, на которой потоковый разбор легко разойтись с деревом BeautifulSoup
+EDGE_CASES = {
+    "nested_markup": page(
+        '<h1>Кейс <b>Магнит</b></h1><div data-elem-type="text"><div class="tn-atom">'
+        'Первый<br>абзац<br/><strong>жирный</strong>&nbsp;текст &laquo;в&nbsp;кавычках&raquo; &amp; 5&lt;6</div></div>'
+    ),
+    "atom_not_first_child": page(
+        '<h1>H</h1><div data-elem-type="text"><span>вне атома</span>'
+        '<div class="t-x tn-atom big">в атоме</div><div class="tn-atom">второй атом</div></div>'
+    ),
+    "nested_text_elements": page(
+        '<h1>H</h1><div data-elem-type="text">внешний <div data-elem-type="text">'
+        '<div class="tn-atom">внутренний</div></div> хвост</div>'
+    ),
+    "script_style_comment_template": page(
+        '<h1>H<!-- комментарий --></h1><div data-elem-type="text"><style>.a{}</style>'
+        '<script>var a = "<div>";</script>текст<!-- скрыто --> после<template><p>шаблон</p></template>'
+        '<ruby>漢<rt>kan</rt></ruby><![CDATA[данные]]></div></div>'
+    ),
+    "unclosed_and_stray_tags": page(
+        '<h1>H</h1></span><div data-elem-type="text"><p>без закрытия<p>еще</div>'
+        '<div data-elem-type="text"><div class="tn-atom">после</div></div></br><div/>'
+        '<div data-elem-type="text">конец страницы без закрытия'
+    ),
+    "h1_in_header_and_text_before_h1": page(
+        '<header><h1>Шапка</h1></header><div data-elem-type="text">до заголовка</div>'
+        '<div data-elem-type="text"><h1 class="tn-atom">Заголовок</h1></div>'
+        '<div data-elem-type="text">после</div>'
+    ),
+    "footer_before_h1": page(
+        '<footer id="t-footer"><div data-elem-type="text">подвал</div></footer>'
+        '<h1>Поздний заголовок</h1><div data-elem-type="text">текст</div>'
+    ),
+    "text_element_wraps_footer": page(
+        '<h1>H</h1><div data-elem-type="text">обертка <footer id="t-footer">подвал</footer>'
+        '<div data-elem-type="text">в подвале</div></div><div data-elem-type="text">после</div>'
+    ),
+    "no_allrecords": (
+        '<html><body><h1>Без allrecords</h1><div data-elem-type="text">текст</div>'
+        '<footer id="t-footer">подвал</footer></body></html>'
+    ),
+    "content_outside_allrecords": (
+        '<html><body><h1>Снаружи</h1><div data-elem-type="text">снаружи</div>'
+        '<div id="allrecords"><h1>Внутри</h1><div data-elem-type="text">внутри</div></div>'
+        '<div data-elem-type="text">после allrecords</div></body></html>'
+    ),
+    "skip_phrases_and_empty": page(
+        '<h1> </h1><h1>Второй</h1><div data-elem-type="text">   </div>'
+        '<div data-elem-type="text">Напишите нам</div>'
+        '<div data-elem-type="text"><div class="tn-atom"></div>есть текст вне атома</div>'
+    ),
+    "whitespace_and_lrm": page(
+        f'<h1>\u200eЗаголовок{NBSP}\n\t</h1><div data-elem-type="text">a\u200e  b{NBSP}{NBSP}c</div>'
+    ),
+    "uppercase_and_attrs": page(
+        '<H1 CLASS="x">Заголовок</H1><DIV DATA-ELEM-TYPE="text" data-elem-type="image">не текст</DIV>'
+        '<div data-elem-type=text class=tn-atom>без кавычек</div>'
+    ),
+}
 
 
 class TestNormalize:
@@ -183,3 +252,43 @@ class TestExtractTildaContentHtml:
             "Текст без tn-atom"
         ]
         assert result == expected
+
+
+class TestTildaExtractor:
+    @pytest.mark.parametrize("name", sorted(EDGE_CASES))
+    def test_equivalent_to_soup_edge_cases(self, name):
+        """Проверяем совпадение потокового разбора с BeautifulSoup на пограничной разметке"""
+        html = EDGE_CASES[name]
+        assert extract_tilda_blocks(html) == extract_tilda_blocks_soup(html)
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_equivalent_to_soup_generated_pages(self, seed):
+        """Проверяем совпадение на сгенерированных страницах Tilda"""
+        html = make_tilda_page(records=30, seed=seed)
+
+        result = extract_tilda_blocks(html)
+
+        assert result == extract_tilda_blocks_soup(html)
+        assert len(result) > 10
+        assert not any("Напишите нам" in block or "© 2024" in block for block in result)
+
+    def test_feed_in_chunks(self):
+        """Проверяем, что страницу можно разбирать частями по мере загрузки"""
+        html = make_tilda_page(records=10, seed=1)
+        extractor = TildaExtractor()
+
+        for start in range(0, len(html), 1000):
+            extractor.feed(html[start:start + 1000])
+        extractor.close()
+
+        assert extractor.blocks() == extract_tilda_blocks_soup(html)
+
+    def test_stops_after_footer(self):
+        """Проверяем, что разбор останавливается на подвале и не читает остаток страницы"""
+        extractor = TildaExtractor()
+
+        extractor.feed(page('<h1>H</h1><footer id="t-footer">подвал</footer>'))
+        extractor.feed('<div data-elem-type="text"><div class="tn-atom">мусор')
+
+        assert extractor._stopped
+        assert extractor.blocks() == ["H"]
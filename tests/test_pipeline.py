@@ -0,0 +1,179 @@
+import json
+import pytest
+import numpy as np
+from unittest.mock import patch
+
+import faiss
+
+from src.pipeline import ContentWriter, IndexWriter, build, split_chunks
+
+
+def page_html(title: str, *texts: str) -> str:
+    blocks = "".join(
+        f'<div data-elem-type="text"><div class="tn-atom">{text}</div></div>' for text in texts
+    )
+    return f'<div id="allrecords"><h1>{title}</h1>{blocks}<footer id="t-footer"></footer></div>'
+
+
+class TestSplitChunks:
+    def test_whole_page_by_default(self):
+        """Проверяем, что без chunk_chars страница — один чанк как в parser.main"""
+        assert split_chunks(["a", "b"]) == ["a\n\nb"]
+        assert split_chunks([]) == []
+
+    def test_split_by_size(self):
+        """Проверяем склейку блоков до chunk_chars"""
+        assert split_chunks(["aaaa", "bbbb", "cccccccccc", "d"], chunk_chars=10) == [
+            "aaaa\n\nbbbb",
+            "cccccccccc",
+            "d",
+        ]
+
+
+class TestWriters:
+    def test_content_writer(self, tmp_path):
+        """Проверяем, что поток записей — валидный JSON и файл появляется только при commit"""
+        path = tmp_path / "content.json"
+        writer = ContentWriter(path)
+        writer.write({"url": "a", "text": "Текст"})
+        writer.write({"url": "b", "text": "Еще"})
+        assert not path.exists()
+        writer.close()
+
+        assert json.loads(path.read_text(encoding="utf-8")) == [
+            {"url": "a", "text": "Текст"},
+            {"url": "b", "text": "Еще"},
+        ]
+
+        failed = ContentWriter(path)
+        failed.write({"url": "c", "text": "Битый"})
+        failed.close(commit=False)
+        assert len(json.loads(path.read_text(encoding="utf-8"))) == 2
+        assert not failed.tmp_path.exists()
+
+    @pytest.mark.parametrize("index_type", ["flat", "sq8"])
+    def test_index_writer_matches_make_index(self, tmp_path, index_type):
+        """Проверяем, что индекс по порциям находит то же, что и построенный сразу"""
+        rng = np.random.default_rng(0)
+        embs = rng.standard_normal((100, 8)).astype(np.float32)
+        embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+
+        writer = IndexWriter(index_type, train_size=32, embeddings_path=tmp_path / "embeddings.npy")
+        for start in range(0, 100, 10):
+            writer.add(embs[start:start + 10])
+        index = writer.finish(tmp_path / "index.faiss")
+
+        assert index.ntotal == 100
+        _, ids = index.search(embs[:5], 1)
+        assert ids[:, 0].tolist() == [0, 1, 2, 3, 4]
+        assert faiss.read_index(str(tmp_path / "index.faiss")).ntotal == 100
+        if index_type == "flat":
+            assert not (tmp_path / "embeddings.npy").exists()
+        else:
+            np.testing.assert_array_equal(np.load(tmp_path / "embeddings.npy"), embs)
+            assert not (tmp_path / "embeddings.f32").exists()
+
+
+class TestBuild:
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_build_end_to_end(self, tmp_path):
+        """Проверяем полный поток: ошибки загрузки пропускаются, id индекса совпадают с content"""
+        pages = {
+            f"https://eora.ru/cases/{i}": page_html(f"Кейс {i}", f"Текст {i}", "Еще текст")
+            for i in range(10)
+        }
+
+        async def fetch_html(session, url):
+            if url.endswith("broken"):
+                raise RuntimeError("404")
+            return pages[url]
+
+        report = await build(
+            list(pages) + ["https://eora.ru/broken"],
+            content_path=tmp_path / "content.json",
+            index_path=tmp_path / "index.faiss",
+            index_type="flat",
+            fetch_concurrency=3,
+            batch_size=4,
+            queue_size=2,
+            fetch_html=fetch_html
+        )
+
+        content = json.loads((tmp_path / "content.json").read_text(encoding="utf-8"))
+        assert sorted(item["url"] for item in content) == sorted(pages)
+        assert content[0]["text"].startswith("Кейс ")
+        assert faiss.read_index(str(tmp_path / "index.faiss")).ntotal == len(content)
+
+        assert report["chunks"] == 10
+        assert report["stages"]["fetch"]["items"] == 10
+        assert report["stages"]["fetch"]["errors"] == 1
+        assert report["stages"]["embed"]["items"] == 10
+        assert report["stages"]["add"]["items"] == 10
+
+    @pytest.mark.asyncio
+    async def test_build_failure_keeps_old_content(self, tmp_path):
+        """Проверяем, что при падении стадии прежний content.json не перезаписывается"""
+        content_path = tmp_path / "content.json"
+        content_path.write_text("[]", encoding="utf-8")
+
+        async def fetch_html(session, url):
+            return page_html("Кейс", "Текст")
+
+        with patch("src.rag.to_embeddings", side_effect=RuntimeError("encoder")):
+            with pytest.raises(RuntimeError):
+                await build(
+                    ["https://eora.ru/a"],
+                    content_path=content_path,
+                    index_path=tmp_path / "index.faiss",
+                    fetch_html=fetch_html
+                )
+
+        assert content_path.read_text(encoding="utf-8") == "[]"
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_empty_crawl_keeps_old_content(self, tmp_path):
+        """Проверяем, что обход без единого документа не перезаписывает content.json"""
+        content_path = tmp_path / "content.json"
+        content_path.write_text("[]", encoding="utf-8")
+
+        async def fetch_html(session, url):
+            raise RuntimeError("404")
+
+        with pytest.raises(ValueError):
+            await build(
+                ["https://eora.ru/a"],
+                content_path=content_path,
+                index_path=tmp_path / "index.faiss",
+                fetch_html=fetch_html
+            )
+
+        assert content_path.read_text(encoding="utf-8") == "[]"
+        assert not (tmp_path / "content.json.tmp").exists()
+        assert not (tmp_path / "index.faiss").exists()
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("fake_embeddings")
+    async def test_failed_finish_keeps_old_files(self, tmp_path):
+        """Проверяем, что при ошибке записи индекса content.json не заменяется и временные файлы удаляются"""
+        content_path = tmp_path / "content.json"
+        content_path.write_text("[]", encoding="utf-8")
+        (tmp_path / "index.faiss").write_bytes(b"old")
+
+        async def fetch_html(session, url):
+            return page_html("Кейс", "Текст")
+
+        with patch("src.pipeline.faiss.write_index", side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                await build(
+                    ["https://eora.ru/a", "https://eora.ru/b"],
+                    content_path=content_path,
+                    index_path=tmp_path / "index.faiss",
+                    index_type="sq8",
+                    fetch_html=fetch_html
+                )
+
+        assert content_path.read_text(encoding="utf-8") == "[]"
+        assert (tmp_path / "index.faiss").read_bytes() == b"old"
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["content.json", "index.faiss"]
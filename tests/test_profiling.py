@@ -0,0 +1,126 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import patch
+
+from src import metrics
+from src.profiling import LoopLagMonitor, Profiler
+
+
+def busy(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = Profiler(rate=1.0, interval=0.001, output_dir=tmp_path)
+    profiler.start()
+    yield profiler
+    profiler.stop()
+
+
+class TestProfiler:
+    @pytest.mark.asyncio
+    async def test_samples_attributed_to_stages(self, profiler):
+        """Проверяем, что время на loop и в to_thread попадает в свои стадии"""
+        with profiler.request(), metrics.span("total"):
+            with metrics.span("search"):
+                busy(0.05)
+            with metrics.span("embed"):
+                await asyncio.to_thread(busy, 0.05)
+
+        stages = profiler.stage_seconds()
+        assert stages.get("search", 0) > 0
+        assert stages.get("embed", 0) > 0
+        assert any(stack.startswith("search;") and "busy (test_profiling.py" in stack
+                   for stack in profiler.samples)
+        assert not profiler._frames
+
+    @pytest.mark.asyncio
+    async def test_not_sampled_request_costs_nothing(self, tmp_path):
+        """Проверяем, что неотобранный запрос не запускает сэмплер и не регистрирует стадии"""
+        profiler = Profiler(rate=0.5, interval=0.001, output_dir=tmp_path)
+        profiler.start()
+        try:
+            with patch("src.profiling.random.random", return_value=0.9):
+                with profiler.request() as sampled, metrics.span("search"):
+                    assert not sampled
+                    assert not profiler._frames
+                    busy(0.02)
+        finally:
+            assert profiler.stop() is None
+        assert not profiler.samples
+        assert metrics.stage_hooks == []
+
+    @pytest.mark.asyncio
+    async def test_dump_collapsed_stacks(self, profiler, tmp_path):
+        """Проверяем формат flamegraph: стек через ';' и число сэмплов"""
+        with profiler.request(), metrics.span("llm"):
+            busy(0.03)
+
+        path = profiler.dump()
+
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert path.parent == tmp_path and path.suffix == ".folded"
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+            assert stack.split(";")[0] in ("llm", "other", "idle")
+        assert not profiler.samples
+
+
+    @pytest.mark.asyncio
+    async def test_periodic_dump_while_running(self, tmp_path):
+        """Проверяем, что сэмплы пишутся в файл без остановки профилировщика"""
+        profiler = Profiler(rate=1.0, interval=0.001, output_dir=tmp_path, dump_interval=0.05)
+        profiler.start()
+        try:
+            with profiler.request(), metrics.span("llm"):
+                busy(0.03)
+            await asyncio.sleep(0.2)
+            assert list(tmp_path.glob("*.folded"))
+            assert not profiler.samples
+        finally:
+            profiler.stop()
+
+    @pytest.mark.asyncio
+    async def test_samples_capped_by_max_stacks(self, tmp_path):
+        """Проверяем, что при max_stacks разных стеках сэмплы сразу сбрасываются в файл"""
+        profiler = Profiler(rate=1.0, interval=0.001, output_dir=tmp_path, dump_interval=0, max_stacks=1)
+        profiler.start()
+        try:
+            with profiler.request(), metrics.span("search"):
+                busy(0.05)
+            assert list(tmp_path.glob("*.folded"))
+            assert len(profiler.samples) <= 1
+        finally:
+            profiler.stop()
+
+
+class TestLoopLagMonitor:
+    @pytest.mark.asyncio
+    async def test_blocking_callback_reported(self):
+        """Проверяем, что блокировка loop дольше порога логируется со стеком"""
+        monitor = LoopLagMonitor(threshold=0.05, interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        with patch("src.profiling.logger") as mock_logger:
+            busy(0.3)
+            await asyncio.sleep(0.03)
+        await monitor.stop()
+
+        assert monitor.blocks == 1
+        message = mock_logger.warning.call_args.args[0]
+        assert "event loop заблокирован" in message
+        assert "busy" in message
+
+    @pytest.mark.asyncio
+    async def test_disabled_by_zero_threshold(self):
+        """Проверяем, что порог 0 выключает монитор"""
+        monitor = LoopLagMonitor(threshold=0)
+        monitor.start()
+        assert monitor._task is None
+        await monitor.stop()
@@ -4,7 +4,18 @@ import numpy as np
 from unittest.mock import AsyncMock, MagicMock, patch, mock_open
 from pathlib import Path
 
-from src.rag import to_embeddings, build_index, load_index, retrieve, INDEX_PATH, CONTENT_PATH
+import faiss
+
+from src.rag import (
+    to_embeddings, build_index, load_index, load_embeddings, retrieve, make_index,
+    rescore, index_report, select, range_search, retrieve_batch, doc_groups, mmr, reconstruct,
+    INDEX_PATH, CONTENT_PATH
+)
+
+
+def random_embs(n: int, dim: int = 64, seed: int = 0) -> np.ndarray:
+    embs = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return embs / np.linalg.norm(embs, axis=1, keepdims=True)
 
 
 class TestToEmbeddings:
@@ -97,6 +108,66 @@ class TestBuildIndex:
         mock_index.add.assert_called_once_with(mock_embeddings)
 
 
+    @pytest.mark.asyncio
+    @patch('src.rag.to_embeddings')
+    async def test_build_index_fp16_saves_embeddings(self, mock_to_embeddings, tmp_path):
+        """Проверяем сжатый индекс и сохранение полноточных векторов"""
+        embs = random_embs(4)
+        mock_to_embeddings.return_value = embs
+
+        content_path = tmp_path / "content.json"
+        content_path.write_text(json.dumps([{"url": f"{i}.com", "text": str(i)} for i in range(4)]))
+        index_path = tmp_path / "index.faiss"
+        embeddings_path = tmp_path / "embeddings.npy"
+
+        with patch('src.rag.INDEX_PATH', index_path), patch('src.rag.EMBEDDINGS_PATH', embeddings_path):
+            await build_index(content_path, index_type="fp16")
+
+        index = faiss.read_index(str(index_path))
+        assert isinstance(index, faiss.IndexScalarQuantizer)
+        assert index.ntotal == 4
+        np.testing.assert_array_equal(await load_embeddings(embeddings_path), embs)
+
+
+class TestMakeIndex:
+    @pytest.mark.parametrize("index_type", ["flat", "fp16", "sq8", "pq"])
+    def test_make_index_types(self, index_type):
+        """Проверяем, что каждый тип индекса находит сам вектор первым"""
+        embs = random_embs(32)
+        index = make_index(embs, index_type, pq_m=8)
+
+        assert index.ntotal == 32
+        _, ids = index.search(embs[:1], 1)
+        if index_type != "pq":
+            assert ids[0][0] == 0
+
+    def test_make_index_unknown_type(self):
+        """Проверяем ошибку на неизвестный тип индекса"""
+        with pytest.raises(ValueError):
+            make_index(random_embs(2), "hnsw")
+
+    def test_rescore(self):
+        """Проверяем точный пересчет скоров кандидатов"""
+        embs = random_embs(10)
+        query = embs[3:4]
+
+        scores, ids = rescore(embs, query, np.array([7, 3, -1, 5]), top_k=2)
+
+        assert ids[0] == 3
+        assert len(ids) == 2
+        assert scores[0] == pytest.approx(1.0, abs=1e-5)
+
+    def test_index_report(self):
+        """Проверяем отчет по памяти и recall"""
+        embs = random_embs(64, dim=128)
+
+        report = index_report(embs, "sq8", top_k=5)
+
+        assert report["index_bytes"] < report["flat_bytes"]
+        assert report["saved_bytes"] == report["flat_bytes"] - report["index_bytes"]
+        assert 0.0 <= report["recall@5"] <= report["recall@5_rescored"] <= 1.0
+
+
 class TestLoadIndex:
     @pytest.mark.asyncio
     @patch('src.rag.asyncio.to_thread')
@@ -234,3 +305,109 @@ class TestRetrieve:
         result = await retrieve(mock_index, mock_content, query, top_k=1, min_score=0.5)
         
         assert result == []
+
+    @pytest.mark.asyncio
+    @patch('src.rag.to_embeddings')
+    async def test_retrieve_with_rescore(self, mock_to_embeddings):
+        """Проверяем поиск по сжатому индексу с точным пересчетом"""
+        embs = random_embs(8)
+        index = make_index(embs, "sq8")
+        mock_content = [{"url": f"test{i}.com", "text": f"Документ {i}"} for i in range(8)]
+        mock_to_embeddings.return_value = embs[5:6]
+
+        result = await retrieve(index, mock_content, "запрос", top_k=1, min_score=0.9, embeddings=embs)
+
+        assert result == [{"url": "test5.com", "text": "Документ 5"}]
+
+
+class TestRetrieveBatch:
+    def test_select_filters_and_dedups(self):
+        """Проверяем векторный отбор: пустые слоты, порог, дубли URL и top_k"""
+        scores = np.array([[0.9, 0.8, 0.7, 0.6], [0.9, 0.2, -np.inf, -np.inf]], dtype=np.float32)
+        ids = np.array([[0, 1, 2, 3], [3, 1, -1, -1]])
+        groups = np.array([0, 0, 1, 2])  # документы 0 и 1 — чанки одной страницы
+
+        rows = select(scores, ids, 0.5, 2, groups)
+
+        assert [row.tolist() for row in rows] == [[0, 2], [3]]
+        assert select(scores, ids, None, 3)[1].tolist() == [3, 1]
+
+    @pytest.mark.asyncio
+    async def test_range_search_matches_search(self):
+        """Проверяем, что range_search отдает то же, что search, но только выше порога"""
+        embs = random_embs(50)
+        index = make_index(embs, "flat")
+
+        scores, ids = await range_search(index, embs[:3], 0.2, 5)
+        exact_scores, exact_ids = index.search(embs[:3], 5)
+
+        for row in range(3):
+            above = exact_scores[row] > 0.2
+            assert ids[row][:above.sum()].tolist() == exact_ids[row][above].tolist()
+            assert (ids[row][above.sum():] == -1).all()
+
+    @pytest.mark.asyncio
+    @patch('src.rag.to_embeddings')
+    async def test_retrieve_batch(self, mock_to_embeddings):
+        """Проверяем поиск по нескольким запросам одним вызовом с дедупликацией по URL"""
+        embs = random_embs(6)
+        index = make_index(embs, "flat")
+        content = [{"url": f"test{i // 2}.com", "text": f"Документ {i}"} for i in range(6)]
+        mock_to_embeddings.return_value = embs[[0, 5]]
+
+        results = await retrieve_batch(index, content, ["первый", "второй"], top_k=3, min_score=None)
+
+        mock_to_embeddings.assert_called_once_with(["первый", "второй"])
+        assert [len(row) for row in results] == [3, 3]
+        assert results[0][0] == {"url": "test0.com", "text": "Документ 0"}
+        assert results[1][0] == {"url": "test2.com", "text": "Документ 5"}
+        for row in results:
+            assert len({item["url"] for item in row}) == len(row)
+        assert doc_groups(content).tolist() == [0, 0, 1, 1, 2, 2]
+
+
+class TestMMR:
+    def test_mmr_skips_near_duplicates(self):
+        """Проверяем, что почти дубль лучшего кандидата уступает другому документу"""
+        query = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+        cands = np.array([
+            [0.95, 0.31, 0.0],   # лучший
+            [0.94, 0.34, 0.0],   # почти копия лучшего
+            [0.8, 0.0, 0.6],     # другой аспект
+        ], dtype=np.float32)
+
+        assert mmr(query, cands, 2, mmr_lambda=1.0).tolist() == [0, 1]
+        assert mmr(query, cands, 2, mmr_lambda=0.5).tolist() == [0, 2]
+
+    def test_mmr_per_url_cap(self):
+        """Проверяем лимит кандидатов с одного URL"""
+        query = np.array([1.0, 0.0], dtype=np.float32)
+        cands = np.array([[1.0, 0.0], [0.9, 0.1], [0.5, 0.5]], dtype=np.float32)
+        groups = np.array([0, 0, 1])
+
+        assert mmr(query, cands, 3, 1.0, groups, per_url=1).tolist() == [0, 2]
+
+    def test_reconstruct(self):
+        """Проверяем восстановление векторов из индекса и из полноточных embeddings"""
+        embs = random_embs(10)
+        ids = np.array([7, 2])
+
+        np.testing.assert_allclose(reconstruct(make_index(embs, "flat"), ids), embs[ids])
+        np.testing.assert_allclose(reconstruct(make_index(embs, "sq8"), ids, embs), embs[ids])
+        np.testing.assert_allclose(reconstruct(make_index(embs, "fp16"), ids), embs[ids], atol=1e-3)
+
+    @pytest.mark.asyncio
+    @patch('src.rag.to_embeddings')
+    async def test_retrieve_with_mmr(self, mock_to_embeddings):
+        """Проверяем, что retrieve с per_url не отдает два чанка одной страницы"""
+        embs = random_embs(8)
+        index = make_index(embs, "flat")
+        content = [{"url": f"test{i // 4}.com", "text": f"Документ {i}"} for i in range(8)]
+        mock_to_embeddings.return_value = embs[:1]
+
+        result = await retrieve(
+            index, content, "запрос", top_k=2, min_score=None, mmr_lambda=0.7, per_url=1
+        )
+
+        assert result[0] == {"url": "test0.com", "text": "Документ 0"}
+        assert [item["url"] for item in result] == ["test0.com", "test1.com"]
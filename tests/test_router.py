@@ -0,0 +1,197 @@
+import asyncio
+import json
+import time
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+
+from bench.stub_llm import StubLLM
+from src.router import BACKEND_ERROR_RATE, Backend, LLMRouter, NoBackendAvailable, create_router
+
+
+MESSAGES = [{"role": "user", "content": "Контент из источника https://a.com:\nтекст"}]
+
+
+@pytest_asyncio.fixture
+async def stubs():
+    started: list[StubLLM] = []
+
+    async def start(**kwargs) -> tuple[StubLLM, str]:
+        stub = StubLLM(seed=0, **kwargs)
+        started.append(stub)
+        return stub, await stub.start()
+
+    yield start
+    for stub in started:
+        await stub.stop()
+
+
+def make_backend(name: str, base_url: str, **kwargs) -> Backend:
+    return Backend(name, base_url, model="stub", timeout=5.0, **kwargs)
+
+
+class TestBackend:
+    def test_circuit_breaker(self):
+        """Проверяем открытие breaker и пробный запрос после cooldown"""
+        backend = make_backend("a", "http://127.0.0.1:1/v1", failure_threshold=2, cooldown=10)
+
+        backend.record_failure()
+        assert backend.available()
+        backend.record_failure()
+        assert not backend.available()
+        assert backend.available(now=backend.opened_at + 10)
+
+        backend.record_success(0.1)
+        assert backend.available()
+        assert backend.opened_at is None and backend.consecutive_failures == 0
+
+    def test_error_rate(self):
+        """Проверяем долю ошибок за окно и метрику"""
+        backend = make_backend("rate", "http://127.0.0.1:1/v1", failure_threshold=100, window=10)
+        backend.record_failure()
+        assert backend.error_rate() is None
+        for _ in range(9):
+            backend.record_success(0.1)
+        assert backend.error_rate() == pytest.approx(0.1)
+
+        for _ in range(5):
+            backend.record_failure()
+        assert backend.error_rate() == pytest.approx(0.5)
+        assert BACKEND_ERROR_RATE.get(backend="rate") == pytest.approx(0.5)
+
+    def test_p95(self):
+        """Проверяем p95 только при достаточной статистике"""
+        backend = make_backend("a", "http://127.0.0.1:1/v1")
+        assert backend.p95() is None
+        for latency in range(1, 101):
+            backend.record_success(latency / 100)
+        assert backend.p95() == pytest.approx(0.9505)
+
+
+class TestLLMRouter:
+    @pytest.mark.asyncio
+    async def test_primary_answers(self, stubs):
+        """Проверяем ответ основного backend без дублирования"""
+        primary, primary_url = await stubs()
+        secondary, secondary_url = await stubs()
+        router = LLMRouter([make_backend("a", primary_url), make_backend("b", secondary_url)], hedge_delay=1.0)
+
+        answer = await router.create(messages=MESSAGES)
+
+        assert json.loads(answer.choices[0].message.content)["urls"] == [{"1": "https://a.com"}]
+        assert (primary.requests, secondary.requests) == (1, 0)
+
+    @pytest.mark.asyncio
+    async def test_hedged_request(self, stubs):
+        """Проверяем дублирование медленного запроса и отмену проигравшего"""
+        primary, primary_url = await stubs(latency=2.0)
+        secondary, secondary_url = await stubs()
+        router = LLMRouter([make_backend("a", primary_url), make_backend("b", secondary_url)], hedge_delay=0.1)
+
+        start = time.perf_counter()
+        answer = await router.create(messages=MESSAGES)
+
+        assert time.perf_counter() - start < 1.0
+        assert answer.choices[0].message.content
+        assert (primary.requests, secondary.requests) == (1, 1)
+        # Запрос к медленному backend отменен и не попал в его статистику
+        assert not router.backends[0].latencies
+        assert not router.backends[0].outcomes
+
+    @pytest.mark.asyncio
+    async def test_fallback_and_breaker(self, stubs):
+        """Проверяем переход на резервный backend и отключение сбойного"""
+        failing, failing_url = await stubs(error_rate=1.0)
+        healthy, healthy_url = await stubs()
+        router = LLMRouter([
+            make_backend("a", failing_url, failure_threshold=2),
+            make_backend("b", healthy_url)
+        ], hedge_delay=5.0)
+
+        for _ in range(3):
+            answer = await router.create(messages=MESSAGES)
+            assert answer.choices[0].message.content
+
+        assert failing.requests == 2
+        assert healthy.requests == 3
+        assert not router.backends[0].available()
+
+    def test_unhealthy_backend_demoted(self):
+        """Проверяем, что backend с высокой долей ошибок уходит в конец очереди, но остается запасным"""
+        primary = make_backend("a", "http://127.0.0.1:1/v1", failure_threshold=100)
+        secondary = make_backend("b", "http://127.0.0.1:2/v1")
+        router = LLMRouter([primary, secondary], max_error_rate=0.5)
+        for _ in range(6):
+            primary.record_failure()
+            primary.record_success(0.1)
+        assert router.candidates() == [primary, secondary]
+
+        primary.record_failure()
+        primary.record_failure()
+        assert primary.available()
+        assert router.candidates() == [secondary, primary]
+
+    @pytest.mark.asyncio
+    async def test_single_probe_when_half_open(self, stubs):
+        """Проверяем, что после cooldown параллельные запросы шлют один пробный запрос"""
+        slow, slow_url = await stubs(latency=0.3)
+        healthy, healthy_url = await stubs()
+        router = LLMRouter([
+            make_backend("a", slow_url, failure_threshold=1, cooldown=10),
+            make_backend("b", healthy_url)
+        ], hedge_delay=5.0)
+        router.backends[0].record_failure()
+        router.backends[0].opened_at -= 10
+
+        answers = await asyncio.gather(*(router.create(messages=MESSAGES) for _ in range(3)))
+
+        assert all(answer.choices[0].message.content for answer in answers)
+        assert (slow.requests, healthy.requests) == (1, 2)
+        assert router.backends[0].available() and not router.backends[0].probing
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_released(self, stubs):
+        """Проверяем, что отмененный пробный запрос не блокирует backend навсегда"""
+        slow, slow_url = await stubs(latency=1.0)
+        router = LLMRouter([make_backend("a", slow_url, failure_threshold=1, cooldown=10)])
+        router.backends[0].record_failure()
+        router.backends[0].opened_at -= 10
+
+        task = asyncio.create_task(router.create(messages=MESSAGES))
+        await asyncio.sleep(0.1)
+        assert router.backends[0].probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert router.backends[0].available()
+
+    @pytest.mark.asyncio
+    async def test_all_backends_fail(self, stubs):
+        """Проверяем ошибку, когда не ответил ни один backend"""
+        _, url = await stubs(error_rate=1.0)
+        router = LLMRouter([make_backend("a", url, failure_threshold=1)])
+
+        with pytest.raises(Exception):
+            await router.create(messages=MESSAGES)
+        with pytest.raises(NoBackendAvailable):
+            await router.create(messages=MESSAGES)
+
+
+class TestCreateRouter:
+    def test_without_backends(self):
+        """Проверяем работу с одним клиентом без LLM_BACKENDS"""
+        with patch('src.router.config.llm_backends', None):
+            assert create_router() is None
+
+    def test_from_config(self):
+        """Проверяем создание роутера из LLM_BACKENDS"""
+        backends = json.dumps([
+            {"name": "deepseek", "base_url": "http://127.0.0.1:1/v1"},
+            {"base_url": "http://127.0.0.1:2/v1", "model": "gpt-4o-mini"}
+        ])
+        with patch('src.router.config.llm_backends', backends):
+            router = create_router()
+
+        assert [backend.name for backend in router.backends] == ["deepseek", "http://127.0.0.1:2/v1"]
+        assert router.backends[1].model == "gpt-4o-mini"
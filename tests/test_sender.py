@@ -0,0 +1,151 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from src.sender import Sender, html_to_text, repair_html, split_html
+
+
+def is_balanced(text: str) -> bool:
+    return repair_html(text) == text
+
+
+class TestRepairHtml:
+    def test_valid_html_unchanged(self):
+        """Проверяем, что корректный HTML Telegram не меняется"""
+        text = 'Мы делали <b>бота</b> для <a href="https://eora.ru/cases/1">Магнита</a> &amp; X5'
+        assert repair_html(text) == text
+
+    def test_repairs_llm_output(self):
+        """Проверяем починку типичных ошибок: незакрытые теги, лишние символы, неизвестные теги"""
+        assert repair_html("<b>жирный <i>курсив</b> хвост") == "<b>жирный <i>курсив</i></b> хвост"
+        assert repair_html("5 < 6 & 7 > 3") == "5 &lt; 6 &amp; 7 &gt; 3"
+        assert repair_html("строка<br>строка<br/>") == "строка\nстрока\n"
+        assert repair_html("<p>абзац</p><script>x</script>") == "абзацx"
+        assert repair_html("</i>лишний") == "лишний"
+        assert repair_html("<a>без ссылки</a>") == "без ссылки"
+        assert repair_html("<a href='https://x.ru/?a=1&b=2' target=_blank>x</a>") == \
+            '<a href="https://x.ru/?a=1&amp;b=2">x</a>'
+
+    def test_html_to_text(self):
+        """Проверяем текстовую версию для fallback"""
+        assert html_to_text("<b>a</b> &amp; <i>b</i>") == "a & b"
+
+
+class TestSplitHtml:
+    def test_short_message_not_split(self):
+        """Проверяем, что короткий ответ уходит одним сообщением"""
+        assert split_html("<b>коротко</b>") == ["<b>коротко</b>"]
+
+    def test_split_keeps_tags_balanced(self):
+        """Проверяем, что каждая часть в пределах лимита и теги в ней закрыты"""
+        text = repair_html(
+            '<b>' + "слово " * 300 + '</b>\n\n<a href="https://eora.ru">' + "ссылка " * 200 + "</a>"
+        )
+
+        chunks = split_html(text, limit=500)
+
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 500 for chunk in chunks)
+        assert all(is_balanced(chunk) for chunk in chunks)
+        assert "".join(html_to_text(chunk) for chunk in chunks).split() == html_to_text(text).split()
+
+    def test_prefers_line_breaks(self):
+        """Проверяем разрез по переносу строки, а не посреди абзаца"""
+        text = "а" * 60 + "\n" + "б " * 30
+
+        chunks = split_html(text, limit=100)
+
+        assert chunks[0] == "а" * 60 + "\n"
+
+    def test_hard_split_long_word_and_entity(self):
+        """Проверяем, что слово длиннее лимита режется, не разрывая сущности"""
+        text = "x" * 95 + "&amp;" + "y" * 50
+
+        chunks = split_html(text, limit=98)
+
+        assert all(len(chunk) <= 98 for chunk in chunks)
+        assert all("&amp;" in chunk or "&" not in chunk for chunk in chunks)
+        assert "".join(chunks) == text
+
+
+class TestSender:
+    @pytest.mark.asyncio
+    async def test_retry_after_honoured(self):
+        """Проверяем ожидание retry_after и повтор того же сообщения"""
+        message = MagicMock()
+        message.chat.id = 1
+        message.answer = AsyncMock(side_effect=[
+            TelegramRetryAfter(method=MagicMock(), message="Too Many Requests", retry_after=3),
+            "sent"
+        ])
+
+        with patch("src.sender.asyncio.sleep", new=AsyncMock()) as mock_sleep:
+            result = await Sender().send(message, "ответ")
+
+        assert result == ["sent"]
+        mock_sleep.assert_awaited_once_with(3)
+        assert message.answer.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_retries(self):
+        """Проверяем, что бесконечный flood control не держит обработчик вечно"""
+        message = MagicMock()
+        message.chat.id = 1
+        message.answer = AsyncMock(side_effect=TelegramRetryAfter(
+            method=MagicMock(), message="Too Many Requests", retry_after=1
+        ))
+
+        with patch("src.sender.asyncio.sleep", new=AsyncMock()):
+            with pytest.raises(TelegramRetryAfter):
+                await Sender(max_retries=2).send(message, "ответ")
+        assert message.answer.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_plain_fallback_on_parse_error(self):
+        """Проверяем повтор текстом, если Telegram не разобрал HTML"""
+        message = MagicMock()
+        message.chat.id = 1
+        message.answer = AsyncMock(side_effect=[
+            TelegramBadRequest(method=MagicMock(), message="Bad Request: can't parse entities: unexpected end tag"),
+            "sent"
+        ])
+
+        result = await Sender().send(message, "<b>ответ</b>")
+
+        assert result == ["sent"]
+        assert message.answer.await_args_list[1].args == ("ответ",)
+        assert message.answer.await_args_list[1].kwargs == {}
+
+    @pytest.mark.asyncio
+    async def test_other_bad_request_not_retried(self):
+        """Проверяем, что ошибки не про разметку не отправляются повторно текстом"""
+        message = MagicMock()
+        message.chat.id = 1
+        message.answer = AsyncMock(side_effect=TelegramBadRequest(
+            method=MagicMock(), message="Bad Request: chat not found"
+        ))
+
+        with pytest.raises(TelegramBadRequest):
+            await Sender().send(message, "<b>ответ</b>")
+        assert message.answer.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_per_chat_order(self):
+        """Проверяем, что части двух ответов одного чата не перемешиваются"""
+        sent: list[str] = []
+
+        async def answer(text, parse_mode=None):
+            await asyncio.sleep(0.001)
+            sent.append(text)
+
+        message = MagicMock()
+        message.chat.id = 1
+        message.answer = answer
+        sender = Sender()
+
+        with patch("src.sender.split_html", side_effect=lambda text: [f"{text}1", f"{text}2"]):
+            await asyncio.gather(sender.send(message, "a"), sender.send(message, "b"))
+
+        assert sent == ["a1", "a2", "b1", "b2"]
+        assert not sender._locks